@@ -9,7 +9,7 @@ from flask_login import current_user
 from sqlalchemy.orm import joinedload
 
 from app.admin.base import BaseAdminView
-from app.db import Session
+from app.db import Session, read_replica
 from app.errors import ProtonPartnerNotSetUp
 from app.log import LOG
 from app.models import (
@@ -255,7 +255,8 @@ class EmailSearchResult:
         """Search for users, mailboxes, and partner users using POSIX regex.
 
         Always performs regex search on user email, mailbox email, and partner_email only.
-        Returns up to 10 results per table.
+        Returns up to 10 results per table. The ~ operator is served by the pg_trgm index
+        of each of these columns.
         """
         output = EmailSearchResult()
         output.query = query
@@ -674,6 +675,7 @@ class EmailSearchHelpers:
 
 class EmailSearchAdmin(BaseAdminView):
     @expose("/", methods=["GET", "POST"])
+    @read_replica()
     def index(self):
         search = EmailSearchResult()
         query = request.args.get("query")
@@ -1,6 +1,11 @@
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
 
+import arrow
+from sqlalchemy import literal, select
+
+from app.audit_log_buffer import add_audit_log, flush_audit_logs
+from app.db import Session
 from app.models import Alias, AliasAuditLog
 
 
@@ -30,11 +35,36 @@ def emit_alias_audit_log(
     user_id: Optional[int] = None,
     commit: bool = False,
 ):
-    AliasAuditLog.create(
+    add_audit_log(
+        AliasAuditLog,
         user_id=user_id or alias.user_id,
         alias_id=alias.id,
         alias_email=alias.email,
         action=action.value,
         message=message,
-        commit=commit,
+    )
+    if commit:
+        Session.commit()
+
+
+def emit_bulk_alias_audit_log(
+    alias_ids: List[int], action: AliasAuditLogAction, message: str
+):
+    """Emit the same audit log for all the given aliases with a single INSERT ... SELECT"""
+    # keep the logs in the order they have been emitted
+    flush_audit_logs()
+    Session.execute(
+        AliasAuditLog.__table__.insert().from_select(
+            ["created_at", "user_id", "alias_id", "alias_email", "action", "message"],
+            select(
+                [
+                    literal(arrow.utcnow().naive),
+                    Alias.user_id,
+                    Alias.id,
+                    Alias.email,
+                    literal(action.value),
+                    literal(message),
+                ]
+            ).where(Alias.id.in_(alias_ids)),
+        )
     )
@@ -1,14 +1,24 @@
+from collections import defaultdict
+from typing import Optional
+
 import arrow
 import newrelic.agent
+from sqlalchemy import and_, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
 
 from app import config, rate_limiter
-from app.alias_audit_log_utils import emit_alias_audit_log, AliasAuditLogAction
+from app.alias_audit_log_utils import (
+    emit_alias_audit_log,
+    emit_bulk_alias_audit_log,
+    AliasAuditLogAction,
+)
 from app.config import ALIAS_TRASH_DAYS
 from app.db import Session
 from app.errors import CannotCreateAliasQuotaExceeded
 from app.events.event_dispatcher import EventDispatcher
 from app.events.generated.event_pb2 import EventContent, AliasDeleted, AliasCreated
 from app.log import LOG
+from app.metrics import COUNTER, record_custom_metric
 from app.models import (
     Alias,
     User,
@@ -18,6 +28,8 @@ from app.models import (
     UserAliasDeleteAction,
 )
 
+BULK_DELETE_BATCH_SIZE = 500
+
 
 def __delete_alias(alias: Alias, user: User, commit: bool):
     alias_id = alias.id
@@ -138,6 +150,161 @@ def move_alias_to_trash(
         Session.commit()
 
 
+def __alias_chunks(alias_filter, batch_size: int):
+    """Yield the aliases matching alias_filter by chunks of batch_size, in id order"""
+    last_id = 0
+    while True:
+        rows = (
+            Session.query(
+                Alias.id,
+                Alias.email,
+                Alias.user_id,
+                Alias.custom_domain_id,
+                Alias.delete_reason,
+            )
+            .filter(alias_filter, Alias.id > last_id)
+            .order_by(Alias.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def __end_batch(commit: bool):
+    if commit:
+        Session.commit()
+    else:
+        Session.flush()
+
+
+def __send_bulk_alias_deleted_events(rows):
+    aliases_by_user = defaultdict(list)
+    for row in rows:
+        aliases_by_user[row.user_id].append(row)
+
+    for user in User.filter(User.id.in_(aliases_by_user.keys())):
+        EventDispatcher.send_events(
+            user,
+            [
+                EventContent(alias_deleted=AliasDeleted(id=row.id, email=row.email))
+                for row in aliases_by_user[user.id]
+            ],
+        )
+
+
+def __bulk_delete_chunk(rows, reason: AliasDeleteReason):
+    alias_ids = [row.id for row in rows]
+    now = arrow.utcnow().naive
+    # same as perform_alias_deletion: keep the reason the alias has been trashed for
+    delete_reason = func.coalesce(Alias.delete_reason, literal(reason.value))
+    in_chunk = Alias.id.in_(alias_ids)
+
+    Session.execute(
+        insert(DomainDeletedAlias.__table__)
+        .from_select(
+            ["created_at", "user_id", "email", "domain_id", "reason", "alias_id"],
+            select(
+                [
+                    literal(now),
+                    Alias.user_id,
+                    Alias.email,
+                    Alias.custom_domain_id,
+                    delete_reason,
+                    Alias.id,
+                ]
+            ).where(and_(in_chunk, Alias.custom_domain_id.isnot(None))),
+        )
+        .on_conflict_do_nothing(constraint="uq_domain_trash")
+    )
+    Session.execute(
+        insert(DeletedAlias.__table__)
+        .from_select(
+            ["created_at", "email", "reason", "alias_id"],
+            select([literal(now), Alias.email, delete_reason, Alias.id]).where(
+                and_(in_chunk, Alias.custom_domain_id.is_(None))
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["email"])
+    )
+    emit_bulk_alias_audit_log(
+        alias_ids, AliasAuditLogAction.DeleteAlias, "Alias deleted by user action"
+    )
+    Alias.filter(in_chunk).delete(synchronize_session=False)
+    __send_bulk_alias_deleted_events(rows)
+
+
+def bulk_perform_alias_deletion(
+    alias_filter,
+    reason: AliasDeleteReason = AliasDeleteReason.Unspecified,
+    batch_size: int = BULK_DELETE_BATCH_SIZE,
+    commit: bool = True,
+) -> int:
+    """
+    Set based equivalent of perform_alias_deletion for all the aliases matching alias_filter.
+    Aliases are moved to the global or domain trash with INSERT ... SELECT, and the audit logs,
+    events and deletion are done for batch_size aliases at once, committing after each batch.
+    With commit=False nothing is committed: all the batches stay in the caller's transaction.
+    Return the number of deleted aliases
+    """
+    count = 0
+    for rows in __alias_chunks(alias_filter, batch_size):
+        __bulk_delete_chunk(rows, reason)
+        __end_batch(commit)
+        count += len(rows)
+        LOG.i(f"Deleted {count} aliases")
+    return count
+
+
+def bulk_move_aliases_to_trash(
+    alias_filter,
+    reason: AliasDeleteReason = AliasDeleteReason.Unspecified,
+    mailbox_id: Optional[int] = None,
+    batch_size: int = BULK_DELETE_BATCH_SIZE,
+    commit: bool = True,
+) -> int:
+    """
+    Set based equivalent of move_alias_to_trash for all the aliases matching alias_filter,
+    committing after each batch unless commit=False. Custom domain aliases are deleted to the
+    domain trash.
+    If mailbox_id is set, the trashed aliases are also moved to this mailbox.
+    Return the number of processed aliases
+    """
+    count = 0
+    delete_on = arrow.now().shift(days=+ALIAS_TRASH_DAYS)
+    for rows in __alias_chunks(alias_filter, batch_size):
+        custom_domain_rows = [row for row in rows if row.custom_domain_id]
+        if custom_domain_rows:
+            __bulk_delete_chunk(custom_domain_rows, reason)
+
+        trashed_rows = [row for row in rows if not row.custom_domain_id]
+        if trashed_rows:
+            alias_ids = [row.id for row in trashed_rows]
+            values = {
+                Alias.delete_on: delete_on,
+                Alias.delete_reason: reason,
+                Alias.enabled: False,
+            }
+            if mailbox_id:
+                values[Alias.mailbox_id] = mailbox_id
+            Alias.filter(Alias.id.in_(alias_ids)).update(
+                values, synchronize_session=False
+            )
+            emit_bulk_alias_audit_log(
+                alias_ids,
+                AliasAuditLogAction.TrashAlias,
+                "Alias moved to trash by user action",
+            )
+            __send_bulk_alias_deleted_events(trashed_rows)
+
+        __end_batch(commit)
+        count += len(rows)
+        LOG.i(f"Moved {count} aliases to trash")
+    return count
+
+
 def __perform_alias_restore(user: User, alias: Alias) -> None:
     LOG.i(f"User {user} is restoring {alias}")
     if alias.delete_on is None:
@@ -185,7 +352,7 @@ def restore_alias(user: User, alias_id: int) -> None | Alias:
     check_user_can_restore_num_aliases(user, 1)
     __perform_alias_restore(user, alias)
     newrelic.agent.record_custom_event("RestoreAlias", {"mode": "single"})
-    newrelic.agent.record_custom_metric("AliasRestored", 1)
+    record_custom_metric("AliasRestored", 1, kind=COUNTER)
     return alias
 
 
@@ -207,7 +374,7 @@ def restore_all_alias(user: User) -> int:
         __perform_alias_restore(user, alias)
         count += 1
     newrelic.agent.record_custom_event("RestoreAlias", {"mode": "bulk"})
-    newrelic.agent.record_custom_metric("AliasRestored", count)
+    record_custom_metric("AliasRestored", count, kind=COUNTER)
     LOG.i(f"Untrashed {count} alias by user {user}")
     return count
 
@@ -0,0 +1,64 @@
+"""
+Per user cache of the domains offered when creating an alias,
+see alias_suffix.get_cached_alias_suffixes()
+
+The entries are kept in the process and invalidated by the cache_versions stamps, bumped when
+the user, their custom domains, subscriptions or partner users, or the SL domains change.
+Nothing is cached without Redis, see cache_versions.
+
+The premium status also changes with time (trial or subscription end) so the entries
+expire after ALIAS_OPTIONS_CACHE_TTL seconds. A stale entry can't be used to create an
+alias on a domain the user doesn't have access to anymore as the suffix is verified again
+on creation.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, TypeVar
+
+from app import cache_versions, config
+from app.metrics import COUNTER, record_custom_metric
+from app.models import User
+
+T = TypeVar("T")
+
+_MAX_ENTRIES = 10000
+
+# user id -> (version stamps, expiration timestamp, value)
+_entries: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_or_compute(user_id: int, compute: Callable[[], T], expires_at: float) -> T:
+    """Return the cached value of user_id, or compute and cache it until expires_at"""
+    if not cache_versions.is_enabled():
+        return compute()
+
+    versions = cache_versions.get_versions(user_id)
+    if versions is None:
+        return compute()
+
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry and entry[0] == versions and entry[1] > time.time():
+            _entries.move_to_end(user_id)
+            record_custom_metric("Custom/alias_options_cache_hit", 1, kind=COUNTER)
+            return entry[2]
+
+    record_custom_metric("Custom/alias_options_cache_miss", 1, kind=COUNTER)
+    # a change committed in the meantime bumps the versions read above, so this value
+    # won't be used once it's stale
+    value = compute()
+    with _lock:
+        _entries[user_id] = (versions, expires_at, value)
+        _entries.move_to_end(user_id)
+        while len(_entries) > _MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return value
+
+
+def default_expiration(user: User) -> float:
+    expires_at = time.time() + config.ALIAS_OPTIONS_CACHE_TTL
+    if user.trial_end and user.trial_end.timestamp > time.time():
+        expires_at = min(expires_at, user.trial_end.timestamp)
+    return expires_at
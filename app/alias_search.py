@@ -0,0 +1,54 @@
+from enum import Enum
+
+from sqlalchemy import or_, func
+
+from app.models import Alias
+
+# pg_trgm can't use its index for patterns shorter than a trigram
+TRIGRAM_MIN_LENGTH = 3
+
+
+class AliasSearchStrategy(Enum):
+    # short query: substring match with strpos(), which the pg_trgm indexes can't serve, on
+    # the aliases of the user found by the user_id index
+    Short = "short"
+    # substring match with ILIKE, served by the pg_trgm indexes
+    Trigram = "trigram"
+
+
+def get_search_strategy(query: str) -> AliasSearchStrategy:
+    query = query.strip()
+    if len(query) < TRIGRAM_MIN_LENGTH:
+        return AliasSearchStrategy.Short
+    return AliasSearchStrategy.Trigram
+
+
+def escape_like(query: str) -> str:
+    """escape LIKE wildcards so the user input is matched literally"""
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def alias_search_filter(query: str):
+    """return the filter to apply on an Alias query for a search typed by the user: substring
+    match on email, note and name, or full text match on the note. The strategy only changes
+    the operators, not the matched aliases"""
+    query = query.strip()
+    # can't use match() here as it uses to_tsquery that expected a tsquery input
+    full_text = Alias.ts_vector.op("@@")(func.plainto_tsquery("english", query))
+
+    if get_search_strategy(query) == AliasSearchStrategy.Short:
+        lowered = query.lower()
+        return or_(
+            func.strpos(func.lower(Alias.email), lowered) > 0,
+            func.strpos(func.lower(Alias.note), lowered) > 0,
+            full_text,
+            func.strpos(func.lower(Alias.name), lowered) > 0,
+        )
+
+    escaped = escape_like(query)
+    return or_(
+        Alias.email.ilike(f"%{escaped}%", escape="\\"),
+        Alias.note.ilike(f"%{escaped}%", escape="\\"),
+        full_text,
+        Alias.name.ilike(f"%{escaped}%", escape="\\"),
+    )
@@ -4,7 +4,7 @@ from dataclasses import asdict, dataclass
 from typing import Optional
 
 import itsdangerous
-from app import config
+from app import alias_options_cache, config
 from app.log import LOG
 from app.models import User, AliasOptions, SLDomain
 
@@ -91,44 +91,62 @@ def verify_prefix_suffix(
     return True
 
 
-def get_alias_suffixes(
+@dataclass
+class _SuffixTemplate:
+    """An AliasSuffix without its random part and its signature"""
+
+    is_custom: bool
+    domain: str
+    is_premium: bool
+    mx_verified: bool
+    # whether the suffix starts with a random part
+    random_prefix: bool
+
+
+def _make_suffix(user: User, template: _SuffixTemplate) -> AliasSuffix:
+    prefix = ""
+    if template.random_prefix:
+        prefix = f".{user.get_random_alias_suffix(is_custom_domain=template.is_custom)}"
+    suffix = f"{prefix}@{template.domain}"
+    return AliasSuffix(
+        is_custom=template.is_custom,
+        suffix=suffix,
+        signed_suffix=signer.sign(suffix).decode(),
+        is_premium=template.is_premium,
+        domain=template.domain,
+        mx_verified=template.mx_verified,
+    )
+
+
+def _get_suffix_templates(
     user: User, alias_options: Optional[AliasOptions] = None
-) -> [AliasSuffix]:
-    """
-    Similar to as get_available_suffixes() but also return custom domain that doesn't have MX set up.
-    """
+) -> [_SuffixTemplate]:
     user_custom_domains = user.verified_custom_domains()
 
-    alias_suffixes: [AliasSuffix] = []
+    templates: [_SuffixTemplate] = []
 
     # put custom domain first
     # for each user domain, generate both the domain and a random suffix version
     for custom_domain in user_custom_domains:
         if custom_domain.random_prefix_generation:
-            suffix = (
-                f".{user.get_random_alias_suffix(custom_domain)}@{custom_domain.domain}"
-            )
-            alias_suffix = AliasSuffix(
+            template = _SuffixTemplate(
                 is_custom=True,
-                suffix=suffix,
-                signed_suffix=signer.sign(suffix).decode(),
-                is_premium=False,
                 domain=custom_domain.domain,
+                is_premium=False,
                 mx_verified=custom_domain.verified,
+                random_prefix=True,
             )
             if user.default_alias_custom_domain_id == custom_domain.id:
-                alias_suffixes.insert(0, alias_suffix)
+                templates.insert(0, template)
             else:
-                alias_suffixes.append(alias_suffix)
+                templates.append(template)
 
-        suffix = f"@{custom_domain.domain}"
-        alias_suffix = AliasSuffix(
+        template = _SuffixTemplate(
             is_custom=True,
-            suffix=suffix,
-            signed_suffix=signer.sign(suffix).decode(),
-            is_premium=False,
             domain=custom_domain.domain,
+            is_premium=False,
             mx_verified=custom_domain.verified,
+            random_prefix=False,
         )
 
         # put the default domain to top
@@ -137,35 +155,30 @@ def get_alias_suffixes(
             user.default_alias_custom_domain_id == custom_domain.id
             and not custom_domain.random_prefix_generation
         ):
-            alias_suffixes.insert(0, alias_suffix)
+            templates.insert(0, template)
         else:
-            alias_suffixes.append(alias_suffix)
+            templates.append(template)
 
     # then SimpleLogin domain
     sl_domains = user.get_sl_domains(alias_options=alias_options)
     default_domain_found = False
     for sl_domain in sl_domains:
-        prefix = (
-            "" if config.DISABLE_ALIAS_SUFFIX else f".{user.get_random_alias_suffix()}"
-        )
-        suffix = f"{prefix}@{sl_domain.domain}"
-        alias_suffix = AliasSuffix(
+        template = _SuffixTemplate(
             is_custom=False,
-            suffix=suffix,
-            signed_suffix=signer.sign(suffix).decode(),
-            is_premium=sl_domain.premium_only,
             domain=sl_domain.domain,
+            is_premium=sl_domain.premium_only,
             mx_verified=True,
+            random_prefix=not config.DISABLE_ALIAS_SUFFIX,
         )
         # No default or this is not the default
         if (
             user.default_alias_public_domain_id is None
             or user.default_alias_public_domain_id != sl_domain.id
         ):
-            alias_suffixes.append(alias_suffix)
+            templates.append(template)
         else:
             default_domain_found = True
-            alias_suffixes.insert(0, alias_suffix)
+            templates.insert(0, template)
 
     if not default_domain_found:
         domain_conditions = {"id": user.default_alias_public_domain_id, "hidden": False}
@@ -173,20 +186,36 @@ def get_alias_suffixes(
             domain_conditions["premium_only"] = False
         sl_domain = SLDomain.get_by(**domain_conditions)
         if sl_domain:
-            prefix = (
-                ""
-                if config.DISABLE_ALIAS_SUFFIX
-                else f".{user.get_random_alias_suffix()}"
-            )
-            suffix = f"{prefix}@{sl_domain.domain}"
-            alias_suffix = AliasSuffix(
+            template = _SuffixTemplate(
                 is_custom=False,
-                suffix=suffix,
-                signed_suffix=signer.sign(suffix).decode(),
-                is_premium=sl_domain.premium_only,
                 domain=sl_domain.domain,
+                is_premium=sl_domain.premium_only,
                 mx_verified=True,
+                random_prefix=not config.DISABLE_ALIAS_SUFFIX,
             )
-            alias_suffixes.insert(0, alias_suffix)
+            templates.insert(0, template)
+
+    return templates
+
+
+def get_alias_suffixes(
+    user: User, alias_options: Optional[AliasOptions] = None
+) -> [AliasSuffix]:
+    """
+    Similar to as get_available_suffixes() but also return custom domain that doesn't have MX set up.
+    """
+    return [
+        _make_suffix(user, template)
+        for template in _get_suffix_templates(user, alias_options)
+    ]
+
 
-    return alias_suffixes
+def get_cached_alias_suffixes(user: User) -> [AliasSuffix]:
+    """Same as get_alias_suffixes() with the default alias options. The domains are
+    cached, only the random part and the signature of the suffixes are made on each call"""
+    templates = alias_options_cache.get_or_compute(
+        user.id,
+        lambda: _get_suffix_templates(user),
+        alias_options_cache.default_expiration(user),
+    )
+    return [_make_suffix(user, template) for template in templates]
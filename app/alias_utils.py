@@ -2,10 +2,13 @@ import csv
 import re
 from dataclasses import dataclass
 from io import StringIO
-from typing import Optional, Tuple
+from typing import Iterator, Optional, Tuple
 
 from email_validator import validate_email, EmailNotValidError
-from flask import make_response
+from flask import Response, stream_with_context
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import aliased
 from sqlalchemy.exc import IntegrityError, DataError
 
 from app.alias_audit_log_utils import AliasAuditLogAction, emit_alias_audit_log
@@ -391,34 +394,93 @@ def check_alias_prefix(alias_prefix) -> bool:
     return True
 
 
-def alias_export_csv(user, csv_direct_export=False):
-    """
-    Get user aliases as importable CSV file
-    Output:
-        Importable CSV file
+def _alias_export_rows(user, batch_size: int) -> Iterator[list]:
+    """Yield the CSV rows of the user aliases, fetching batch_size aliases per query"""
+    # verified mailboxes other than the main one sorted by email, as in Alias.mailboxes,
+    # aggregated in the same query
+    other_mailbox = aliased(Mailbox)
+    other_mailboxes = (
+        select(
+            [
+                func.array_agg(
+                    aggregate_order_by(other_mailbox.email, other_mailbox.email)
+                )
+            ]
+        )
+        .select_from(
+            AliasMailbox.__table__.join(
+                other_mailbox, other_mailbox.id == AliasMailbox.mailbox_id
+            )
+        )
+        .where(
+            and_(
+                AliasMailbox.alias_id == Alias.id,
+                AliasMailbox.mailbox_id != Alias.mailbox_id,
+                other_mailbox.verified.is_(True),
+            )
+        )
+        .as_scalar()
+    )
 
-    """
-    data = [["alias", "note", "enabled", "mailboxes"]]
-    for alias in Alias.filter_by(user_id=user.id, delete_on=None).all():  # type: Alias
-        # Always put the main mailbox first
-        # It is seen a primary while importing
-        alias_mailboxes = alias.mailboxes
-        alias_mailboxes.insert(
-            0, alias_mailboxes.pop(alias_mailboxes.index(alias.mailbox))
+    last_id = 0
+    while True:
+        rows = (
+            Session.query(
+                Alias.id,
+                Alias.email,
+                Alias.note,
+                Alias.enabled,
+                Mailbox.email,
+                other_mailboxes,
+            )
+            .join(Mailbox, Mailbox.id == Alias.mailbox_id)
+            .filter(
+                Alias.user_id == user.id,
+                Alias.delete_on.is_(None),
+                Alias.id > last_id,
+            )
+            .order_by(Alias.id)
+            .limit(batch_size)
+            .all()
         )
+        for alias_id, email, note, enabled, main_mailbox, other_mailbox_emails in rows:
+            # Always put the main mailbox first
+            # It is seen a primary while importing
+            mailboxes = " ".join([main_mailbox] + (other_mailbox_emails or []))
+            yield [email, note, enabled, mailboxes]
+
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
 
-        mailboxes = " ".join([mailbox.email for mailbox in alias_mailboxes])
-        data.append([alias.email, alias.note, alias.enabled, mailboxes])
 
+def _alias_export_csv_chunks(user, batch_size: int) -> Iterator[str]:
     si = StringIO()
     cw = csv.writer(si)
-    cw.writerows(data)
+    cw.writerow(["alias", "note", "enabled", "mailboxes"])
+    for i, row in enumerate(_alias_export_rows(user, batch_size), start=1):
+        cw.writerow(row)
+        if i % batch_size == 0:
+            yield si.getvalue()
+            si.seek(0)
+            si.truncate()
+    yield si.getvalue()
+
+
+def alias_export_csv(user, csv_direct_export=False, batch_size=1000):
+    """
+    Get user aliases as importable CSV file
+    Output:
+        Importable CSV file, streamed batch_size aliases at a time
+
+    """
     if csv_direct_export:
-        return si.getvalue()
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=aliases.csv"
-    output.headers["Content-type"] = "text/csv"
-    return output
+        return "".join(_alias_export_csv_chunks(user, batch_size))
+    return Response(
+        stream_with_context(_alias_export_csv_chunks(user, batch_size)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=aliases.csv"},
+    )
 
 
 def transfer_alias(alias: Alias, new_user: User, new_mailboxes: [Mailbox]):
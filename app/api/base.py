@@ -5,8 +5,10 @@ from typing import Tuple, Optional
 import arrow
 from flask import Blueprint, request, jsonify, g, session
 from flask_login import current_user
+from sqlalchemy.orm import joinedload
 
 from app import constants
+from app.api_key_usage import record_api_key_usage
 from app.db import Session
 from app.models import ApiKey
 
@@ -17,7 +19,7 @@ SUDO_MODE_MINUTES_VALID = 5
 
 def authorize_request() -> Optional[Tuple[str, int]]:
     api_code = request.headers.get("Authentication")
-    api_key = ApiKey.get_by(code=api_code)
+    api_key = ApiKey.filter_by(code=api_code).options(joinedload(ApiKey.user)).first()
 
     if not api_key:
         if current_user.is_authenticated:
@@ -28,10 +30,14 @@ def authorize_request() -> Optional[Tuple[str, int]]:
         else:
             return jsonify(error="Wrong api key"), 401
     else:
-        # Update api key stats
-        api_key.last_used = arrow.now()
-        api_key.times += 1
-        Session.commit()
+        # Update api key stats. Only the first use is written right away as unused keys are
+        # the first ones to be cleaned up, the following ones are aggregated
+        if api_key.last_used is None:
+            api_key.last_used = arrow.now()
+            api_key.times += 1
+            Session.commit()
+        else:
+            record_api_key_usage(api_key.id)
 
         g.user = api_key.user
 
@@ -1,12 +1,16 @@
+import base64
+import json
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, List, Tuple
 
+import arrow
 from arrow import Arrow
-from sqlalchemy import or_, func, case, and_
+from sqlalchemy import or_, func, case, and_, tuple_
 from sqlalchemy.orm import joinedload
 
+from app.alias_search import alias_search_filter
 from app.config import PAGE_LIMIT
-from app.db import Session
+from app.db import Session, read_replica
 from app.models import (
     Alias,
     Contact,
@@ -125,9 +129,7 @@ def get_alias_infos_with_pagination(user, page_id=0, query=None) -> [AliasInfo]:
     )
 
     if query:
-        q = q.filter(
-            or_(Alias.email.ilike(f"%{query}%"), Alias.note.ilike(f"%{query}%"))
-        )
+        q = q.filter(alias_search_filter(query))
 
     q = q.limit(PAGE_LIMIT).offset(page_id * PAGE_LIMIT)
 
@@ -137,30 +139,11 @@ def get_alias_infos_with_pagination(user, page_id=0, query=None) -> [AliasInfo]:
     return ret
 
 
-def get_alias_infos_with_pagination_v3(
-    user,
-    page_id=0,
-    query=None,
-    sort=None,
-    alias_filter=None,
-    mailbox_id=None,
-    directory_id=None,
-    page_limit=PAGE_LIMIT,
-    page_size=PAGE_LIMIT,
-) -> [AliasInfo]:
-    q = construct_alias_query(user)
-
+def _filter_alias_query(
+    q, query=None, alias_filter=None, mailbox_id=None, directory_id=None
+):
     if query:
-        q = q.filter(
-            or_(
-                Alias.email.ilike(f"%{query}%"),
-                Alias.note.ilike(f"%{query}%"),
-                # can't use match() here as it uses to_tsquery that expected a tsquery input
-                # Alias.ts_vector.match(query),
-                Alias.ts_vector.op("@@")(func.plainto_tsquery("english", query)),
-                Alias.name.ilike(f"%{query}%"),
-            )
-        )
+        q = q.filter(alias_search_filter(query))
 
     if mailbox_id:
         q = q.join(
@@ -185,6 +168,24 @@ def get_alias_infos_with_pagination_v3(
     elif alias_filter == "hibp":
         q = q.filter(Alias.hibp_breaches.any())
 
+    return q
+
+
+@read_replica()
+def get_alias_infos_with_pagination_v3(
+    user,
+    page_id=0,
+    query=None,
+    sort=None,
+    alias_filter=None,
+    mailbox_id=None,
+    directory_id=None,
+    page_limit=PAGE_LIMIT,
+    page_size=PAGE_LIMIT,
+) -> [AliasInfo]:
+    q = construct_alias_query(user)
+    q = _filter_alias_query(q, query, alias_filter, mailbox_id, directory_id)
+
     if sort == "old2new":
         q = q.order_by(Alias.created_at)
     elif sort == "new2old":
@@ -219,6 +220,109 @@ def get_alias_infos_with_pagination_v3(
     return ret
 
 
+@dataclass
+class AliasCursor:
+    """Position of the last alias of a page, in the (pinned, last_activity_at, id) order"""
+
+    pinned: bool
+    last_activity_at: Arrow
+    alias_id: int
+
+
+def encode_alias_cursor(alias: Alias) -> str:
+    payload = json.dumps(
+        [alias.pinned, alias.last_activity_at.isoformat(), alias.id],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_alias_cursor(cursor: str) -> Optional[AliasCursor]:
+    """return None if the cursor is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        pinned, last_activity_at, alias_id = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        return AliasCursor(
+            pinned=bool(pinned),
+            last_activity_at=arrow.get(last_activity_at),
+            alias_id=int(alias_id),
+        )
+    except (ValueError, TypeError):
+        return None
+
+
+def get_alias_infos_with_cursor(
+    user,
+    cursor: Optional[AliasCursor] = None,
+    query=None,
+    alias_filter=None,
+    mailbox_id=None,
+    directory_id=None,
+    page_size=PAGE_LIMIT,
+    backward=False,
+) -> Tuple[List[AliasInfo], Optional[str]]:
+    """Keyset pagination on (pinned, last_activity_at, id): every page is a range scan
+    on ix_alias_user_id_pinned_last_activity_at_id, whatever its depth.
+    With backward, return the page before the cursor instead of the one after it.
+    Return the alias infos and the cursor to continue in the same direction, None if
+    this is the last (or with backward, the first) page
+    """
+    order_by = (Alias.pinned.desc(), Alias.last_activity_at.desc(), Alias.id.desc())
+
+    page_query = Session.query(Alias.id).filter(
+        Alias.user_id == user.id,
+        Alias.delete_on == None,  # noqa: E711
+    )
+    page_query = _filter_alias_query(
+        page_query, query, alias_filter, mailbox_id, directory_id
+    )
+    if cursor:
+        position = tuple_(Alias.pinned, Alias.last_activity_at, Alias.id)
+        cursor_position = tuple_(
+            cursor.pinned,
+            cursor.last_activity_at.to("UTC").naive,
+            cursor.alias_id,
+        )
+        page_query = page_query.filter(
+            position > cursor_position if backward else position < cursor_position
+        )
+    if backward:
+        # the closest aliases before the cursor, the page is reversed below
+        page_query = page_query.order_by(Alias.pinned, Alias.last_activity_at, Alias.id)
+    else:
+        page_query = page_query.order_by(*order_by)
+    # load 1 alias more to know whether this is the last page
+    alias_ids = [alias_id for (alias_id,) in page_query.limit(page_size + 1)]
+    has_more = len(alias_ids) > page_size
+    alias_ids = alias_ids[:page_size]
+    if not alias_ids:
+        return [], None
+
+    q = construct_alias_query(user, alias_ids=alias_ids).order_by(*order_by)
+
+    ret = []
+    for alias, contact, email_log, nb_reply, nb_blocked, nb_forward in q:
+        ret.append(
+            AliasInfo(
+                alias=alias,
+                mailbox=alias.mailbox,
+                mailboxes=alias.mailboxes,
+                nb_forward=nb_forward,
+                nb_blocked=nb_blocked,
+                nb_reply=nb_reply,
+                latest_email_log=email_log,
+                latest_contact=contact,
+                custom_domain=alias.custom_domain,
+            )
+        )
+
+    if not has_more:
+        return ret, None
+    return ret, encode_alias_cursor(ret[0].alias if backward else ret[-1].alias)
+
+
 def get_alias_info(alias: Alias) -> AliasInfo:
     q = (
         Session.query(Contact, EmailLog)
@@ -329,7 +433,7 @@ def get_alias_info_v3(user: User, alias_id: int) -> AliasInfo:
         )
 
 
-def construct_alias_query(user: User):
+def construct_alias_query(user: User, alias_ids: Optional[List[int]] = None):
     # subquery on alias annotated with nb_reply, nb_blocked, nb_forward, max_created_at, latest_email_log_created_at
     alias_activity_subquery = (
         Session.query(
@@ -358,9 +462,13 @@ def construct_alias_query(user: User):
         )
         .join(EmailLog, Alias.id == EmailLog.alias_id, isouter=True)
         .filter(Alias.user_id == user.id, Alias.delete_on == None)  # noqa: E711
-        .group_by(Alias.id)
-        .subquery()
     )
+    if alias_ids is not None:
+        # only aggregate the activity of the requested aliases
+        alias_activity_subquery = alias_activity_subquery.filter(
+            Alias.id.in_(alias_ids)
+        )
+    alias_activity_subquery = alias_activity_subquery.group_by(Alias.id).subquery()
 
     return (
         Session.query(
@@ -18,6 +18,8 @@ from app.api.serializer import (
     serialize_alias_info_v2,
     get_alias_info_v2,
     get_alias_infos_with_pagination_v3,
+    get_alias_infos_with_cursor,
+    decode_alias_cursor,
 )
 from app.contact_utils import contact_toggle_block
 from app.dashboard.views.alias_contact_manager import create_contact
@@ -86,10 +88,13 @@ def get_aliases_v2():
     Get aliases
     Input:
         page_id: in query
+        cursor: in query, alternative to page_id. Empty for the first page,
+            then the next_cursor returned by the previous call
         pinned: in query
         disabled: in query
         enabled: in query
     Output:
+        - next_cursor: only when cursor is used. null if this is the last page
         - aliases: list of alias:
             - id
             - email
@@ -114,10 +119,18 @@ def get_aliases_v2():
 
     """
     user = g.user
-    try:
-        page_id = int(request.args.get("page_id"))
-    except (ValueError, TypeError):
-        return jsonify(error="page_id must be provided in request query"), 400
+    use_cursor = "cursor" in request.args
+    cursor = None
+    if use_cursor:
+        if request.args.get("cursor"):
+            cursor = decode_alias_cursor(request.args.get("cursor"))
+            if not cursor:
+                return jsonify(error="cursor is invalid"), 400
+    else:
+        try:
+            page_id = int(request.args.get("page_id"))
+        except (ValueError, TypeError):
+            return jsonify(error="page_id must be provided in request query"), 400
 
     pinned = "pinned" in request.args
     disabled = "disabled" in request.args
@@ -137,6 +150,20 @@ def get_aliases_v2():
     if data:
         query = data.get("query")
 
+    if use_cursor:
+        alias_infos, next_cursor = get_alias_infos_with_cursor(
+            user, cursor=cursor, query=query, alias_filter=alias_filter
+        )
+        return (
+            jsonify(
+                aliases=[
+                    serialize_alias_info_v2(alias_info) for alias_info in alias_infos
+                ],
+                next_cursor=next_cursor,
+            ),
+            200,
+        )
+
     alias_infos: [AliasInfo] = get_alias_infos_with_pagination_v3(
         user, page_id=page_id, query=query, alias_filter=alias_filter
     )
@@ -2,7 +2,7 @@ import tldextract
 from flask import jsonify, request, g
 from sqlalchemy import desc
 
-from app.alias_suffix import get_alias_suffixes
+from app.alias_suffix import get_cached_alias_suffixes
 from app.api.base import api_bp, require_api_auth
 from app.db import Session
 from app.log import LOG
@@ -66,7 +66,7 @@ def options_v4():
         prefix_suggestion = convert_to_id(prefix_suggestion)
         ret["prefix_suggestion"] = prefix_suggestion
 
-    suffixes = get_alias_suffixes(user)
+    suffixes = get_cached_alias_suffixes(user)
 
     # custom domain should be put first
     ret["suffixes"] = list([suffix.suffix, suffix.signed_suffix] for suffix in suffixes)
@@ -137,7 +137,7 @@ def options_v5():
         prefix_suggestion = convert_to_id(prefix_suggestion)
         ret["prefix_suggestion"] = prefix_suggestion
 
-    suffixes = get_alias_suffixes(user)
+    suffixes = get_cached_alias_suffixes(user)
 
     # custom domain should be put first
     ret["suffixes"] = [
@@ -1,40 +1,67 @@
-from flask import g
-from flask import jsonify
+import json
+from typing import Iterator
+
+from flask import Response, g, stream_with_context
 
 from app.api.base import api_bp, require_api_auth
+from app.db import Session
 from app.models import Alias, Client, CustomDomain
 from app.alias_utils import alias_export_csv
 
 
+def _export_data_chunks(user, batch_size: int = 1000) -> Iterator[str]:
+    """Stream the user data as a JSON object, batch_size aliases at a time"""
+    yield '{"aliases": ['
+    last_id = 0
+    while True:
+        rows = (
+            Session.query(Alias.id, Alias.email, Alias.enabled)
+            .filter(Alias.user_id == user.id, Alias.id > last_id)
+            .order_by(Alias.id)
+            .limit(batch_size)
+            .all()
+        )
+        if rows:
+            yield ("" if last_id == 0 else ", ") + ", ".join(
+                json.dumps(dict(email=email, enabled=enabled))
+                for _, email, enabled in rows
+            )
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1].id
+
+    apps = [
+        dict(name=name, home_url=home_url)
+        for name, home_url in Session.query(Client.name, Client.home_url).filter(
+            Client.user_id == user.id
+        )
+    ]
+    custom_domains = [
+        domain
+        for (domain,) in Session.query(CustomDomain.domain).filter(
+            CustomDomain.user_id == user.id
+        )
+    ]
+    yield (
+        f'], "apps": {json.dumps(apps)}, '
+        f'"custom_domains": {json.dumps(custom_domains)}, '
+        f'"email": {json.dumps(user.email)}, "name": {json.dumps(user.name)}}}'
+    )
+
+
 @api_bp.route("/export/data", methods=["GET"])
 @require_api_auth
 def export_data():
     """
     Get user data
     Output:
-        Alias, custom domain and app info
+        Alias, custom domain and app info, streamed
 
     """
-    user = g.user
-
-    data = {
-        "email": user.email,
-        "name": user.name,
-        "aliases": [],
-        "apps": [],
-        "custom_domains": [],
-    }
-
-    for alias in Alias.filter_by(user_id=user.id).all():  # type: Alias
-        data["aliases"].append(dict(email=alias.email, enabled=alias.enabled))
-
-    for custom_domain in CustomDomain.filter_by(user_id=user.id).all():
-        data["custom_domains"].append(custom_domain.domain)
-
-    for app in Client.filter_by(user_id=user.id):  # type: Client
-        data["apps"].append(dict(name=app.name, home_url=app.home_url))
-
-    return jsonify(data)
+    return Response(
+        stream_with_context(_export_data_chunks(g.user)),
+        mimetype="application/json",
+    )
 
 
 @api_bp.route("/export/aliases", methods=["GET"])
@@ -0,0 +1,84 @@
+"""
+Usage statistics of the api keys (last_used and times), aggregated in memory.
+
+Updating the api_key row on every API call serializes the concurrent calls made with the
+same key. Instead the calls are counted per process and written with a single UPDATE for all
+the keys used since the previous write, at most every API_KEY_USAGE_FLUSH_INTERVAL seconds.
+The pending usage is also written when the process exits, it's lost if the process is killed.
+"""
+import atexit
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+
+import arrow
+from sqlalchemy import text
+
+from app import config
+from app.db import Session
+from app.log import LOG
+
+# api key id -> (number of calls, last call as a naive UTC datetime)
+_usage: Dict[int, Tuple[int, datetime]] = {}
+_lock = threading.Lock()
+_last_flush = time.time()
+
+
+def record_api_key_usage(api_key_id: int):
+    global _last_flush
+
+    now = arrow.utcnow().naive
+    with _lock:
+        times, _ = _usage.get(api_key_id, (0, None))
+        _usage[api_key_id] = (times + 1, now)
+        if time.time() - _last_flush < config.API_KEY_USAGE_FLUSH_INTERVAL:
+            return
+        _last_flush = time.time()
+
+    flush_api_key_usage()
+
+
+def flush_api_key_usage():
+    """Write the aggregated usage in its own transaction, the session one isn't touched"""
+    global _usage
+    with _lock:
+        usage, _usage = _usage, {}
+    if not usage:
+        return
+
+    values = []
+    params = {}
+    # every worker locks the rows in the same order, by id, so concurrent flushes of the
+    # same keys wait for each other instead of deadlocking
+    for i, (api_key_id, (times, last_used)) in enumerate(sorted(usage.items())):
+        values.append(f"(:id{i}, :times{i}, :last_used{i})")
+        params[f"id{i}"] = api_key_id
+        params[f"times{i}"] = times
+        params[f"last_used{i}"] = last_used
+
+    try:
+        with Session().bind.connect() as conn, conn.begin():
+            # the join of the UPDATE doesn't follow the order of the VALUES
+            conn.execute(
+                text("SELECT id FROM api_key WHERE id IN :ids ORDER BY id FOR UPDATE"),
+                {"ids": tuple(sorted(usage))},
+            )
+            conn.execute(
+                text(
+                    f"""
+                    UPDATE api_key
+                    SET times = api_key.times + usage.times,
+                        last_used = GREATEST(api_key.last_used, usage.last_used)
+                    FROM (VALUES {", ".join(values)})
+                        AS usage (id, times, last_used)
+                    WHERE api_key.id = usage.id
+                    """
+                ),
+                params,
+            )
+    except Exception:
+        LOG.e("Cannot write the api key usage", exc_info=True)
+
+
+atexit.register(flush_api_key_usage)
@@ -0,0 +1,180 @@
+"""
+Buffer the audit logs of a transaction and write them with one multi-row INSERT per table.
+
+The rows are kept in the session info and inserted right before the commit, so they are
+still part of the transaction that emitted them and disappear with it on rollback. A query
+on an audit log model flushes the buffer first, so the transaction sees its own logs.
+
+With AUDIT_LOG_ASYNC_WRITE, the rows of a committed transaction are handed to a background
+thread that writes them on its own connection instead.
+"""
+import atexit
+import queue
+import threading
+import time
+from typing import Dict, List
+
+import arrow
+from sqlalchemy import event
+from sqlalchemy.orm import Query
+
+from app import config
+from app.db import Session, engine
+from app.log import LOG
+from app.metrics import REGISTRY, COUNTER, GAUGE, SIZE_BUCKETS, record_custom_metric
+from app.models import AliasAuditLog, UserAuditLog
+
+_BUFFER_KEY = "audit_log_buffer"
+_AUDIT_LOG_MODELS = (AliasAuditLog, UserAuditLog)
+
+# max number of rows written by the background thread in one INSERT
+ASYNC_WRITE_BATCH_SIZE = 500
+
+
+def _get_buffer(session) -> Dict[str, List[dict]]:
+    return session.info.setdefault(_BUFFER_KEY, {})
+
+
+def add_audit_log(model, **values):
+    """Buffer an audit log row, written when the current transaction is committed"""
+    values["created_at"] = arrow.utcnow()
+    _get_buffer(Session()).setdefault(model.__tablename__, []).append(values)
+
+
+def _insert_rows(conn, rows_by_table: Dict[str, List[dict]]):
+    for model in _AUDIT_LOG_MODELS:
+        rows = rows_by_table.get(model.__tablename__)
+        if rows:
+            conn.execute(model.__table__.insert().values(rows))
+
+
+def _record_flush(nb_rows: int, start: float):
+    record_custom_metric("Custom/audit_log_flushed_rows", nb_rows, kind=COUNTER)
+    record_custom_metric("Custom/audit_log_flush_time", time.time() - start)
+
+
+def flush_audit_logs(session=None):
+    """Insert the buffered audit logs in the current transaction"""
+    if session is None:
+        session = Session()
+    rows_by_table = session.info.pop(_BUFFER_KEY, None)
+    if not rows_by_table:
+        return
+
+    start = time.time()
+    _insert_rows(session, rows_by_table)
+    _record_flush(sum(len(rows) for rows in rows_by_table.values()), start)
+
+
+_QUEUE_SIZE = REGISTRY.gauge(
+    "sl_audit_log_queue_depth", "Audit log batches waiting for the background writer"
+)
+
+
+class _AsyncWriter:
+    """Write the audit logs of committed transactions from a daemon thread"""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, rows_by_table: Dict[str, List[dict]]):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="audit-log-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+        self._queue.put(rows_by_table)
+        record_custom_metric(
+            "Custom/audit_log_queue_size", self._queue.qsize(), kind=GAUGE
+        )
+        _QUEUE_SIZE.set(self._queue.qsize())
+
+    def stop(self, timeout: float = 5):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        """Block until there are rows to write and merge the pending ones.
+        Return None once stopped"""
+        item = self._queue.get()
+        if item is None:
+            return None
+
+        batch = {table: list(rows) for table, rows in item.items()}
+        nb_rows = sum(len(rows) for rows in batch.values())
+        while nb_rows < ASYNC_WRITE_BATCH_SIZE:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # write what has been merged, stop on the next call
+                self._queue.put(None)
+                break
+            for table, rows in item.items():
+                batch.setdefault(table, []).extend(rows)
+                nb_rows += len(rows)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            start = time.time()
+            try:
+                with engine.begin() as conn:
+                    _insert_rows(conn, batch)
+            except Exception:
+                LOG.e("Cannot write audit logs %s", batch, exc_info=True)
+                continue
+            _record_flush(sum(len(rows) for rows in batch.values()), start)
+
+
+_async_writer = _AsyncWriter()
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    rows_by_table = session.info.get(_BUFFER_KEY)
+    if rows_by_table:
+        record_custom_metric(
+            "Custom/audit_log_buffered_rows",
+            sum(len(rows) for rows in rows_by_table.values()),
+            buckets=SIZE_BUCKETS,
+        )
+    if not config.AUDIT_LOG_ASYNC_WRITE:
+        flush_audit_logs(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    rows_by_table = session.info.pop(_BUFFER_KEY, None)
+    if rows_by_table:
+        _async_writer.put(rows_by_table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_BUFFER_KEY, None)
+
+
+@event.listens_for(Query, "before_compile")
+def _before_audit_log_query(query):
+    session = query.session
+    if (
+        config.AUDIT_LOG_ASYNC_WRITE
+        or session is None
+        or not session.info.get(_BUFFER_KEY)
+    ):
+        return
+    if any(
+        description["entity"] in _AUDIT_LOG_MODELS
+        for description in query.column_descriptions
+    ):
+        flush_audit_logs(session)
@@ -0,0 +1,133 @@
+"""
+Version stamps used to invalidate the per process caches of user data.
+
+There is one stamp per user, bumped when the user, their custom domains, subscriptions or
+partner users change, and a global one bumped when the SL domains change or on a bulk update
+of these tables. The stamps are bumped once the transaction is committed. They are stored in
+Redis so a change committed by any process invalidates the entries of all of them. Without
+Redis a change in one process can't be seen by the others: the caches are disabled.
+
+A cache entry records the stamps read before computing it and is only used while they are
+unchanged.
+"""
+from itertools import chain
+from typing import Optional
+
+import redis.exceptions
+from limits.storage import RedisStorage
+from sqlalchemy import event
+
+from app.db import Session
+from app.log import LOG
+from app.models import (
+    AppleSubscription,
+    CoinbaseSubscription,
+    CustomDomain,
+    ManualSubscription,
+    PartnerSubscription,
+    PartnerUser,
+    SLDomain,
+    Subscription,
+    User,
+)
+
+GLOBAL = "global"
+# the version stamps outlive the cache entries by far
+_VERSION_TTL = 86400
+
+# models that have a user_id, a change bumps the stamp of this user
+_USER_MODELS = (
+    CustomDomain,
+    Subscription,
+    ManualSubscription,
+    CoinbaseSubscription,
+    AppleSubscription,
+    PartnerUser,
+)
+_WATCHED_MODELS = _USER_MODELS + (User, PartnerSubscription, SLDomain)
+
+# session info key: version stamps to bump once the transaction is committed
+_CHANGED_KEY = "cache_versions_changed"
+
+_redis: Optional[RedisStorage] = None
+
+
+def set_redis_storage(redis: RedisStorage):
+    global _redis
+    _redis = redis
+
+
+def is_enabled() -> bool:
+    """Whether the stamps are shared by all the processes, the caches must not be used
+    otherwise"""
+    return _redis is not None
+
+
+def _version_key(scope) -> str:
+    return f"cache_version:{scope}"
+
+
+def get_versions(user_id: int) -> Optional[tuple]:
+    """Return the global and user stamps, None if they can't be read"""
+    if _redis is None:
+        return None
+    keys = [_version_key(GLOBAL), _version_key(user_id)]
+    try:
+        return tuple(_redis.storage.mget(keys))
+    except redis.exceptions.RedisError:
+        LOG.w("Cannot get the cache versions from redis", exc_info=True)
+        return None
+
+
+def bump_versions(scopes):
+    if _redis is None:
+        return
+    keys = [_version_key(scope) for scope in scopes]
+    try:
+        pipeline = _redis.storage.pipeline()
+        for key in keys:
+            pipeline.incr(key)
+            pipeline.expire(key, _VERSION_TTL)
+        pipeline.execute()
+    except redis.exceptions.RedisError:
+        LOG.e("Cannot bump the cache versions in redis", exc_info=True)
+
+
+def _changed_scope(obj):
+    if isinstance(obj, User):
+        return obj.id
+    if isinstance(obj, _USER_MODELS):
+        return obj.user_id
+    if isinstance(obj, PartnerSubscription):
+        partner_user = obj.partner_user
+        return partner_user.user_id if partner_user else GLOBAL
+    if isinstance(obj, SLDomain):
+        return GLOBAL
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        scope = _changed_scope(obj)
+        if scope is not None:
+            session.info.setdefault(_CHANGED_KEY, set()).add(scope)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _after_bulk_change(bulk_context):
+    if issubclass(bulk_context.mapper.class_, _WATCHED_MODELS):
+        bulk_context.session.info.setdefault(_CHANGED_KEY, set()).add(GLOBAL)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    changed = session.info.pop(_CHANGED_KEY, None)
+    if changed:
+        bump_versions(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_CHANGED_KEY, None)
@@ -216,6 +216,24 @@ if "DKIM_PRIVATE_KEY_PATH" in os.environ:
 # Database
 DB_URI = os.environ["DB_URI"]
 DB_CONN_NAME = os.environ.get("DB_CONN_NAME", "webapp")
+# connection pool of each process, can be set per service
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", 10))
+# seconds to wait for a connection when the pool is exhausted
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+# seconds after which a connection is replaced, -1 to keep them forever
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 3600))
+# test the connections when they are taken from the pool
+DB_POOL_PRE_PING = "DB_POOL_PRE_PING" in os.environ
+# statement timeout of the connections in milliseconds, 0 to disable
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", 0))
+# DB_URI points to pgbouncer: no local pool and no startup parameter except application_name
+DB_PGBOUNCER = "DB_PGBOUNCER" in os.environ
+# read replicas, used for the read only reports and listings
+DB_REPLICA_URIS = get_env_csv("DB_REPLICA_URIS", "")
+# a replica lagging more than this number of seconds behind the primary is not used
+DB_REPLICA_MAX_LAG = int(os.environ.get("DB_REPLICA_MAX_LAG", 30))
+DB_REPLICA_LAG_CHECK_INTERVAL = int(os.environ.get("DB_REPLICA_LAG_CHECK_INTERVAL", 10))
 
 # Flask secret
 FLASK_SECRET = os.environ["FLASK_SECRET"]
@@ -484,6 +502,10 @@ HIBP_API_KEYS = sl_getenv("HIBP_API_KEYS", list) or []
 HIBP_MAX_ALIAS_CHECK = 10_000
 HIBP_RPM = int(os.environ.get("HIBP_API_RPM", 100))
 HIBP_SKIP_PARTNER_ALIAS = os.environ.get("HIBP_SKIP_PARTNER_ALIAS")
+# can be pointed to commands/fake_hibp_server.py for benchmarks
+HIBP_API_URL = os.environ.get("HIBP_API_URL", "https://haveibeenpwned.com/api/v3")
+# number of concurrent requests per API key, the rate is still limited by HIBP_API_RPM
+HIBP_WORKERS_PER_KEY = int(os.environ.get("HIBP_WORKERS_PER_KEY", 2))
 
 KEEP_OLD_DATA_DAYS = 30
 
@@ -637,6 +659,24 @@ DISABLE_RATE_LIMIT = "DISABLE_RATE_LIMIT" in os.environ
 
 MAX_API_KEYS = int(os.environ.get("MAX_API_KEYS", 30))
 
+# The api key usage (last_used and times) is written at most every N seconds by each process
+API_KEY_USAGE_FLUSH_INTERVAL = int(os.environ.get("API_KEY_USAGE_FLUSH_INTERVAL", 60))
+
+# How long the domains offered by /api/v4|v5/alias/options are cached for a user, in seconds
+ALIAS_OPTIONS_CACHE_TTL = int(os.environ.get("ALIAS_OPTIONS_CACHE_TTL", 300))
+
+# How long the user loaded from the session cookie is cached, in seconds
+LOGIN_USER_CACHE_TTL = int(os.environ.get("LOGIN_USER_CACHE_TTL", 60))
+
+# Log a statement run more than N times by the same request, email, job or cron task
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 20))
+# Share of the requests, emails, jobs and cron tasks run under cProfile, between 0 and 1
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+
+# Serve the metrics of the email handler, job runner and event listener on this port
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
 UPCLOUD_USERNAME = os.environ.get("UPCLOUD_USERNAME", None)
 UPCLOUD_PASSWORD = os.environ.get("UPCLOUD_PASSWORD", None)
 UPCLOUD_DB_ID = os.environ.get("UPCLOUD_DB_ID", None)
@@ -740,3 +780,23 @@ DROP_PGP_KEY_ATTACHMENTS_ON_REPLY = "DROP_PGP_KEY_ATTACHMENTS_ON_REPLY" in os.en
 ENFORCE_OAUTH_CLIENT_APPROVED = "ENFORCE_OAUTH_CLIENT_APPROVED" in os.environ
 
 MAX_DOMAIN_CHECKS = max(int(os.environ.get("MAX_DOMAIN_CHECKS", 4)), 1)
+
+# user data exports bigger than this are sent as a download link instead of an attachment
+EXPORT_USER_DATA_ATTACHMENT_MAX_SIZE = int(
+    os.environ.get("EXPORT_USER_DATA_ATTACHMENT_MAX_SIZE", 10 * 1024 * 1024)
+)
+# S3 presigned urls can't be valid for more than 7 days
+EXPORT_USER_DATA_LINK_EXPIRATION_DAYS = 7
+
+# Write the audit logs from a background thread after the commit instead of inside the transaction.
+# Faster for the callers, but the logs aren't visible to the transaction that emitted them
+# and the ones still queued are lost if the process is killed.
+AUDIT_LOG_ASYNC_WRITE = "AUDIT_LOG_ASYNC_WRITE" in os.environ
+
+# max number of scheduled user deletion jobs waiting for the job runners at the same time
+MAX_PENDING_USER_DELETION_JOBS = int(
+    os.environ.get("MAX_PENDING_USER_DELETION_JOBS", 1000)
+)
+
+# statement timeout in milliseconds of each batch of the retention jobs
+RETENTION_STATEMENT_TIMEOUT = int(os.environ.get("RETENTION_STATEMENT_TIMEOUT", 30000))
@@ -20,3 +20,5 @@ class JobType(enum.Enum):
     SEND_EVENT_TO_WEBHOOK = "send-event-to-webhook"
     SYNC_SUBSCRIPTION = "sync-subscription"
     ABUSER_MARK = "abuser-mark"
+    DELETE_SCHEDULED_USER = "delete-scheduled-user"
+    DELETE_USER_EXPORT = "delete-user-export"
@@ -4,11 +4,17 @@ from flask import render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 
 from app import alias_utils, parallel_limiter, alias_delete
-from app.api.serializer import get_alias_infos_with_pagination_v3, get_alias_info_v3
+from app.api.serializer import (
+    get_alias_infos_with_pagination_v3,
+    get_alias_info_v3,
+    get_alias_infos_with_cursor,
+    decode_alias_cursor,
+    encode_alias_cursor,
+)
 from app.config import ALIAS_LIMIT, PAGE_LIMIT
 from app.contact_utils import contact_toggle_block
 from app.dashboard.base import dashboard_bp
-from app.db import Session
+from app.db import Session, read_replica
 from app.extensions import limiter
 from app.log import LOG
 from app.models import (
@@ -31,6 +37,7 @@ class Stats:
     nb_block: int
 
 
+@read_replica()
 def get_stats(user: User) -> Stats:
     nb_alias = Alias.filter_by(user_id=user.id, delete_on=None).count()  # noqa : E711
     nb_forward = (
@@ -175,6 +182,8 @@ def index():
                 sort=sort,
                 filter=alias_filter,
                 page=page,
+                cursor=request.args.get("cursor"),
+                before=request.args.get("before"),
             )
         )
 
@@ -199,21 +208,61 @@ def index():
     if alias_filter and alias_filter.startswith("directory:"):
         directory_id = int(alias_filter[len("directory:") :])
 
-    alias_infos = get_alias_infos_with_pagination_v3(
-        current_user,
-        page,
-        query,
-        sort,
-        alias_filter,
-        mailbox_id,
-        directory_id,
-        # load 1 alias more to know whether this is the last page
-        page_limit=PAGE_LIMIT + 1,
-    )
+    # the default sort is paginated by keyset: "Next" links carry the cursor of the last
+    # alias of the page, "Previous" links the cursor of the first one in "before"
+    cursor = before = None
+    if not sort and request.args.get("cursor"):
+        cursor = decode_alias_cursor(request.args.get("cursor"))
+    elif not sort and request.args.get("before"):
+        before = decode_alias_cursor(request.args.get("before"))
+
+    next_cursor = prev_cursor = None
+    if before:
+        alias_infos, prev_cursor = get_alias_infos_with_cursor(
+            current_user,
+            before,
+            query,
+            alias_filter,
+            mailbox_id,
+            directory_id,
+            backward=True,
+        )
+        first_page = prev_cursor is None
+        last_page = not alias_infos
+        if alias_infos:
+            next_cursor = encode_alias_cursor(alias_infos[-1].alias)
+    elif cursor or (not sort and page == 0):
+        alias_infos, next_cursor = get_alias_infos_with_cursor(
+            current_user,
+            cursor,
+            query,
+            alias_filter,
+            mailbox_id,
+            directory_id,
+        )
+        first_page = cursor is None
+        last_page = next_cursor is None
+        if cursor and alias_infos:
+            prev_cursor = encode_alias_cursor(alias_infos[0].alias)
+    else:
+        alias_infos = get_alias_infos_with_pagination_v3(
+            current_user,
+            page,
+            query,
+            sort,
+            alias_filter,
+            mailbox_id,
+            directory_id,
+            # load 1 alias more to know whether this is the last page
+            page_limit=PAGE_LIMIT + 1,
+        )
 
-    last_page = len(alias_infos) <= PAGE_LIMIT
-    # remove the last alias that's added to know whether this is the last page
-    alias_infos = alias_infos[:PAGE_LIMIT]
+        first_page = page == 0
+        last_page = len(alias_infos) <= PAGE_LIMIT
+        # remove the last alias that's added to know whether this is the last page
+        alias_infos = alias_infos[:PAGE_LIMIT]
+    if first_page:
+        page = 0
 
     # add highlighted alias in case it's not included
     if highlight_alias_id and highlight_alias_id not in [
@@ -235,7 +284,10 @@ def index():
         mailboxes=mailboxes,
         show_intro=show_intro,
         page=page,
+        first_page=first_page,
         last_page=last_page,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
         sort=sort,
         filter=alias_filter,
         stats=stats,
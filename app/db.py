@@ -1,18 +1,161 @@
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
 import sqlalchemy
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
 
 from app import config
+from app.log import LOG
+from app.metrics import COUNTER, GAUGE, record_custom_metric
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that reports how long a checkout waited for a free connection"""
+
+    def _do_get(self):
+        start = time.time()
+        conn = super()._do_get()
+        record_custom_metric("Custom/db_pool_checkout_wait", time.time() - start)
+        record_custom_metric(
+            "Custom/db_pool_checked_out", self.checkedout(), kind=GAUGE
+        )
+        return conn
+
+
+def _create_engine(db_uri: str):
+    connect_args = {"application_name": config.DB_CONN_NAME}
+
+    if config.DB_PGBOUNCER:
+        # pgbouncer does the pooling, and only lets a few startup parameters through
+        if config.DB_STATEMENT_TIMEOUT:
+            LOG.w("DB_STATEMENT_TIMEOUT is ignored with pgbouncer, set it on the role")
+        return create_engine(db_uri, connect_args=connect_args, poolclass=NullPool)
+
+    if config.DB_STATEMENT_TIMEOUT:
+        connect_args["options"] = f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT}"
+    return create_engine(
+        db_uri,
+        connect_args=connect_args,
+        poolclass=_TimedQueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_POOL_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+    )
+
+
+engine = _create_engine(config.DB_URI)
+
+
+@event.listens_for(Engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    record_custom_metric("Custom/db_pool_new_connection", 1, kind=COUNTER)
+
+
+_REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+class _Replicas:
+    """The read replicas, each one is used only while its replication lag is acceptable"""
 
+    def __init__(self, db_uris: List[str]):
+        self._engines = [_create_engine(db_uri) for db_uri in db_uris]
+        # engine index -> (time of the check, usable)
+        self._checks: Dict[int, tuple] = {}
 
-engine = create_engine(
-    config.DB_URI, connect_args={"application_name": config.DB_CONN_NAME}
-)
-connection = engine.connect()
+    def _is_usable(self, index: int) -> bool:
+        checked_at, usable = self._checks.get(index, (0, False))
+        if time.time() - checked_at < config.DB_REPLICA_LAG_CHECK_INTERVAL:
+            return usable
 
-Session = scoped_session(sessionmaker(bind=connection))
+        try:
+            with self._engines[index].connect() as conn:
+                lag = conn.execute(_REPLICA_LAG_QUERY).scalar() or 0
+            usable = lag <= config.DB_REPLICA_MAX_LAG
+            record_custom_metric(
+                "Custom/db_replica_lag", lag, kind=GAUGE, labels={"replica": index}
+            )
+        except Exception:
+            LOG.w(f"Cannot check the lag of replica {index}", exc_info=True)
+            usable = False
+        if not usable:
+            LOG.w(f"Replica {index} is not usable, fall back to the primary")
+        self._checks[index] = (time.time(), usable)
+        return usable
+
+    def pick(self) -> Optional[Engine]:
+        indexes = list(range(len(self._engines)))
+        random.shuffle(indexes)
+        for index in indexes:
+            if self._is_usable(index):
+                return self._engines[index]
+        return None
+
+
+_replicas = _Replicas(config.DB_REPLICA_URIS)
+
+# session info keys
+_USE_REPLICA = "use_replica"
+_HAS_WRITTEN = "has_written"
+
+
+class _RoutingSession(sqlalchemy.orm.Session):
+    """Send the reads of a read_replica() block to a replica, unless the current transaction
+    has written something: its following reads then stay on the primary to see these writes"""
+
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase):
+            self.info[_HAS_WRITTEN] = True
+        elif self.info.get(_USE_REPLICA) and not self.info.get(_HAS_WRITTEN):
+            replica = _replicas.pick()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+
+# each thread gets its own session, which takes a connection from the pool for each transaction
+Session = scoped_session(sessionmaker(bind=engine, class_=_RoutingSession))
 
 # Session is actually a proxy, more info on
 # https://docs.sqlalchemy.org/en/14/orm/contextual.html?highlight=scoped_session#implicit-method-access
 Session: sqlalchemy.orm.Session
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    session.info[_HAS_WRITTEN] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _end_of_transaction(session):
+    # the writes are committed or discarded, a long lived session (cron, jobs) can use
+    # the replicas again
+    session.info.pop(_HAS_WRITTEN, None)
+
+
+@contextmanager
+def read_replica():
+    """Run the queries of the block on a read replica if one is configured and up to date.
+    The block must not write. After a write, the reads stay on the primary until the end of
+    the transaction."""
+    session = Session()
+    previous = session.info.get(_USE_REPLICA, False)
+    session.info[_USE_REPLICA] = True
+    try:
+        yield
+    finally:
+        session.info[_USE_REPLICA] = previous
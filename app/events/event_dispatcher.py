@@ -1,17 +1,30 @@
 from abc import ABC, abstractmethod
 
+import arrow
 import newrelic.agent
+from sqlalchemy import event
 
 from app import config
 from app.db import Session
 from app.errors import ProtonPartnerNotSetUp
 from app.events.generated import event_pb2
 from app.log import LOG
+from app.metrics import SIZE_BUCKETS, record_custom_metric
 from app.models import User, PartnerUser, SyncEvent
 from app.proton.proton_partner import get_proton_partner
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
+# payload: a single event id, understood by every listener version
 NOTIFICATION_CHANNEL = "simplelogin_sync_events"
+# payload: comma separated event ids. On its own channel as the listeners that only know
+# NOTIFICATION_CHANNEL can't parse it, they don't LISTEN to it either
+NOTIFICATION_IDS_CHANNEL = "simplelogin_sync_event_ids"
+# a NOTIFY payload must be shorter than 8000 bytes
+_MAX_PAYLOAD_LENGTH = 7900
+
+# session info keys, both only live for the current transaction
+_PENDING_EVENTS_KEY = "pending_sync_events"
+_PARTNER_USERS_KEY = "event_partner_users"
 
 
 class Dispatcher(ABC):
@@ -19,17 +32,90 @@ class Dispatcher(ABC):
     def send(self, event: bytes):
         pass
 
+    def send_many(self, events: List[bytes]):
+        for e in events:
+            self.send(e)
+
 
 class PostgresDispatcher(Dispatcher):
+    """Store the events in sync_event when the transaction is committed.
+    All the events of a transaction are inserted at once and announced with as few NOTIFY as
+    possible, see notifications_for()"""
+
     def send(self, event: bytes):
-        instance = SyncEvent.create(content=event, flush=True)
-        Session.execute(f"NOTIFY {NOTIFICATION_CHANNEL}, '{instance.id}';")
+        self.send_many([event])
+
+    def send_many(self, events: List[bytes]):
+        Session().info.setdefault(_PENDING_EVENTS_KEY, []).extend(events)
 
     @staticmethod
     def get():
         return PostgresDispatcher()
 
 
+def store_pending_events(session):
+    events = session.info.pop(_PENDING_EVENTS_KEY, None)
+    if not events:
+        return
+
+    now = arrow.utcnow()
+    ids = [
+        event_id
+        for (event_id,) in session.execute(
+            SyncEvent.__table__.insert()
+            .values([{"created_at": now, "content": e} for e in events])
+            .returning(SyncEvent.__table__.c.id)
+        )
+    ]
+    for channel, payload in notifications_for(ids):
+        session.execute(f"NOTIFY {channel}, '{payload}';")
+    record_custom_metric(
+        "Custom/sync_events_per_commit", len(ids), buckets=SIZE_BUCKETS
+    )
+
+
+def notifications_for(ids: List[int]) -> List[Tuple[str, str]]:
+    """Return the channel and payload of each NOTIFY announcing the events ids. The exact ids
+    are sent: the ids of a transaction aren't contiguous when other transactions insert
+    events at the same time"""
+    if len(ids) == 1:
+        return [(NOTIFICATION_CHANNEL, str(ids[0]))]
+
+    notifications = []
+    payload = ""
+    for event_id in sorted(ids):
+        if len(payload) + len(str(event_id)) + 1 > _MAX_PAYLOAD_LENGTH:
+            notifications.append((NOTIFICATION_IDS_CHANNEL, payload))
+            payload = ""
+        payload = f"{payload},{event_id}" if payload else str(event_id)
+    notifications.append((NOTIFICATION_IDS_CHANNEL, payload))
+    return notifications
+
+
+def parse_notification_payload(payload: str) -> List[int]:
+    """Return the event ids of a NOTIFY payload"""
+    return [int(event_id) for event_id in payload.split(",")]
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    store_pending_events(session)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _end_of_transaction(session):
+    session.info.pop(_PENDING_EVENTS_KEY, None)
+    session.info.pop(_PARTNER_USERS_KEY, None)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _after_bulk_change(bulk_context):
+    if bulk_context.mapper.class_ is PartnerUser:
+        bulk_context.session.info.pop(_PARTNER_USERS_KEY, None)
+
+
 class GlobalDispatcher:
     __dispatcher: Optional[Dispatcher] = None
 
@@ -52,6 +138,18 @@ class EventDispatcher:
         dispatcher: Optional[Dispatcher] = None,
         skip_if_webhook_missing: bool = True,
     ):
+        EventDispatcher.send_events(
+            user, [content], dispatcher, skip_if_webhook_missing
+        )
+
+    @staticmethod
+    def send_events(
+        user: User,
+        contents: List[event_pb2.EventContent],
+        dispatcher: Optional[Dispatcher] = None,
+        skip_if_webhook_missing: bool = True,
+    ):
+        """Send several events of the same user, the partner user is only looked up once"""
         if dispatcher is None:
             dispatcher = GlobalDispatcher.get_dispatcher()
         if config.EVENT_WEBHOOK_DISABLE:
@@ -69,22 +167,43 @@ class EventDispatcher:
             LOG.i(f"Not sending events because there's no partner user for user {user}")
             return
 
-        event = event_pb2.Event(
-            user_id=user.id,
-            external_user_id=partner_user.external_user_id,
-            partner_id=partner_user.partner_id,
-            content=content,
-        )
+        external_user_id, partner_id = partner_user
+        serialized_events = []
+        for content in contents:
+            pb_event = event_pb2.Event(
+                user_id=user.id,
+                external_user_id=external_user_id,
+                partner_id=partner_id,
+                content=content,
+            )
+            serialized_events.append(pb_event.SerializeToString())
 
-        serialized = event.SerializeToString()
-        dispatcher.send(serialized)
+            event_type = content.WhichOneof("content")
+            newrelic.agent.record_custom_event("EventStoredToDb", {"type": event_type})
+        dispatcher.send_many(serialized_events)
+        LOG.i(f"Sent {len(contents)} events to the dispatcher")
 
-        event_type = content.WhichOneof("content")
-        newrelic.agent.record_custom_event("EventStoredToDb", {"type": event_type})
-        LOG.i("Sent event to the dispatcher")
+    @staticmethod
+    def __partner_user(user_id: int) -> Optional[Tuple[str, int]]:
+        """Return the (external_user_id, partner_id) of the user, looked up once per transaction"""
+        session = Session()
+        # a partner user is being created, changed or deleted, the cache can't be trusted
+        if any(
+            isinstance(obj, PartnerUser)
+            for changed in (session.new, session.dirty, session.deleted)
+            for obj in changed
+        ):
+            session.info.pop(_PARTNER_USERS_KEY, None)
+
+        cache: Dict[int, Optional[Tuple[str, int]]] = session.info.setdefault(
+            _PARTNER_USERS_KEY, {}
+        )
+        if user_id not in cache:
+            cache[user_id] = EventDispatcher.__load_partner_user(user_id)
+        return cache[user_id]
 
     @staticmethod
-    def __partner_user(user_id: int) -> Optional[PartnerUser]:
+    def __load_partner_user(user_id: int) -> Optional[Tuple[str, int]]:
         # Check if the current user has a partner_id
         try:
             proton_partner_id = get_proton_partner().id
@@ -92,4 +211,7 @@ class EventDispatcher:
             return None
 
         # It has. Retrieve the information for the PartnerUser
-        return PartnerUser.get_by(user_id=user_id, partner_id=proton_partner_id)
+        partner_user = PartnerUser.get_by(user_id=user_id, partner_id=proton_partner_id)
+        if partner_user is None:
+            return None
+        return partner_user.external_user_id, partner_user.partner_id
@@ -33,6 +33,7 @@ from app.models import (
     SLDomain,
     Hibp,
     AliasHibp,
+    HibpPendingNotification,
     PartnerUser,
     PartnerSubscription,
 )
@@ -285,6 +286,10 @@ def fake_data():
     )
     AliasHibp.create(hibp_id=hibp1.id, alias_id=breached_alias1.id)
     AliasHibp.create(hibp_id=hibp2.id, alias_id=breached_alias2.id)
+    for breached_alias in (breached_alias1, breached_alias2):
+        HibpPendingNotification.create(
+            alias_id=breached_alias.id, user_id=breached_alias.user_id
+        )
 
     # old domain will have ownership_verified=True
     CustomDomain.create(
@@ -1,15 +1,25 @@
 import csv
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
 
+import arrow
 import requests
 from email_validator import validate_email, EmailNotValidError
+from newrelic import agent
+from werkzeug.exceptions import TooManyRequests
 
 from app import s3
+from app.alias_audit_log_utils import AliasAuditLogAction, emit_bulk_alias_audit_log
 from app.db import Session
+from app.events.event_dispatcher import EventDispatcher
+from app.events.generated.event_pb2 import AliasCreated, EventContent
 from app.models import (
     Alias,
     AliasMailbox,
     BatchImport,
     CustomDomain,
+    DailyMetric,
     DeletedAlias,
     DomainDeletedAlias,
     Mailbox,
@@ -19,6 +29,51 @@ from app.utils import sanitize_email, canonicalize_email
 from .alias_utils import check_alias_prefix
 from .log import LOG
 
+# number of aliases checked and inserted at once
+IMPORT_BATCH_SIZE = 500
+# number of row errors kept in the batch import summary
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass
+class ImportRowError:
+    line: int
+    alias: str
+    reason: str
+
+
+@dataclass
+class ImportResult:
+    nb_imported: int = 0
+    nb_rows: int = 0
+    errors: List[ImportRowError] = field(default_factory=list)
+    duration: float = 0
+    # the alias creation rate limit has been reached, the next batches are skipped
+    rate_limited: bool = False
+
+    def add_error(self, line: int, alias: str, reason: str):
+        LOG.d(f"Cannot import line {line} {alias}: {reason}")
+        self.errors.append(ImportRowError(line, alias, reason))
+
+    def summary(self) -> str:
+        lines = [
+            f"{self.nb_imported}/{self.nb_rows} aliases imported in {self.duration:.1f}s"
+        ]
+        for error in self.errors[:MAX_REPORTED_ERRORS]:
+            lines.append(f"Line {error.line} {error.alias}: {error.reason}")
+        if len(self.errors) > MAX_REPORTED_ERRORS:
+            lines.append(f"And {len(self.errors) - MAX_REPORTED_ERRORS} more errors")
+        return "\n".join(lines)
+
+
+@dataclass
+class _AliasToImport:
+    line: int
+    email: str
+    note: str
+    custom_domain: CustomDomain
+    mailbox_ids: List[int]
+
 
 def handle_batch_import(batch_import: BatchImport):
     user = batch_import.user
@@ -30,88 +85,242 @@ def handle_batch_import(batch_import: BatchImport):
     file_url = s3.get_url(batch_import.file.path)
 
     LOG.d("Download file %s from %s", batch_import.file, file_url)
-    r = requests.get(file_url)
+    r = requests.get(file_url, stream=True)
     # Replace invisible character
-    lines = [
+    lines = (
         line.decode("utf-8").replace("\ufeff", "").strip() for line in r.iter_lines()
-    ]
+    )
 
     import_from_csv(batch_import, user, lines)
 
 
-def import_from_csv(batch_import: BatchImport, user: User, lines: list[str]):
+def _get_alias_quota(user: User) -> Optional[int]:
+    """Number of aliases the user can still create, None if unlimited.
+    Same rules as User.can_create_num_aliases"""
+    if not user.is_active() or user.disabled:
+        return 0
+    if user.lifetime_or_active_subscription():
+        return None
+    active_alias_count = Alias.filter_by(user_id=user.id, delete_on=None).count()
+    return max(0, user.max_alias_for_free_account() - active_alias_count)
+
+
+def _get_used_emails(emails: List[str]) -> set[str]:
+    """Return the emails that are already used by an alias or in a trash"""
+    used = set()
+    for model in (Alias, DeletedAlias, DomainDeletedAlias):
+        used.update(
+            email
+            for (email,) in Session.query(model.email).filter(model.email.in_(emails))
+        )
+    return used
+
+
+def _insert_aliases(
+    user: User, batch_import: BatchImport, to_import: List[_AliasToImport]
+):
+    now = arrow.utcnow()
+    rows = Session.execute(
+        Alias.__table__.insert()
+        .values(
+            [
+                {
+                    "created_at": now,
+                    "user_id": user.id,
+                    "email": alias.email,
+                    "note": alias.note,
+                    "mailbox_id": alias.mailbox_ids[0],
+                    "custom_domain_id": alias.custom_domain.id,
+                    "batch_import_id": batch_import.id,
+                    "flags": Alias.FLAG_PARTNER_CREATED
+                    if alias.custom_domain.partner_id is not None
+                    else 0,
+                    "last_activity_at": now,
+                }
+                for alias in to_import
+            ]
+        )
+        .returning(Alias.__table__.c.id, Alias.__table__.c.email)
+    ).fetchall()
+    alias_ids = {email: alias_id for alias_id, email in rows}
+
+    alias_mailboxes = [
+        {
+            "created_at": now,
+            "alias_id": alias_ids[alias.email],
+            "mailbox_id": mailbox_id,
+        }
+        for alias in to_import
+        for mailbox_id in alias.mailbox_ids[1:]
+    ]
+    if alias_mailboxes:
+        Session.execute(AliasMailbox.__table__.insert().values(alias_mailboxes))
+
+    if any(alias.custom_domain.partner_id is not None for alias in to_import):
+        user.flags = user.flags | User.FLAG_CREATED_ALIAS_FROM_PARTNER
+    DailyMetric.get_or_create_today_metric().nb_alias += len(to_import)
+
+    emit_bulk_alias_audit_log(
+        list(alias_ids.values()),
+        AliasAuditLogAction.CreateAlias,
+        "New alias created",
+    )
+    EventDispatcher.send_events(
+        user,
+        [
+            EventContent(
+                alias_created=AliasCreated(
+                    id=alias_ids[alias.email],
+                    email=alias.email,
+                    note=alias.note,
+                    enabled=True,
+                    created_at=int(now.timestamp),
+                )
+            )
+            for alias in to_import
+        ],
+    )
+    Session.commit()
+
+    for alias in to_import:
+        agent.record_custom_event(
+            "AliasCreated",
+            {
+                "custom_domain": "custom domain",
+                "from_partner": "from partner"
+                if alias.custom_domain.partner_id is not None
+                else "from sl",
+                "automatic": "manual",
+            },
+        )
+
+
+def _import_batch(
+    user: User,
+    batch_import: BatchImport,
+    batch: List[_AliasToImport],
+    quota: Optional[int],
+    result: ImportResult,
+) -> Optional[int]:
+    """Import a batch of parsed rows, return the remaining quota"""
+    used_emails = _get_used_emails([alias.email for alias in batch])
+    to_import = []
+    for alias in batch:
+        if alias.email in used_emails:
+            result.add_error(alias.line, alias.email, "alias already used")
+            continue
+        if quota is not None and len(to_import) >= quota:
+            result.add_error(alias.line, alias.email, "alias quota exceeded")
+            continue
+        used_emails.add(alias.email)
+        to_import.append(alias)
+
+    if to_import and not result.rate_limited:
+        # same limits as Alias.create, counted once for the whole batch
+        try:
+            Alias.check_create_rate_limit(user, len(to_import))
+        except TooManyRequests:
+            LOG.w(f"Alias creation rate limit reached for {user}, stop the import")
+            result.rate_limited = True
+    if to_import and result.rate_limited:
+        for alias in to_import:
+            result.add_error(
+                alias.line, alias.email, "alias creation rate limit reached"
+            )
+        to_import = []
+
+    if to_import:
+        _insert_aliases(user, batch_import, to_import)
+        result.nb_imported += len(to_import)
+        LOG.d(f"Imported {result.nb_imported} aliases for {user}")
+
+    if quota is None:
+        return None
+    return quota - len(to_import)
+
+
+def import_from_csv(
+    batch_import: BatchImport, user: User, lines: Iterable[str]
+) -> ImportResult:
+    start = time.time()
+    result = ImportResult()
     reader = csv.DictReader(lines)
 
+    # the domains and mailboxes that can be used, loaded once for the whole file
+    custom_domains: Dict[str, CustomDomain] = {
+        custom_domain.domain: custom_domain
+        for custom_domain in CustomDomain.filter_by(
+            user_id=user.id, ownership_verified=True
+        )
+    }
+    mailbox_ids: Dict[str, int] = {
+        mailbox.email: mailbox.id
+        for mailbox in Mailbox.filter_by(user_id=user.id, verified=True)
+    }
+    quota = _get_alias_quota(user)
+
+    batch: List[_AliasToImport] = []
     for row in reader:
+        result.nb_rows += 1
+        # line number in the file, the header being the line 1
+        line = reader.line_num
         try:
             full_alias = sanitize_email(row["alias"])
             note = row["note"]
-        except KeyError:
+        except (KeyError, AttributeError):
             LOG.w("Cannot parse row %s", row)
+            result.add_error(line, "", "cannot parse row")
             continue
 
         split_pos = full_alias.find("@")
         alias_domain = full_alias[split_pos + 1 :]
         alias_prefix = full_alias[:split_pos]
         if not check_alias_prefix(alias_prefix):
-            LOG.w(f"Invalid alias prefix {alias_prefix}")
+            result.add_error(line, full_alias, "invalid alias prefix")
             continue
 
         try:
             validate_email(full_alias, check_deliverability=False, allow_smtputf8=False)
         except EmailNotValidError:
-            LOG.w(f"Invalid email {full_alias}")
-            continue
-
-        custom_domain = CustomDomain.get_by(domain=alias_domain)
-
-        if (
-            not custom_domain
-            or not custom_domain.ownership_verified
-            or custom_domain.user_id != user.id
-        ):
-            LOG.d("domain %s can't be used %s", alias_domain, user)
+            result.add_error(line, full_alias, "invalid email")
             continue
 
-        if (
-            Alias.get_by(email=full_alias)
-            or DeletedAlias.get_by(email=full_alias)
-            or DomainDeletedAlias.get_by(email=full_alias)
-        ):
-            LOG.d("alias already used %s", full_alias)
+        custom_domain = custom_domains.get(alias_domain)
+        if not custom_domain:
+            result.add_error(line, full_alias, f"domain {alias_domain} can't be used")
             continue
 
         mailboxes = []
-
         if "mailboxes" in row and row["mailboxes"]:
             for mailbox_email in row["mailboxes"].split():
-                mailbox_email = canonicalize_email(mailbox_email)
-                mailbox = Mailbox.get_by(email=mailbox_email)
-
-                if not mailbox or not mailbox.verified or mailbox.user_id != user.id:
-                    LOG.d("mailbox %s can't be used %s", mailbox, user)
+                mailbox_id = mailbox_ids.get(canonicalize_email(mailbox_email))
+                if not mailbox_id:
+                    LOG.d("mailbox %s can't be used %s", mailbox_email, user)
                     continue
-
-                mailboxes.append(mailbox.id)
+                if mailbox_id not in mailboxes:
+                    mailboxes.append(mailbox_id)
 
         if len(mailboxes) == 0:
             mailboxes = [user.default_mailbox_id]
 
-        if user.can_create_new_alias():
-            alias = Alias.create(
-                user_id=user.id,
-                email=full_alias,
-                note=note,
-                mailbox_id=mailboxes[0],
-                custom_domain_id=custom_domain.id,
-                batch_import_id=batch_import.id,
-                commit=True,
-            )
-            LOG.d("Create %s", alias)
+        batch.append(_AliasToImport(line, full_alias, note, custom_domain, mailboxes))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            quota = _import_batch(user, batch_import, batch, quota, result)
+            batch = []
 
-            for i in range(1, len(mailboxes)):
-                AliasMailbox.create(
-                    alias_id=alias.id, mailbox_id=mailboxes[i], commit=True
-                )
-                Session.commit()
-                LOG.d("Add %s to mailbox %s", alias, mailboxes[i])
+    if batch:
+        _import_batch(user, batch_import, batch, quota, result)
+
+    result.duration = time.time() - start
+    LOG.i(
+        f"Batch import {batch_import} for {user}: {result.nb_imported}/{result.nb_rows} "
+        f"aliases imported in {result.duration:.1f}s, "
+        f"{result.nb_imported / max(result.duration, 0.001):.0f} aliases/s"
+    )
+    agent.record_custom_event(
+        "BatchImport",
+        {"nb_imported": result.nb_imported, "nb_errors": len(result.errors)},
+    )
+    batch_import.summary = result.summary()
+    Session.commit()
+    return result
@@ -0,0 +1,202 @@
+"""
+Count the queries and the database time of a unit of work: a web request, an email handled
+by the SMTP handler, a job or a cron task.
+
+    with instrument("job/export-user-data"):
+        ...
+
+A unit can be nested in another one, its queries are also counted in the outer unit.
+At the end of the unit the stats go to the exporter, by default New Relic custom metrics
+and histograms of the metrics registry, per unit name. A statement run more
+than N_PLUS_ONE_THRESHOLD times in the same unit is logged as a probable N+1 query, and
+PROFILE_SAMPLE_RATE of the units are run under cProfile with their hottest functions logged.
+"""
+import cProfile
+import io
+import pstats
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Optional
+
+import newrelic.agent
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import config
+from app.log import LOG
+from app.metrics import REGISTRY
+
+# number of functions logged for a profiled unit
+_PROFILE_TOP_FUNCTIONS = 20
+# connection info key: start time of the statements being executed
+_QUERY_START_KEY = "query_start"
+
+_UNIT_QUERIES = REGISTRY.histogram(
+    "sl_unit_queries",
+    "Queries run by a request, email, job or cron task",
+    ["unit"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+_UNIT_DB_TIME = REGISTRY.histogram(
+    "sl_unit_db_seconds",
+    "Database time of a request, email, job or cron task",
+    ["unit"],
+)
+_UNIT_TIME = REGISTRY.histogram(
+    "sl_unit_seconds", "Duration of a request, email, job or cron task", ["unit"]
+)
+
+
+@dataclass
+class UnitStats:
+    name: str
+    start: float = field(default_factory=time.perf_counter)
+    query_count: int = 0
+    # seconds
+    db_time: float = 0
+    statements: Counter = field(default_factory=Counter)
+    profiler: Optional[cProfile.Profile] = None
+    token: Optional[Token] = None
+    parent: Optional["UnitStats"] = None
+
+    @property
+    def duration(self) -> float:
+        return time.perf_counter() - self.start
+
+
+class Exporter(ABC):
+    @abstractmethod
+    def export(self, stats: UnitStats):
+        pass
+
+
+class DefaultExporter(Exporter):
+    """New Relic custom metrics and histograms of the metrics registry, by unit name"""
+
+    def export(self, stats: UnitStats):
+        newrelic.agent.record_custom_metric(
+            f"Custom/query_count/{stats.name}", stats.query_count
+        )
+        newrelic.agent.record_custom_metric(
+            f"Custom/db_time/{stats.name}", stats.db_time
+        )
+        newrelic.agent.record_custom_metric(
+            f"Custom/unit_time/{stats.name}", stats.duration
+        )
+        _UNIT_QUERIES.observe(stats.query_count, unit=stats.name)
+        _UNIT_DB_TIME.observe(stats.db_time, unit=stats.name)
+        _UNIT_TIME.observe(stats.duration, unit=stats.name)
+
+
+_exporter: Exporter = DefaultExporter()
+_current: ContextVar[Optional[UnitStats]] = ContextVar("unit_stats", default=None)
+
+
+def set_exporter(exporter: Exporter):
+    global _exporter
+    _exporter = exporter
+
+
+def current_stats() -> Optional[UnitStats]:
+    return _current.get()
+
+
+def start_unit(name: str) -> UnitStats:
+    """Start counting for a new unit, nested in the current one if any"""
+    stats = UnitStats(name=name, parent=_current.get())
+    if config.PROFILE_SAMPLE_RATE and random.random() < config.PROFILE_SAMPLE_RATE:
+        stats.profiler = cProfile.Profile()
+        try:
+            stats.profiler.enable()
+        except ValueError:
+            # another profiler is already running
+            stats.profiler = None
+    stats.token = _current.set(stats)
+    return stats
+
+
+def finish_unit() -> Optional[UnitStats]:
+    """Stop counting for the current unit, add its queries to the outer unit if any and
+    export its stats"""
+    stats = _current.get()
+    if stats is None:
+        return None
+    try:
+        _current.reset(stats.token)
+    except ValueError:
+        # not finished in the context it was started in
+        _current.set(None)
+
+    if stats.parent:
+        stats.parent.query_count += stats.query_count
+        stats.parent.db_time += stats.db_time
+        stats.parent.statements.update(stats.statements)
+    if stats.profiler:
+        stats.profiler.disable()
+        _log_profile(stats.name, stats.profiler)
+    for statement, count in stats.statements.items():
+        if count > config.N_PLUS_ONE_THRESHOLD:
+            LOG.w(
+                "%s ran the same statement %s times: %s",
+                stats.name,
+                count,
+                statement[:500],
+            )
+    try:
+        _exporter.export(stats)
+    except Exception:
+        LOG.w("Cannot export the stats of %s", stats.name, exc_info=True)
+    return stats
+
+
+@contextmanager
+def instrument(name: str):
+    stats = start_unit(name)
+    try:
+        yield stats
+    finally:
+        finish_unit()
+
+
+def _log_profile(name: str, profiler: cProfile.Profile):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(
+        _PROFILE_TOP_FUNCTIONS
+    )
+    LOG.i("Profile of %s:\n%s", name, out.getvalue())
+
+
+def server_timing(stats: UnitStats) -> str:
+    return (
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries", '
+        f"total;dur={stats.duration * 1000:.1f}"
+    )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_QUERY_START_KEY, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info[_QUERY_START_KEY].pop()
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.query_count += 1
+    stats.db_time += time.perf_counter() - start
+    # the parameters are bound separately, queries with the same shape share their text
+    stats.statements[statement] += 1
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get(_QUERY_START_KEY):
+        conn.info[_QUERY_START_KEY].pop()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+import arrow
+from sqlalchemy import and_
+
+from app import config
+from app.constants import JobType
+from app.db import Session
+from app.log import LOG
+from app.metrics import COUNTER, record_custom_metric
+from app.models import Job, JobPriority, JobState, User
+from app.user_audit_log_utils import emit_user_audit_log, UserAuditLogAction
+
+DELETE_GRACE_DAYS = 30
+
+# number of users looked up at once when scheduling the deletions
+_SCHEDULE_BATCH_SIZE = 500
+
+
+def deletion_cutoff() -> arrow.Arrow:
+    """Users scheduled to be deleted before this date are due"""
+    return arrow.now().shift(days=-DELETE_GRACE_DAYS)
+
+
+def due_users_condition(cutoff: arrow.Arrow):
+    return and_(User.delete_on.isnot(None), User.delete_on <= cutoff)
+
+
+def pending_deletion_jobs_query():
+    return Job.filter(
+        Job.name == JobType.DELETE_SCHEDULED_USER.value,
+        Job.state.in_([JobState.ready.value, JobState.taken.value]),
+    )
+
+
+class DeleteScheduledUserJob:
+    def __init__(self, user: User):
+        self._user: User = user
+
+    def run(self) -> None:
+        user = self._user
+        # the deletion might have been cancelled or postponed since the job was created
+        if user.delete_on is None or user.delete_on > deletion_cutoff():
+            LOG.i(f"{user} is not due for deletion anymore, skip")
+            return
+
+        LOG.i(
+            f"Scheduled deletion of user {user} with scheduled delete on {user.delete_on}"
+        )
+        emit_user_audit_log(
+            user=user,
+            action=UserAuditLogAction.DeleteUser,
+            message=f"Delete user {user.id} ({user.email})",
+        )
+        User.delete(user.id)
+        Session.commit()
+        record_custom_metric("Custom/scheduled_user_deleted", 1, kind=COUNTER)
+
+    @staticmethod
+    def create_from_job(job: Job) -> Optional[DeleteScheduledUserJob]:
+        user = User.get(job.payload["user_id"])
+        if not user:
+            return None
+
+        return DeleteScheduledUserJob(user)
+
+    def store_job_in_db(self) -> Job:
+        return Job.create(
+            name=JobType.DELETE_SCHEDULED_USER.value,
+            payload={"user_id": self._user.id},
+            priority=JobPriority.Low,
+            run_at=arrow.now(),
+            commit=True,
+        )
+
+
+def schedule_user_deletions(dry_run: bool = False) -> int:
+    """Create a deletion job for each user whose grace period has expired.
+
+    The users that already have a pending job are skipped, so it can be run again after a crash.
+    At most config.MAX_PENDING_USER_DELETION_JOBS jobs are pending at the same time, the
+    remaining users are scheduled by the next runs. Return the number of created jobs"""
+    already_scheduled = {
+        job.payload["user_id"] for job in pending_deletion_jobs_query()
+    }
+    remaining = config.MAX_PENDING_USER_DELETION_JOBS - len(already_scheduled)
+    cutoff = deletion_cutoff()
+
+    created = 0
+    last_id = 0
+    while remaining > 0:
+        rows = (
+            Session.query(User.id, User.delete_on)
+            .filter(due_users_condition(cutoff), User.id > last_id)
+            .order_by(User.id)
+            .limit(_SCHEDULE_BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        jobs: List[dict] = []
+        for user_id, delete_on in rows:
+            if user_id in already_scheduled:
+                continue
+            LOG.i(f"Schedule deletion of user {user_id} with delete on {delete_on}")
+            jobs.append(
+                {
+                    "created_at": arrow.utcnow(),
+                    "name": JobType.DELETE_SCHEDULED_USER.value,
+                    "payload": {"user_id": user_id},
+                    "state": JobState.ready.value,
+                    "attempts": 0,
+                    "taken": False,
+                    "priority": JobPriority.Low,
+                    "run_at": arrow.now(),
+                }
+            )
+            if len(jobs) >= remaining:
+                break
+
+        if jobs and not dry_run:
+            Session.execute(Job.__table__.insert().values(jobs))
+            Session.commit()
+        created += len(jobs)
+        remaining -= len(jobs)
+
+    return created
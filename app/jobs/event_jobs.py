@@ -1,8 +1,7 @@
-import newrelic.agent
-
 from app.events.event_dispatcher import EventDispatcher, Dispatcher
 from app.events.generated.event_pb2 import EventContent, AliasCreated, AliasCreatedList
 from app.log import LOG
+from app.metrics import SIZE_BUCKETS, record_custom_metric
 from app.models import User, Alias
 
 
@@ -37,8 +36,10 @@ def send_alias_creation_events_for_user(
                 EventContent(alias_create_list=AliasCreatedList(events=event_list)),
                 dispatcher=dispatcher,
             )
-            newrelic.agent.record_custom_metric(
-                "Custom/event_alias_created_event", len(event_list)
+            record_custom_metric(
+                "Custom/event_alias_created_event",
+                len(event_list),
+                buckets=SIZE_BUCKETS,
             )
             event_list = []
     if len(event_list) > 0:
@@ -48,6 +49,6 @@ def send_alias_creation_events_for_user(
             EventContent(alias_create_list=AliasCreatedList(events=event_list)),
             dispatcher=dispatcher,
         )
-        newrelic.agent.record_custom_metric(
-            "Custom/event_alias_created_event", len(event_list)
+        record_custom_metric(
+            "Custom/event_alias_created_event", len(event_list), buckets=SIZE_BUCKETS
         )
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
 import json
+import os
+import tempfile
 import zipfile
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from io import BytesIO
-from typing import List, Dict, Optional
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
 
 import arrow
 import sqlalchemy
 
+from app import config, s3
 from app.constants import JobType
 from app.db import Session
 from app.email import headers
@@ -21,6 +23,7 @@ from app.email_utils import (
     get_noreply_address,
     get_noreply_domain,
 )
+from app.log import LOG
 from app.mail_sender import sl_sendmail
 from app.models import (
     Alias,
@@ -38,6 +41,7 @@ from app.models import (
     Job,
     JobState,
 )
+from app.utils import random_string
 
 
 class ExportUserDataJob:
@@ -50,22 +54,25 @@ class ExportUserDataJob:
     def __init__(self, user: User):
         self._user: User = user
 
-    def _get_paginated_model(self, model_class, page_size=50) -> List:
-        objects = []
-        page = 0
-        db_objects = []
-        while page == 0 or len(db_objects) == page_size:
+    def _iter_model(self, model_class, page_size=1000) -> Iterator:
+        """Yield the user objects of model_class with keyset pagination.
+        The session only keeps weak references to unmodified objects so memory stays constant"""
+        last_id = 0
+        while True:
             db_objects = (
                 Session.query(model_class)
-                .filter(model_class.user_id == self._user.id)
+                .filter(model_class.user_id == self._user.id, model_class.id > last_id)
                 .order_by(model_class.id)
                 .limit(page_size)
-                .offset(page * page_size)
                 .all()
             )
-            objects.extend(db_objects)
-            page += 1
-        return objects
+            yield from db_objects
+            if len(db_objects) < page_size:
+                return
+            last_id = db_objects[-1].id
+
+    def _get_paginated_model(self, model_class, page_size=50) -> List:
+        return list(self._iter_model(model_class, page_size))
 
     def _get_aliases(self) -> List[Alias]:
         return self._get_paginated_model(Alias)
@@ -103,54 +110,101 @@ class ExportUserDataJob:
             data[column.name] = value
         return data
 
-    def _build_zip(self) -> BytesIO:
-        memfile = BytesIO()
-        with zipfile.ZipFile(memfile, "w", zipfile.ZIP_DEFLATED) as zf:
+    @classmethod
+    def _write_json_list(cls, f: BinaryIO, model_objs: Iterable[Base]):
+        """Write the objects as a JSON list, one object at a time"""
+        f.write(b"[")
+        for i, model_obj in enumerate(model_objs):
+            if i > 0:
+                f.write(b", ")
+            f.write(json.dumps(cls._model_to_dict(model_obj)).encode())
+        f.write(b"]")
+
+    def _build_zip(self) -> BinaryIO:
+        """Build the zip in a temporary file, the data is streamed from the database"""
+        tmp_file = tempfile.TemporaryFile(dir=config.TEMP_DIR)
+        with zipfile.ZipFile(tmp_file, "w", zipfile.ZIP_DEFLATED) as zf:
             zf.writestr(
                 "user.json", json.dumps(ExportUserDataJob._model_to_dict(self._user))
             )
-            for model_name, get_models in [
-                ("aliases", self._get_aliases),
-                ("mailboxes", self._get_mailboxes),
-                ("contacts", self._get_contacts),
-                ("directories", self._get_directories),
-                ("domains", self._get_domains),
-                ("email_logs", self._get_email_logs),
+            for model_name, model_class in [
+                ("aliases", Alias),
+                ("mailboxes", Mailbox),
+                ("contacts", Contact),
+                ("directories", Directory),
+                ("domains", CustomDomain),
+                ("email_logs", EmailLog),
                 # not include RefusedEmail as they are not usable by user and are automatically deleted
-                # ("refused_emails", self._get_refused_emails),
+                # ("refused_emails", RefusedEmail),
             ]:
-                model_objs = get_models()
-                data = json.dumps(
-                    [
-                        ExportUserDataJob._model_to_dict(model_obj)
-                        for model_obj in model_objs
-                    ]
-                )
-                zf.writestr(f"{model_name}.json", data)
-        memfile.seek(0)
-        return memfile
+                with zf.open(f"{model_name}.json", "w", force_zip64=True) as f:
+                    self._write_json_list(f, self._iter_model(model_class))
+        tmp_file.seek(0)
+        return tmp_file
+
+    def _upload_zip(self, zipped_contents: BinaryIO) -> str:
+        """Upload the zip and return a temporary download url.
+        The archive is deleted by a DELETE_USER_EXPORT job once the url has expired"""
+        key = f"export/{self._user.id}/{random_string(30)}/user_report.zip"
+        s3.upload_from_file(key, zipped_contents, content_type="application/zip")
+        Job.create(
+            name=JobType.DELETE_USER_EXPORT.value,
+            payload={"key": key},
+            run_at=arrow.now().shift(days=config.EXPORT_USER_DATA_LINK_EXPIRATION_DAYS),
+            commit=True,
+        )
+        return s3.get_url(
+            key,
+            expires_in=config.EXPORT_USER_DATA_LINK_EXPIRATION_DAYS * 24 * 3600,
+        )
+
+    @staticmethod
+    def delete_upload(job: Job):
+        """Run the DELETE_USER_EXPORT job: delete the archive uploaded by _upload_zip"""
+        key = job.payload["key"]
+        if s3.delete_many([key]):
+            # the job is retried
+            raise Exception(f"Cannot delete the user export {key}")
+        LOG.i(f"Deleted the user export {key}")
 
     def run(self):
         if not self._user.can_send_or_receive():
             return
 
-        zipped_contents = self._build_zip()
-
-        to_email = self._user.email
-
-        msg = MIMEMultipart()
-        msg[headers.SUBJECT] = "Your SimpleLogin data"
-        msg[headers.FROM] = get_noreply_address(self._user)
-        msg[headers.TO] = to_email
-        msg.attach(
-            MIMEText(render("transactional/user-report.html", user=self._user), "html")
-        )
-        attachment = MIMEApplication(zipped_contents.read())
-        attachment.add_header(
-            "Content-Disposition", "attachment", filename="user_report.zip"
-        )
-        attachment.add_header("Content-Type", "application/zip")
-        msg.attach(attachment)
+        with self._build_zip() as zipped_contents:
+            zip_size = os.fstat(zipped_contents.fileno()).st_size
+            download_url = None
+            # local uploads are served from the public static dir without expiration
+            if (
+                zip_size > config.EXPORT_USER_DATA_ATTACHMENT_MAX_SIZE
+                and not config.LOCAL_FILE_UPLOAD
+            ):
+                download_url = self._upload_zip(zipped_contents)
+
+            to_email = self._user.email
+
+            msg = MIMEMultipart()
+            msg[headers.SUBJECT] = "Your SimpleLogin data"
+            msg[headers.FROM] = get_noreply_address(self._user)
+            msg[headers.TO] = to_email
+            msg.attach(
+                MIMEText(
+                    render(
+                        "transactional/user-report.html",
+                        user=self._user,
+                        download_url=download_url,
+                        expiration_days=config.EXPORT_USER_DATA_LINK_EXPIRATION_DAYS,
+                    ),
+                    "html",
+                )
+            )
+            if not download_url:
+                attachment = MIMEApplication(zipped_contents.read())
+                attachment.add_header(
+                    "Content-Disposition", "attachment", filename="user_report.zip"
+                )
+                attachment.add_header("Content-Type", "application/zip")
+                msg.attach(attachment)
 
         # add DKIM
         email_domain = get_noreply_domain(self._user)
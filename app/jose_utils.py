@@ -1,20 +1,65 @@
 import base64
 import hashlib
+import json
+from functools import lru_cache
 from typing import Optional
 
 import arrow
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
 from jwcrypto import jwk, jwt
 
 from app.config import OPENID_PRIVATE_KEY_PATH, URL
 from app.log import LOG
 from app.models import ClientUser
 
-with open(OPENID_PRIVATE_KEY_PATH, "rb") as f:
-    _key = jwk.JWK.from_pem(f.read())
+
+@lru_cache(maxsize=None)
+def _get_key() -> jwk.JWK:
+    """Read the OpenID key on first use, the processes that don't issue tokens skip it"""
+    with open(OPENID_PRIVATE_KEY_PATH, "rb") as f:
+        return jwk.JWK.from_pem(f.read())
+
+
+@lru_cache(maxsize=None)
+def _get_public_params() -> dict:
+    return _get_key()._public_params()
 
 
 def get_jwk_key() -> dict:
-    return _key._public_params()
+    return dict(_get_public_params())
+
+
+@lru_cache(maxsize=None)
+def get_jwks_json() -> str:
+    """The /jwks response, the key doesn't change for the lifetime of the process"""
+    return json.dumps({"keys": [_get_public_params()]})
+
+
+@lru_cache(maxsize=None)
+def _get_signer():
+    """The encoded JWS header and the private key, jwcrypto rebuilds the key on every
+    signature otherwise"""
+    header = {"alg": "RS256", "kid": _get_public_params()["kid"]}
+    return _b64encode(_to_json(header)), _get_key().get_op_key("sign")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _to_json(data: dict) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def _sign(claims: dict) -> str:
+    """Compact RS256 JWS, same as jwt.JWT(header=..., claims=claims).make_signed_token()"""
+    encoded_header, private_key = _get_signer()
+    signing_input = f"{encoded_header}.{_b64encode(_to_json(claims))}"
+    signature = private_key.sign(
+        signing_input.encode(), padding.PKCS1v15(), hashes.SHA256()
+    )
+    return f"{signing_input}.{_b64encode(signature)}"
 
 
 def make_id_token(
@@ -31,13 +76,14 @@ def make_id_token(
     - exp
     - iat
     """
+    now = arrow.now()
     claims = {
         "iss": URL,
         "sub": str(client_user.id),
         "aud": client_user.client.oauth_client_id,
-        "exp": arrow.now().shift(hours=1).timestamp,
-        "iat": arrow.now().timestamp,
-        "auth_time": arrow.now().timestamp,
+        "exp": now.shift(hours=1).timestamp,
+        "iat": now.timestamp,
+        "auth_time": now.timestamp,
     }
 
     if nonce:
@@ -51,16 +97,12 @@ def make_id_token(
 
     claims = {**claims, **client_user.get_user_info()}
 
-    jwt_token = jwt.JWT(
-        header={"alg": "RS256", "kid": _key._public_params()["kid"]}, claims=claims
-    )
-    jwt_token.make_signed_token(_key)
-    return jwt_token.serialize()
+    return _sign(claims)
 
 
 def verify_id_token(id_token) -> bool:
     try:
-        jwt.JWT(key=_key, jwt=id_token)
+        jwt.JWT(key=_get_key(), jwt=id_token)
     except Exception:
         LOG.e("id token not verified")
         return False
@@ -69,7 +111,7 @@ def verify_id_token(id_token) -> bool:
 
 
 def decode_id_token(id_token) -> jwt.JWT:
-    return jwt.JWT(key=_key, jwt=id_token)
+    return jwt.JWT(key=_get_key(), jwt=id_token)
 
 
 def id_token_hash(value, hashfunc=hashlib.sha256):
@@ -0,0 +1,87 @@
+"""
+Per process cache of the users loaded by Flask-Login from the session cookie.
+
+The column values of the user are kept for LOGIN_USER_CACHE_TTL seconds, keyed by
+alternative_id, and attached to the request session as a persistent User without a SELECT.
+An entry is dropped as soon as the cache_versions stamps of the user change, i.e. once a change
+to the user (alternative_id regenerated, account disabled or deleted, ...) is committed.
+Without Redis this change isn't seen by the other processes so the users are always loaded
+from the database.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import make_transient_to_detached
+
+from app import cache_versions, config
+from app.db import Session
+from app.metrics import COUNTER, record_custom_metric
+from app.models import User
+
+_MAX_ENTRIES = 10000
+
+# alternative id -> (user id, version stamps, expiration timestamp, column values)
+_entries: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+
+def _snapshot(user: User) -> dict:
+    loaded = sa.inspect(user).dict
+    return {
+        attr.key: loaded[attr.key]
+        for attr in sa.inspect(User).column_attrs
+        if attr.key in loaded
+    }
+
+
+def _attach(values: dict) -> User:
+    user = User(**values)
+    # as if just loaded from the database, the missing attributes are loaded on access
+    make_transient_to_detached(user)
+    return Session.merge(user, load=False)
+
+
+def get_login_user(alternative_id: str) -> Optional[User]:
+    if not cache_versions.is_enabled():
+        return User.get_by(alternative_id=alternative_id)
+
+    versions = None
+    with _lock:
+        entry = _entries.get(alternative_id)
+    if entry:
+        user_id, entry_versions, expires_at, values = entry
+        versions = cache_versions.get_versions(user_id)
+        if (
+            versions is not None
+            and versions == entry_versions
+            and expires_at > time.time()
+        ):
+            record_custom_metric("Custom/login_user_cache_hit", 1, kind=COUNTER)
+            return _attach(values)
+
+    record_custom_metric("Custom/login_user_cache_miss", 1, kind=COUNTER)
+    user = User.get_by(alternative_id=alternative_id)
+    if not user:
+        with _lock:
+            _entries.pop(alternative_id, None)
+        return None
+
+    # the stamps are read after the user for a first entry, a change committed in between
+    # is only seen once the entry expires
+    if versions is None:
+        versions = cache_versions.get_versions(user.id)
+    if versions is not None:
+        with _lock:
+            _entries[alternative_id] = (
+                user.id,
+                versions,
+                time.time() + config.LOGIN_USER_CACHE_TTL,
+                _snapshot(user),
+            )
+            _entries.move_to_end(alternative_id)
+            while len(_entries) > _MAX_ENTRIES:
+                _entries.popitem(last=False)
+    return user
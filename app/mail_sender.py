@@ -21,6 +21,7 @@ from app import config
 from app.email import headers
 from app.log import LOG
 from app.message_utils import message_to_bytes, message_format_base64_parts
+from app.metrics import SIZE_BUCKETS, record_custom_metric
 
 
 @dataclass
@@ -165,12 +166,10 @@ class MailSender:
                 LOG.w(f"Got error {e} while sending email to {server_hostname}")
                 newrelic.agent.record_custom_event("SmtpError", {"error": e.__class__})
             finally:
-                newrelic.agent.record_custom_metric(
-                    "Custom/smtp_servers_tried", servers_tried
-                )
-                newrelic.agent.record_custom_metric(
-                    "Custom/smtp_sending_time", time.time() - start
+                record_custom_metric(
+                    "Custom/smtp_servers_tried", servers_tried, buckets=SIZE_BUCKETS
                 )
+                record_custom_metric("Custom/smtp_sending_time", time.time() - start)
         if retries > 0:
             LOG.warning(
                 f"Retrying sending email due to error. {retries} retries left. Will wait {0.3*retries} seconds."
@@ -206,7 +205,7 @@ class MailSender:
             LOG.d(
                 f"Getting a smtp connection to {server_host}:{server_port} takes seconds {elapsed:.3} seconds"
             )
-            newrelic.agent.record_custom_metric("Custom/smtp_connection_time", elapsed)
+            record_custom_metric("Custom/smtp_connection_time", elapsed)
 
             # smtp.send_message has UnicodeEncodeError
             # encode message raw directly instead
@@ -4,14 +4,17 @@ import uuid
 from email.message import Message
 from enum import Enum
 from io import BytesIO
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
 
 import arrow
 from aiosmtpd.smtp import Envelope
+from sqlalchemy import and_, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 
 from app import config, s3
 from app.abuser_audit_log_utils import emit_abuser_audit_log, AbuserAuditLogAction
+from app.alias_audit_log_utils import AliasAuditLogAction, emit_bulk_alias_audit_log
 from app.constants import JobType
 from app.db import Session
 from app.email import headers
@@ -42,6 +45,9 @@ from app.models import (
 from app.user_audit_log_utils import emit_user_audit_log, UserAuditLogAction
 from app.utils import canonicalize_email, sanitize_email
 
+# number of aliases moved at once when a mailbox is deleted
+MAILBOX_TRANSFER_BATCH_SIZE = 500
+
 
 @dataclasses.dataclass
 class CreateMailboxOutput:
@@ -192,6 +198,102 @@ def delete_mailbox(
     return mailbox
 
 
+def transfer_mailbox_aliases(
+    mailbox: Mailbox,
+    transfer_mailbox: Mailbox,
+    batch_size: int = MAILBOX_TRANSFER_BATCH_SIZE,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Move all the aliases of mailbox to transfer_mailbox with set based updates on alias and
+    alias_mailbox, batch_size aliases at a time with a commit after each batch.
+    on_progress is called after each batch with the number of transferred aliases.
+    Return the number of transferred aliases
+    """
+    linked_alias_ids = Session.query(AliasMailbox.alias_id).filter(
+        AliasMailbox.mailbox_id == mailbox.id
+    )
+    message = (
+        f"Mailbox {mailbox.id} ({mailbox.email}) replaced by "
+        f"{transfer_mailbox.id} ({transfer_mailbox.email})"
+    )
+
+    count = 0
+    last_id = 0
+    while True:
+        alias_ids = [
+            alias_id
+            for (alias_id,) in Session.query(Alias.id)
+            .filter(
+                or_(Alias.mailbox_id == mailbox.id, Alias.id.in_(linked_alias_ids)),
+                Alias.id > last_id,
+            )
+            .order_by(Alias.id)
+            .limit(batch_size)
+        ]
+        if not alias_ids:
+            break
+
+        # the transfer mailbox replaces the deleted one as main mailbox
+        Alias.filter(Alias.id.in_(alias_ids), Alias.mailbox_id == mailbox.id).update(
+            {Alias.mailbox_id: transfer_mailbox.id}, synchronize_session=False
+        )
+        # and replaces it in the other mailboxes, if it's not the main mailbox already
+        Session.execute(
+            insert(AliasMailbox.__table__)
+            .from_select(
+                ["created_at", "alias_id", "mailbox_id"],
+                select(
+                    [
+                        literal(arrow.utcnow().naive),
+                        AliasMailbox.alias_id,
+                        literal(transfer_mailbox.id),
+                    ]
+                )
+                .select_from(
+                    AliasMailbox.__table__.join(
+                        Alias.__table__, Alias.id == AliasMailbox.alias_id
+                    )
+                )
+                .where(
+                    and_(
+                        AliasMailbox.alias_id.in_(alias_ids),
+                        AliasMailbox.mailbox_id == mailbox.id,
+                        Alias.mailbox_id != transfer_mailbox.id,
+                    )
+                ),
+            )
+            .on_conflict_do_nothing(constraint="uq_alias_mailbox")
+        )
+        AliasMailbox.filter(
+            AliasMailbox.alias_id.in_(alias_ids),
+            or_(
+                AliasMailbox.mailbox_id == mailbox.id,
+                and_(
+                    AliasMailbox.mailbox_id == transfer_mailbox.id,
+                    AliasMailbox.alias_id.in_(
+                        Session.query(Alias.id).filter(
+                            Alias.id.in_(alias_ids),
+                            Alias.mailbox_id == transfer_mailbox.id,
+                        )
+                    ),
+                ),
+            ),
+        ).delete(synchronize_session=False)
+        emit_bulk_alias_audit_log(
+            alias_ids, AliasAuditLogAction.ChangedMailboxes, message
+        )
+        Session.commit()
+
+        count += len(alias_ids)
+        last_id = alias_ids[-1]
+        LOG.i(f"Transferred {count} aliases from {mailbox} to {transfer_mailbox}")
+        if on_progress:
+            on_progress(count)
+
+    return count
+
+
 def clear_activation_codes_for_mailbox(mailbox: Mailbox):
     Session.query(MailboxActivation).filter(
         MailboxActivation.mailbox_id == mailbox.id
@@ -0,0 +1,173 @@
+import arrow
+from sqlalchemy import func
+
+from app.db import Session, read_replica
+from app.errors import ProtonPartnerNotSetUp
+from app.log import LOG
+from app.models import (
+    Alias,
+    AppleSubscription,
+    Bounce,
+    Client,
+    CoinbaseSubscription,
+    CustomDomain,
+    DeletedDirectory,
+    DeletedSubdomain,
+    Directory,
+    EmailLog,
+    ManualSubscription,
+    Metric2,
+    PartnerSubscription,
+    PartnerUser,
+    Subscription,
+    User,
+)
+from app.proton.proton_partner import get_proton_partner
+
+
+def _count(condition=None):
+    """COUNT(*) FILTER (WHERE condition), to compute several counters in one table scan"""
+    if condition is None:
+        return func.count()
+    return func.count().filter(condition)
+
+
+def _user_metrics(now: arrow.Arrow) -> dict:
+    nb_user, nb_activated_user, nb_referred_user, nb_referred_user_paid = (
+        Session.query(
+            _count(),
+            _count(User.activated),
+            _count(User.referral_id.isnot(None)),
+            _count(User.referral_id.isnot(None) & User.paid_condition(now)),
+        )
+        .select_from(User)
+        .one()
+    )
+    return {
+        "nb_user": nb_user,
+        "nb_activated_user": nb_activated_user,
+        "nb_referred_user": nb_referred_user,
+        "nb_referred_user_paid": nb_referred_user_paid,
+    }
+
+
+def _subscription_metrics(now: arrow.Arrow) -> dict:
+    nb_premium, nb_cancelled_premium = (
+        Session.query(
+            _count(Subscription.cancelled.is_(False)),
+            _count(Subscription.cancelled.is_(True)),
+        )
+        .select_from(Subscription)
+        .one()
+    )
+    nb_manual_premium = (
+        Session.query(_count())
+        .filter(
+            ManualSubscription.end_at > now,
+            ManualSubscription.is_giveaway.is_(False),
+        )
+        .scalar()
+    )
+    nb_coinbase_premium = (
+        Session.query(_count()).filter(CoinbaseSubscription.end_at > now).scalar()
+    )
+    return {
+        "nb_premium": nb_premium,
+        "nb_cancelled_premium": nb_cancelled_premium,
+        # todo: filter by expires_date > now
+        "nb_apple_premium": Session.query(_count())
+        .select_from(AppleSubscription)
+        .scalar(),
+        "nb_manual_premium": nb_manual_premium,
+        "nb_coinbase_premium": nb_coinbase_premium,
+    }
+
+
+def _proton_metrics(now: arrow.Arrow) -> dict:
+    try:
+        proton_partner = get_proton_partner()
+    except ProtonPartnerNotSetUp:
+        LOG.d("Proton partner not set up")
+        return {"nb_proton_user": 0, "nb_proton_premium": 0}
+
+    nb_proton_user, nb_proton_premium = (
+        Session.query(
+            func.count(func.distinct(PartnerUser.id)),
+            _count(PartnerSubscription.end_at > now),
+        )
+        .select_from(PartnerUser)
+        .outerjoin(
+            PartnerSubscription, PartnerSubscription.partner_user_id == PartnerUser.id
+        )
+        .filter(PartnerUser.partner_id == proton_partner.id)
+        .one()
+    )
+    return {"nb_proton_user": nb_proton_user, "nb_proton_premium": nb_proton_premium}
+
+
+def _email_log_metrics(since: arrow.Arrow) -> dict:
+    # only scans the last 24h thanks to ix_email_log_created_at
+    nb_forward, nb_bounced, nb_reply, nb_block = (
+        Session.query(
+            _count(
+                EmailLog.bounced.is_(False)
+                & EmailLog.is_spam.is_(False)
+                & EmailLog.is_reply.is_(False)
+                & EmailLog.blocked.is_(False)
+            ),
+            _count(EmailLog.bounced.is_(True)),
+            _count(EmailLog.is_reply.is_(True)),
+            _count(EmailLog.blocked.is_(True)),
+        )
+        .filter(EmailLog.created_at > since)
+        .one()
+    )
+    return {
+        "nb_forward_last_24h": nb_forward,
+        "nb_bounced_last_24h": nb_bounced,
+        "nb_reply_last_24h": nb_reply,
+        "nb_block_last_24h": nb_block,
+        "nb_total_bounced_last_24h": Session.query(_count())
+        .filter(Bounce.created_at > since)
+        .scalar(),
+    }
+
+
+def _other_metrics() -> dict:
+    nb_verified_custom_domain, nb_subdomain = (
+        Session.query(
+            _count(CustomDomain.verified.is_(True)),
+            _count(CustomDomain.is_sl_subdomain.is_(True)),
+        )
+        .select_from(CustomDomain)
+        .one()
+    )
+    return {
+        "nb_alias": Session.query(_count()).select_from(Alias).scalar(),
+        "nb_verified_custom_domain": nb_verified_custom_domain,
+        "nb_subdomain": nb_subdomain,
+        "nb_directory": Session.query(_count()).select_from(Directory).scalar(),
+        "nb_deleted_directory": Session.query(_count())
+        .select_from(DeletedDirectory)
+        .scalar(),
+        "nb_deleted_subdomain": Session.query(_count())
+        .select_from(DeletedSubdomain)
+        .scalar(),
+        "nb_app": Session.query(_count()).select_from(Client).scalar(),
+    }
+
+
+def compute_metric2() -> Metric2:
+    """Compute the Metric2 counters with one scan per table,
+    the paid status of referred users being evaluated in SQL"""
+    now = arrow.now()
+
+    metrics = {}
+    with read_replica():
+        metrics.update(_user_metrics(now))
+        metrics.update(_subscription_metrics(now))
+        metrics.update(_proton_metrics(now))
+        metrics.update(_email_log_metrics(now.shift(days=-1)))
+        metrics.update(_other_metrics())
+
+    return Metric2.create(date=now, commit=True, **metrics)
@@ -0,0 +1,226 @@
+"""
+In process metrics registry: counters, gauges and histograms with labels, rendered in the
+OpenMetrics text format on a local /metrics endpoint by the long-running services (email
+handler, job runner, event listener) when METRICS_PORT is set.
+
+record_custom_metric() replaces newrelic.agent.record_custom_metric(): the value still goes
+to New Relic and is also recorded in a metric named after the New Relic one,
+e.g. Custom/email_handler_time -> sl_email_handler_time. Durations go to a histogram by
+default, counts and current values (queue depth, connections) must give their kind.
+"""
+import re
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+
+import newrelic.agent
+
+from app import config
+from app.log import LOG
+
+# seconds, from fast queries to slow emails
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# number of items: recipients, events per commit, ...
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# record_custom_metric() kinds
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra=()) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [
+            f"# TYPE {self.name} {self.type}",
+            f"# HELP {self.name} {self.documentation}",
+        ]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.extend(self._render_value(key, value))
+        return "\n".join(lines)
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # per bucket counts, the last one is +Inf, then the sum
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def _render_value(self, key, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", bound)])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"{name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, documentation, labelnames, buckets=buckets
+        )
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join([metric.render() for metric in metrics] + ["# EOF", ""])
+
+
+REGISTRY = Registry()
+
+
+def _registry_name(newrelic_name: str) -> str:
+    name = newrelic_name.removeprefix("Custom/")
+    return "sl_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def record_custom_metric(
+    name: str,
+    value: float,
+    kind: str = HISTOGRAM,
+    buckets: Sequence[float] = LATENCY_BUCKETS,
+    labels: Optional[Dict[str, object]] = None,
+):
+    """Send the metric to New Relic and record it in REGISTRY: a COUNTER is incremented by
+    value, a GAUGE is set to value and a HISTOGRAM observes value in buckets.
+    The label values are appended to the New Relic name, e.g. Custom/db_replica_lag/0, and
+    are labels of the single registry metric"""
+    labels = labels or {}
+    newrelic_name = "/".join([name] + [str(label) for label in labels.values()])
+    newrelic.agent.record_custom_metric(newrelic_name, value)
+    registry_name = _registry_name(name)
+    documentation = f"New Relic metric {name}"
+    labelnames = list(labels)
+    if kind == COUNTER:
+        REGISTRY.counter(registry_name, documentation, labelnames).inc(value, **labels)
+    elif kind == GAUGE:
+        REGISTRY.gauge(registry_name, documentation, labelnames).set(value, **labels)
+    elif kind == HISTOGRAM:
+        REGISTRY.histogram(
+            registry_name, documentation, labelnames, buckets=buckets
+        ).observe(value, **labels)
+    else:
+        raise ValueError(f"Unknown metric kind {kind}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", _CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scraped every few seconds, don't flood the logs
+        pass
+
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread if a port is given or configured"""
+    port = port or config.METRICS_PORT
+    if not port:
+        return None
+    server = ThreadingHTTPServer((config.METRICS_HOST, port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    LOG.i("Serve the metrics on %s:%s/metrics", config.METRICS_HOST, port)
+    return server
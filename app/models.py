@@ -350,6 +350,30 @@ class HibpNotifiedAlias(Base, ModelMixin):
     __table_args__ = (sa.Index("ix_hibp_notified_alias_user_id", "user_id"),)
 
 
+class HibpPendingNotification(Base, ModelMixin):
+    """Breached aliases whose owner hasn't been notified yet.
+    Filled by the HIBP check, emptied by the notification cron once the user has been notified.
+    """
+
+    __tablename__ = "hibp_pending_notification"
+    alias_id = sa.Column(
+        sa.ForeignKey("alias.id", ondelete="cascade"), nullable=False, unique=True
+    )
+    user_id = sa.Column(sa.ForeignKey("users.id", ondelete="cascade"), nullable=False)
+
+    __table_args__ = (sa.Index("ix_hibp_pending_notification_user_id", "user_id"),)
+
+
+class HibpScanCursor(Base, ModelMixin):
+    """Progress of the HIBP scan: all candidate aliases with id < last_alias_id have been checked.
+    Allow a restarted scan to continue where it stopped. There is at most one row.
+    """
+
+    __tablename__ = "hibp_scan_cursor"
+
+    last_alias_id = sa.Column(sa.Integer, nullable=False, default=0)
+
+
 class Fido(Base, ModelMixin):
     __tablename__ = "fido"
     credential_id = sa.Column(sa.String(), nullable=False, unique=True, index=True)
@@ -776,10 +800,14 @@ class User(Base, ModelMixin, UserMixin, PasswordOracle):
         EventDispatcher.send_event(user, EventContent(user_deleted=UserDeleted()))
 
         # Manually delete all aliases for the user that is about to be deleted
-        from app.alias_delete import delete_alias
+        from app.alias_delete import bulk_perform_alias_deletion
 
-        for alias in Alias.filter_by(user_id=user.id):
-            delete_alias(alias, user, AliasDeleteReason.UserHasBeenDeleted)
+        # with commit=False, the user is deleted in a single transaction with its aliases
+        bulk_perform_alias_deletion(
+            Alias.user_id == user.id,
+            AliasDeleteReason.UserHasBeenDeleted,
+            commit=commit,
+        )
 
         res = super(User, cls).delete(obj_id)
         if commit:
@@ -862,6 +890,60 @@ class User(Base, ModelMixin, UserMixin, PasswordOracle):
 
         return True
 
+    @staticmethod
+    def paid_condition(now: Arrow):
+        """SQL equivalent of is_paid(), to count paid users without loading them.
+        As in get_active_subscription(), an active giveaway manual subscription hides
+        the coinbase and partner subscriptions.
+        """
+        paddle_sub = sa.exists().where(
+            and_(
+                Subscription.user_id == User.id,
+                Subscription.next_bill_date
+                >= now.shift(days=-PADDLE_SUBSCRIPTION_GRACE_DAYS).date(),
+            )
+        )
+        apple_sub = sa.exists().where(
+            and_(
+                AppleSubscription.user_id == User.id,
+                AppleSubscription.expires_date
+                > now.shift(days=-_APPLE_GRACE_PERIOD_DAYS),
+            )
+        )
+        manual_sub = sa.exists().where(
+            and_(ManualSubscription.user_id == User.id, ManualSubscription.end_at > now)
+        )
+        paid_manual_sub = sa.exists().where(
+            and_(
+                ManualSubscription.user_id == User.id,
+                ManualSubscription.end_at > now,
+                ManualSubscription.is_giveaway.is_(False),
+            )
+        )
+        coinbase_sub = sa.exists().where(
+            and_(
+                CoinbaseSubscription.user_id == User.id,
+                CoinbaseSubscription.end_at > now,
+            )
+        )
+        partner_sub = sa.exists().where(
+            and_(
+                PartnerUser.user_id == User.id,
+                PartnerSubscription.partner_user_id == PartnerUser.id,
+                or_(
+                    PartnerSubscription.lifetime,
+                    PartnerSubscription.end_at
+                    > now.shift(days=-_PARTNER_SUBSCRIPTION_GRACE_DAYS),
+                ),
+            )
+        )
+        return or_(
+            paddle_sub,
+            apple_sub,
+            paid_manual_sub,
+            and_(~manual_sub, or_(coinbase_sub, partner_sub)),
+        )
+
     def is_active(self) -> bool:
         if self.delete_on is None:
             return True
@@ -1257,10 +1339,14 @@ class User(Base, ModelMixin, UserMixin, PasswordOracle):
             > 0
         )
 
-    def get_random_alias_suffix(self, custom_domain: Optional["CustomDomain"] = None):
+    def get_random_alias_suffix(
+        self,
+        custom_domain: Optional["CustomDomain"] = None,
+        is_custom_domain: bool = False,
+    ):
         """Get random suffix for an alias based on user's preference.
 
-        Use a shorter suffix in case of custom domain
+        Use a shorter suffix in case of custom domain, either given or flagged by is_custom_domain
 
         Returns:
             str: the random suffix generated
@@ -1268,7 +1354,7 @@ class User(Base, ModelMixin, UserMixin, PasswordOracle):
         if self.random_alias_suffix == AliasSuffixEnum.random_string.value:
             return random_string(config.ALIAS_RANDOM_SUFFIX_LENGTH, include_digits=True)
 
-        if custom_domain is None:
+        if custom_domain is None and not is_custom_domain:
             return random_words(1, 3)
 
         return random_words(1)
@@ -1694,6 +1780,15 @@ class Alias(Base, ModelMixin):
 
     last_email_log_id = sa.Column(sa.Integer, default=None, nullable=True)
 
+    # greatest(created_at, latest email log created_at), kept up to date by EmailLog.create
+    # used to paginate the alias list by keyset
+    last_activity_at = sa.Column(
+        ArrowType,
+        default=arrow.utcnow,
+        server_default=text("(now() at time zone 'utc')"),
+        nullable=False,
+    )
+
     delete_on = sa.Column(ArrowType, default=None, server_default=None, nullable=True)
     delete_reason = sa.Column(
         IntEnumType(AliasDeleteReason),
@@ -1711,8 +1806,28 @@ class Alias(Base, ModelMixin):
             postgresql_ops={"note": "gin_trgm_ops"},
             postgresql_using="gin",
         ),
+        # indexes used by app.alias_search
+        Index(
+            "ix_alias_email_trgm_idx",
+            "email",
+            postgresql_ops={"email": "gin_trgm_ops"},
+            postgresql_using="gin",
+        ),
+        Index(
+            "ix_alias_name_trgm_idx",
+            "name",
+            postgresql_ops={"name": "gin_trgm_ops"},
+            postgresql_using="gin",
+        ),
         Index("ix_alias_original_owner_id", "original_owner_id"),
         Index("ix_alias_delete_on", "delete_on"),
+        Index(
+            "ix_alias_user_id_pinned_last_activity_at_id",
+            "user_id",
+            "pinned",
+            "last_activity_at",
+            "id",
+        ),
     )
 
     user = orm.relationship(User, foreign_keys=[user_id])
@@ -1787,13 +1902,10 @@ class Alias(Base, ModelMixin):
             {"alias_id": alias_id},
         )
 
-    @classmethod
-    def create(cls, **kw):
-        commit = kw.pop("commit", False)
-        flush = kw.pop("flush", False)
-
-        new_alias = cls(**kw)
-        user = User.get(new_alias.user_id)
+    @staticmethod
+    def check_create_rate_limit(user: User, nb_aliases: int = 1):
+        """Count nb_aliases new aliases in the user creation rate limit buckets,
+        raise TooManyRequests if the limit is reached"""
         if user.is_premium() and not user.in_trial():
             limits = config.ALIAS_CREATE_RATE_LIMIT_PAID
         else:
@@ -1801,7 +1913,16 @@ class Alias(Base, ModelMixin):
         # limits is array of (hits,days)
         for limit in limits:
             key = f"alias_create_{limit[1]}:{user.id}"
-            rate_limiter.check_bucket_limit(key, limit[0], limit[1])
+            rate_limiter.check_bucket_limit(key, limit[0], limit[1], hits=nb_aliases)
+
+    @classmethod
+    def create(cls, **kw):
+        commit = kw.pop("commit", False)
+        flush = kw.pop("flush", False)
+
+        new_alias = cls(**kw)
+        user = User.get(new_alias.user_id)
+        cls.check_create_rate_limit(user)
 
         email = kw["email"]
         # make sure email is lowercase and doesn't have any whitespace
@@ -2358,9 +2479,18 @@ class EmailLog(Base, ModelMixin):
         email_log = super().create(*args, **kwargs)
         Session.flush()
         if "alias_id" in kwargs:
-            sql = "UPDATE alias SET last_email_log_id = :el_id WHERE id = :alias_id"
+            sql = (
+                "UPDATE alias SET last_email_log_id = :el_id, "
+                "last_activity_at = greatest(last_activity_at, :el_created_at) "
+                "WHERE id = :alias_id"
+            )
             Session.execute(
-                sql, {"el_id": email_log.id, "alias_id": kwargs["alias_id"]}
+                sql,
+                {
+                    "el_id": email_log.id,
+                    "el_created_at": email_log.created_at.to("UTC").naive,
+                    "alias_id": kwargs["alias_id"],
+                },
             )
         if commit:
             Session.commit()
@@ -2947,6 +3077,8 @@ class Job(Base, ModelMixin):
             priority,
             attempts,
         ),
+        # jobs of a type by state, see monitoring.log_scheduled_user_deletions()
+        Index("ix_job_name_state_updated_at", name, state, "updated_at"),
     )
 
     def __repr__(self):
@@ -3045,26 +3177,38 @@ class Mailbox(Base, ModelMixin):
         user = mailbox.user
 
         # Put all aliases belonging to this mailbox to global or domain trash
-        for alias in Alias.filter_by(mailbox_id=obj_id):
-            # special handling for alias that has several mailboxes and has mailbox_id=obj_id
-            if len(alias.mailboxes) > 1:
-                # use the first mailbox found in alias._mailboxes
-                first_mb = alias._mailboxes[0]
-                alias.mailbox_id = first_mb.id
-                alias._mailboxes.remove(first_mb)
-            else:
-                from app.alias_delete import perform_alias_deletion, move_alias_to_trash
-                # If the user setting is DeleteImmediately, perform alias deletion
-                # Otherwise, if the user setting is MoveToTrash, assign the default mailbox and move them to trash
+        # special handling for aliases that have several mailboxes:
+        # use the first other mailbox found in alias._mailboxes
+        for alias in Alias.filter(
+            Alias.mailbox_id == obj_id,
+            Alias.id.in_(
+                Session.query(AliasMailbox.alias_id).filter(
+                    AliasMailbox.mailbox_id != obj_id
+                )
+            ),
+        ):
+            first_mb = next(mb for mb in alias._mailboxes if mb.id != obj_id)
+            alias.mailbox_id = first_mb.id
+            alias._mailboxes.remove(first_mb)
+        Session.commit()
 
-                if user.alias_delete_action == UserAliasDeleteAction.DeleteImmediately:
-                    perform_alias_deletion(
-                        alias, user, AliasDeleteReason.MailboxDeleted
-                    )
-                else:
-                    alias.mailbox_id = user.default_mailbox_id
-                    move_alias_to_trash(alias, user, AliasDeleteReason.MailboxDeleted)
-            Session.commit()
+        from app.alias_delete import (
+            bulk_perform_alias_deletion,
+            bulk_move_aliases_to_trash,
+        )
+
+        # If the user setting is DeleteImmediately, perform alias deletion
+        # Otherwise, if the user setting is MoveToTrash, assign the default mailbox and move them to trash
+        if user.alias_delete_action == UserAliasDeleteAction.DeleteImmediately:
+            bulk_perform_alias_deletion(
+                Alias.mailbox_id == obj_id, AliasDeleteReason.MailboxDeleted
+            )
+        else:
+            bulk_move_aliases_to_trash(
+                Alias.mailbox_id == obj_id,
+                AliasDeleteReason.MailboxDeleted,
+                mailbox_id=user.default_mailbox_id,
+            )
 
         cls.filter(cls.id == obj_id).delete()
         Session.commit()
@@ -3664,11 +3808,14 @@ class MessageIDMatching(Base, ModelMixin):
     original_message_id = sa.Column(sa.String(1024), unique=True, nullable=False)
 
     # to track what email_log that has created this matching
-    email_log_id = sa.Column(
-        sa.ForeignKey("email_log.id", ondelete="cascade"), nullable=True, index=True
-    )
+    # not a foreign key so email_log can be partitioned, the matchings of the deleted email
+    # logs are removed by partition_utils.delete_orphan_message_id_matchings()
+    email_log_id = sa.Column(sa.Integer, nullable=True, index=True)
 
-    email_log = orm.relationship("EmailLog")
+    email_log = orm.relationship(
+        "EmailLog",
+        primaryjoin="foreign(MessageIDMatching.email_log_id) == EmailLog.id",
+    )
 
 
 class DeletedDirectory(Base, ModelMixin):
@@ -4014,6 +4161,13 @@ class PartnerUser(Base, ModelMixin):
         sa.UniqueConstraint(
             "partner_id", "external_user_id", name="uq_partner_id_external_user_id"
         ),
+        # used by the admin regex search
+        Index(
+            "ix_partner_user_partner_email_trgm_idx",
+            "partner_email",
+            postgresql_ops={"partner_email": "gin_trgm_ops"},
+            postgresql_using="gin",
+        ),
     )
 
 
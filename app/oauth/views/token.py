@@ -1,10 +1,11 @@
 from flask import request, jsonify
 from flask_cors import cross_origin
+from sqlalchemy.orm import joinedload
 
 from app.db import Session
 from app.jose_utils import make_id_token
 from app.log import LOG
-from app.models import Client, AuthorizationCode, OauthToken, ClientUser
+from app.models import Client, AuthorizationCode, OauthToken, ClientUser, User
 from app.oauth.base import oauth_bp
 from app.oauth.views.authorize import generate_access_token
 from app.oauth_models import Scope, get_response_types_from_str, ResponseType
@@ -56,6 +57,18 @@ def token():
     if auth_code.client_id != client.id:
         return jsonify(error="are you sure this code belongs to you?"), 400
 
+    # everything needed by get_user_info() in one query, auth_code.user and
+    # auth_code.client are then taken from the session
+    client_user: ClientUser = (
+        ClientUser.filter_by(client_id=auth_code.client_id, user_id=auth_code.user_id)
+        .options(
+            joinedload(ClientUser.user).joinedload(User.profile_picture),
+            joinedload(ClientUser.alias),
+            joinedload(ClientUser.client),
+        )
+        .first()
+    )
+
     LOG.d("Create Oauth token for user %s, client %s", auth_code.user, auth_code.client)
 
     # Create token
@@ -68,10 +81,6 @@ def token():
         response_type=auth_code.response_type,
     )
 
-    client_user: ClientUser = ClientUser.get_by(
-        client_id=auth_code.client_id, user_id=auth_code.user_id
-    )
-
     user_data = client_user.get_user_info()
 
     res = {
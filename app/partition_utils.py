@@ -0,0 +1,281 @@
+"""
+Daily range partitioning on created_at for the append-only log tables.
+
+A table is converted with commands/partition_log_table.py: the existing table becomes a single
+"legacy" partition holding everything before the conversion day, new rows go into one partition
+per day. Retention then drops whole partitions instead of deleting rows, which doesn't leave
+dead tuples behind. Tables that are not converted keep their row based retention so the same
+cron jobs work on both layouts.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+import arrow
+from sqlalchemy import func
+
+from app.db import Session
+from app.log import LOG
+from app.models import EmailLog, MessageIDMatching
+from app.retention_utils import RETENTION_BATCH_SIZE, delete_in_batches
+
+# tables that no foreign key points to, so they can be partitioned on created_at.
+# message_id_matching.email_log_id isn't a foreign key anymore for email_log to be one of them,
+# see delete_orphan_message_id_matchings()
+PARTITIONED_LOG_TABLES = [
+    "transactional_email",
+    "bounce",
+    "alias_audit_log",
+    "user_audit_log",
+    "email_log",
+]
+
+# how many daily partitions are created in advance
+PARTITION_DAYS_AHEAD = 7
+
+_UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+class Partition(NamedTuple):
+    name: str
+    # None for the DEFAULT partition
+    upper_bound: Optional[datetime]
+
+
+def is_partitioned(table: str) -> bool:
+    return (
+        Session.execute(
+            """
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = :table
+            """,
+            {"table": table},
+        ).first()
+        is not None
+    )
+
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def create_daily_partition(table: str, day: date) -> bool:
+    """Create the partition for day if it doesn't exist yet. Return True if it has been created.
+    The rows of this day that landed in the DEFAULT partition are moved to the new partition,
+    Postgres refuses to create it otherwise"""
+    name = partition_name(table, day)
+    exists = Session.execute(
+        "SELECT to_regclass(:name) IS NOT NULL", {"name": name}
+    ).scalar()
+    if exists:
+        return False
+
+    lower, upper = day.isoformat(), (day + timedelta(days=1)).isoformat()
+    default = default_partition_name(table)
+    has_default = Session.execute(
+        "SELECT to_regclass(:name) IS NOT NULL", {"name": default}
+    ).scalar()
+    if (
+        has_default
+        and Session.execute(
+            f"SELECT 1 FROM {default} WHERE created_at >= :lower AND created_at < :upper LIMIT 1",
+            {"lower": lower, "upper": upper},
+        ).first()
+    ):
+        LOG.w(f"{default} has rows for {day}, move them to {name}")
+        Session.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+        Session.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE created_at >= :lower AND created_at < :upper
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            {"lower": lower, "upper": upper},
+        )
+        Session.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+        return True
+
+    Session.execute(
+        f"CREATE TABLE {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    )
+    return True
+
+
+def range_constraint_name(table: str) -> str:
+    """The CHECK constraint matching the range of the legacy partition, see
+    convert_to_partitioned()"""
+    return f"{table}_legacy_range"
+
+
+def convert_to_partitioned(table: str, first_day: date):
+    """Swap table with a table partitioned by day on created_at. The existing table is renamed
+    to {table}_legacy and attached as the partition of the rows created before first_day.
+    Its indexes and foreign keys are recreated on the partitioned table, the existing ones are
+    reused for the legacy partition. Run in the current transaction, which isn't committed"""
+    legacy = f"{table}_legacy"
+    sequence = Session.execute(
+        "SELECT pg_get_serial_sequence(:table, 'id')", {"table": table}
+    ).scalar()
+    index_definitions = Session.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = :table AND indexname NOT IN (:pkey, :id_created_at_idx)
+        """,
+        {
+            "table": table,
+            "pkey": f"{table}_pkey",
+            "id_created_at_idx": f"{table}_id_created_at_idx",
+        },
+    ).fetchall()
+    # LIKE doesn't copy them, the partitions would be left without their ON DELETE actions
+    foreign_keys = Session.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = to_regclass(:table)
+        """,
+        {"table": table},
+    ).fetchall()
+
+    Session.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    for index_name, _ in index_definitions:
+        Session.execute(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy")
+    Session.execute(
+        f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    Session.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_partitioned_pkey "
+        "PRIMARY KEY (id, created_at)"
+    )
+    # the definitions refer to the table by its original name, now the partitioned table
+    for _, index_definition in index_definitions:
+        Session.execute(index_definition)
+    # the table is still empty, the identical foreign keys of the legacy table are reused on
+    # attach without being validated again
+    for name, definition in foreign_keys:
+        Session.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    Session.execute(
+        f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{first_day.isoformat()}')"
+    )
+    Session.execute(
+        f"ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {range_constraint_name(table)}"
+    )
+    if sequence:
+        # so the id sequence isn't dropped along with the legacy partition
+        Session.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    # safety net if the daily partitions aren't created in time, must stay empty
+    Session.execute(
+        f"CREATE TABLE {default_partition_name(table)} PARTITION OF {table} DEFAULT"
+    )
+    for i in range(PARTITION_DAYS_AHEAD + 1):
+        create_daily_partition(table, first_day + timedelta(days=i))
+
+
+def ensure_daily_partitions(
+    table: str, days_ahead: int = PARTITION_DAYS_AHEAD, today: Optional[date] = None
+) -> int:
+    """Create the partitions from today to today + days_ahead. Return the number of created partitions"""
+    if today is None:
+        today = arrow.utcnow().date()
+
+    created = 0
+    for i in range(days_ahead + 1):
+        if create_daily_partition(table, today + timedelta(days=i)):
+            created += 1
+    Session.commit()
+    return created
+
+
+def list_partitions(table: str) -> List[Partition]:
+    rows = Session.execute(
+        """
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+        """,
+        {"table": table},
+    )
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND_RE.search(bound)
+        upper_bound = datetime.fromisoformat(match.group(1)) if match else None
+        partitions.append(Partition(name, upper_bound))
+
+    return sorted(partitions, key=lambda p: (p.upper_bound is None, p.upper_bound))
+
+
+def drop_partitions_before(table: str, oldest_allowed: arrow.Arrow) -> int:
+    """Drop the partitions that only contain rows older than oldest_allowed.
+    Return the number of dropped partitions"""
+    cutoff = oldest_allowed.to("UTC").naive
+    dropped = 0
+    for partition in list_partitions(table):
+        if partition.upper_bound is None or partition.upper_bound > cutoff:
+            continue
+        LOG.i(f"Drop partition {partition.name} of {table}")
+        Session.execute(f"DROP TABLE {partition.name}")
+        Session.commit()
+        dropped += 1
+
+    return dropped
+
+
+def maintain_log_partitions():
+    """Create the upcoming daily partitions of all the partitioned log tables"""
+    for table in PARTITIONED_LOG_TABLES:
+        if not is_partitioned(table):
+            continue
+        try:
+            created = ensure_daily_partitions(table)
+        except Exception:
+            # don't leave the other tables without their upcoming partitions
+            LOG.exception(f"Cannot create the partitions of {table}")
+            Session.rollback()
+            continue
+        LOG.i(f"Created {created} partitions for {table}")
+
+
+def delete_log_table_rows(
+    model, oldest_allowed: arrow.Arrow, batch_size: int = RETENTION_BATCH_SIZE
+):
+    """Retention for a log table: drop the expired partitions if the table is partitioned,
+    otherwise delete the expired rows"""
+    table = model.__tablename__
+    if is_partitioned(table):
+        dropped = drop_partitions_before(table, oldest_allowed)
+        LOG.i(f"Dropped {dropped} {table} partitions older than {oldest_allowed}")
+        return
+
+    count = delete_in_batches(
+        model, model.created_at < oldest_allowed, batch_size=batch_size
+    )
+    LOG.i(f"Deleted {count} {table} entries")
+
+
+def delete_orphan_message_id_matchings() -> int:
+    """Delete the message id matchings whose email log is gone, which the foreign key used to
+    cascade. Email log ids increase with time: once the oldest email log has expired, every
+    matching created before it is orphan, including the ones of the email logs deleted earlier
+    with their user, alias or contact. Return the number of deleted rows"""
+    oldest_email_log_id = Session.query(func.min(EmailLog.id)).scalar()
+    if oldest_email_log_id is None:
+        return 0
+    count = delete_in_batches(
+        MessageIDMatching, MessageIDMatching.email_log_id < oldest_email_log_id
+    )
+    LOG.i(f"Deleted {count} message_id_matching entries")
+    return count
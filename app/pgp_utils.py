@@ -1,21 +1,37 @@
 import os
 import time
 from io import BytesIO
-from typing import Union
+from functools import lru_cache
+from typing import TYPE_CHECKING, Union
 
-import gnupg
 import newrelic.agent
-import pgpy
-from memory_profiler import memory_usage
-from pgpy import PGPMessage
 from sl_pgp import PgpContext, PgpException
 
 from app.config import GNUPGHOME, PGP_SENDER_PRIVATE_KEY, USE_RUST_PGP
 from app.log import LOG
+from app.metrics import record_custom_metric
 from app.models import Mailbox, Contact
 
-gpg = gnupg.GPG(gnupghome=GNUPGHOME)
-gpg.encoding = "utf-8"
+# gnupg, pgpy and memory_profiler are only imported by the legacy implementation, when used
+if TYPE_CHECKING:
+    from pgpy import PGPMessage
+
+
+class _LazyGPG:
+    """gnupg.GPG runs the gpg binary when created, so it's only created on first use"""
+
+    _gpg = None
+
+    def __getattr__(self, name):
+        if self._gpg is None:
+            import gnupg
+
+            self._gpg = gnupg.GPG(gnupghome=GNUPGHOME)
+            self._gpg.encoding = "utf-8"
+        return getattr(self._gpg, name)
+
+
+gpg = _LazyGPG()
 
 
 class PGPException(Exception):
@@ -41,9 +57,7 @@ def _record_pgp_metric(
     metric_suffix = f"_{implementation}"
     if is_fallback:
         metric_suffix = f"_fallback{metric_suffix}"
-    newrelic.agent.record_custom_metric(
-        f"Custom/pgp_{operation}{metric_suffix}_time", elapsed
-    )
+    record_custom_metric(f"Custom/pgp_{operation}{metric_suffix}_time", elapsed)
 
     # Record detailed event for analysis
     event_name = f"Pgp{operation.title()}"
@@ -148,6 +162,8 @@ def encrypt_file(
             success = True
             return result
         else:
+            from memory_profiler import memory_usage
+
             mem_usage = memory_usage(-1, interval=1, timeout=1)[0]
             LOG.d("mem_usage %s", mem_usage)
 
@@ -190,7 +206,7 @@ def encrypt_file(
 
 def encrypt_file_with_pgpy(
     data: bytes, public_key: str, ctx: PgpContext, force_use_rust: bool = False
-) -> Union[PGPMessage, str]:
+) -> Union["PGPMessage", str]:
     """Encrypt data using pgpy library or sl-pgp if USE_RUST_PGP is True.
 
     Returns:
@@ -210,6 +226,8 @@ def encrypt_file_with_pgpy(
             success = True
             return result
         else:
+            import pgpy
+
             key = pgpy.PGPKey()
             key.parse(public_key)
             msg = pgpy.PGPMessage.new(data, encoding="utf-8")
@@ -225,9 +243,10 @@ def encrypt_file_with_pgpy(
         )
 
 
-# Initialize signing key for legacy implementation
-if PGP_SENDER_PRIVATE_KEY and not USE_RUST_PGP:
-    _SIGN_KEY_ID = gpg.import_keys(PGP_SENDER_PRIVATE_KEY).fingerprints[0]
+@lru_cache(maxsize=None)
+def _get_sign_key_id() -> str:
+    """Import the signing key of the legacy implementation"""
+    return gpg.import_keys(PGP_SENDER_PRIVATE_KEY).fingerprints[0]
 
 
 def create_pgp_context() -> PgpContext:
@@ -262,7 +281,7 @@ def sign_data(
             success = True
             return result
         else:
-            signature = str(gpg.sign(data, keyid=_SIGN_KEY_ID, detach=True))
+            signature = str(gpg.sign(data, keyid=_get_sign_key_id(), detach=True))
             success = True
             return signature
     except PgpException as e:
@@ -282,6 +301,8 @@ def sign_data_with_pgpy(data: Union[str, bytes]) -> str:
     start_time = time.time()
 
     try:
+        import pgpy
+
         key = pgpy.PGPKey()
         key.parse(PGP_SENDER_PRIVATE_KEY)
         signature = str(key.sign(data))
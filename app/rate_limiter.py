@@ -27,7 +27,10 @@ def check_bucket_limit(
     lock_name: Optional[str] = None,
     max_hits: int = 5,
     bucket_seconds: int = 3600,
+    hits: int = 1,
 ):
+    """Count hits in the current bucket of lock_name, raise TooManyRequests if there are
+    more than max_hits"""
     if not rateLimitsEnabled:
         return
     # Calculate current bucket time
@@ -37,7 +40,7 @@ def check_bucket_limit(
     if not lock_redis:
         return
     try:
-        value = lock_redis.incr(bucket_lock_name, bucket_seconds)
+        value = lock_redis.incr(bucket_lock_name, bucket_seconds, amount=hits)
         if value > max_hits:
             LOG.i(
                 f"Rate limit hit for {lock_name} (bucket id {bucket_id}) -> {value}/{max_hits}"
@@ -1,6 +1,7 @@
 import flask
 import limits.storage
 
+from app import cache_versions
 from app.parallel_limiter import set_redis_concurrent_lock
 from app.rate_limiter import set_redis_concurrent_lock as rate_limit_set_redis
 from app.session import RedisSessionStore
@@ -12,6 +13,7 @@ def initialize_redis_services(app: flask.Flask, redis_url: str):
         app.session_interface = RedisSessionStore(storage.storage, storage.storage, app)
         set_redis_concurrent_lock(storage)
         rate_limit_set_redis(storage)
+        cache_versions.set_redis_storage(storage)
     elif redis_url.startswith("redis+sentinel://"):
         storage = limits.storage.RedisSentinelStorage(redis_url)
         app.session_interface = RedisSessionStore(
@@ -19,6 +21,7 @@ def initialize_redis_services(app: flask.Flask, redis_url: str):
         )
         set_redis_concurrent_lock(storage)
         rate_limit_set_redis(storage)
+        cache_versions.set_redis_storage(storage)
     else:
         raise RuntimeError(
             f"Tried to set_redis_session with an invalid redis url: ${redis_url}"
@@ -0,0 +1,110 @@
+"""
+Set based retention for big tables.
+
+The matching rows are processed by batches of ids in increasing order: each batch is a single
+DELETE or UPDATE ... WHERE id IN (SELECT id ... ORDER BY id LIMIT n) RETURNING id, committed
+on its own. The rows are never loaded as objects, the lock and the transaction stay short and
+the next batch starts after the last processed id instead of scanning the dead tuples again.
+"""
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import and_, select
+
+from app import config
+from app.db import Session
+from app.log import LOG
+
+RETENTION_BATCH_SIZE = 1000
+
+OnBatch = Callable[[List[tuple]], None]
+
+
+def _run_in_batches(
+    model,
+    condition,
+    make_statement,
+    batch_size: int,
+    statement_timeout: Optional[int],
+    returning: Sequence,
+    on_batch: Optional[OnBatch],
+) -> int:
+    table = model.__table__
+    if statement_timeout is None:
+        statement_timeout = config.RETENTION_STATEMENT_TIMEOUT
+
+    total = 0
+    last_id = 0
+    while True:
+        # only applies to the current batch transaction
+        Session.execute(f"SET LOCAL statement_timeout = {int(statement_timeout)}")
+        batch_ids = (
+            select([table.c.id])
+            .where(and_(condition, table.c.id > last_id))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        )
+        rows = Session.execute(
+            make_statement(table.c.id.in_(batch_ids)).returning(table.c.id, *returning)
+        ).fetchall()
+        if rows:
+            last_id = max(row[0] for row in rows)
+            if on_batch:
+                try:
+                    on_batch(rows)
+                except Exception:
+                    Session.rollback()
+                    raise
+        Session.commit()
+
+        total += len(rows)
+        LOG.d(f"Processed {total} {table.name} rows")
+        if len(rows) < batch_size:
+            return total
+
+
+def delete_in_batches(
+    model,
+    condition,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    statement_timeout: Optional[int] = None,
+    returning: Sequence = (),
+    on_batch: Optional[OnBatch] = None,
+) -> int:
+    """Delete the rows of model matching condition. Return the number of deleted rows.
+
+    statement_timeout is in milliseconds, config.RETENTION_STATEMENT_TIMEOUT by default.
+    on_batch is called with the returned (id, *returning) rows of each batch before its commit,
+    it can change these rows in the same transaction. An exception there rolls the batch back
+    and is raised again, the previous batches stay committed."""
+    table = model.__table__
+    return _run_in_batches(
+        model,
+        condition,
+        lambda in_batch: table.delete().where(in_batch),
+        batch_size,
+        statement_timeout,
+        returning,
+        on_batch,
+    )
+
+
+def update_in_batches(
+    model,
+    condition,
+    values: dict,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    statement_timeout: Optional[int] = None,
+    returning: Sequence = (),
+    on_batch: Optional[OnBatch] = None,
+) -> int:
+    """Same as delete_in_batches but set values on the matching rows"""
+    table = model.__table__
+    return _run_in_batches(
+        model,
+        condition,
+        lambda in_batch: table.update().where(in_batch).values(values),
+        batch_size,
+        statement_timeout,
+        returning,
+        on_batch,
+    )
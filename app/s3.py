@@ -1,8 +1,8 @@
 import os
+import shutil
 from io import BytesIO
-from typing import Optional
+from typing import BinaryIO, List, Optional
 
-import boto3
 import requests
 
 from app import config
@@ -21,6 +21,9 @@ def _get_s3client():
         }
         if config.AWS_ENDPOINT_URL:
             args["endpoint_url"] = config.AWS_ENDPOINT_URL
+        # boto3 is slow to import and only needed by the processes using S3
+        import boto3
+
         _s3_client = boto3.client("s3", **args)
     return _s3_client
 
@@ -44,6 +47,26 @@ def upload_from_bytesio(key: str, bs: BytesIO, content_type="application/octet-s
         )
 
 
+def upload_from_file(key: str, f: BinaryIO, content_type="application/octet-stream"):
+    """Upload a file without loading it in memory, big files are sent with a multipart upload"""
+    f.seek(0)
+
+    if config.LOCAL_FILE_UPLOAD:
+        file_path = os.path.join(config.UPLOAD_DIR, key)
+        file_dir = os.path.dirname(file_path)
+        os.makedirs(file_dir, exist_ok=True)
+        with open(file_path, "wb") as local_file:
+            shutil.copyfileobj(f, local_file)
+
+    else:
+        _get_s3client().upload_fileobj(
+            f,
+            config.BUCKET,
+            key,
+            ExtraArgs={"ContentType": content_type},
+        )
+
+
 def upload_email_from_bytesio(path: str, bs: BytesIO, filename):
     bs.seek(0)
 
@@ -104,6 +127,41 @@ def delete(path: str):
         _get_s3client().delete_object(Bucket=config.BUCKET, Key=path)
 
 
+# max number of keys of a DeleteObjects request
+_DELETE_OBJECTS_MAX_KEYS = 1000
+
+
+def delete_many(paths: List[str]) -> List[str]:
+    """Delete several files, with one request per 1000 files on S3.
+    Missing files are ignored. Return the paths that couldn't be deleted"""
+    failed = []
+    if config.LOCAL_FILE_UPLOAD:
+        for path in paths:
+            try:
+                os.remove(os.path.join(config.UPLOAD_DIR, path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                LOG.w(f"Cannot delete {path}: {e}")
+                failed.append(path)
+        return failed
+
+    for i in range(0, len(paths), _DELETE_OBJECTS_MAX_KEYS):
+        resp = _get_s3client().delete_objects(
+            Bucket=config.BUCKET,
+            Delete={
+                "Objects": [
+                    {"Key": path} for path in paths[i : i + _DELETE_OBJECTS_MAX_KEYS]
+                ],
+                "Quiet": True,
+            },
+        )
+        for error in resp.get("Errors", []):
+            LOG.w(f"Cannot delete {error['Key']}: {error['Code']} {error['Message']}")
+            failed.append(error["Key"])
+    return failed
+
+
 def create_bucket_if_not_exists():
     s3client = _get_s3client()
     buckets = s3client.list_buckets()
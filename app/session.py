@@ -12,23 +12,107 @@ except ImportError:
     import pickle
 
 import itsdangerous
-from flask.sessions import SessionMixin, SessionInterface
+from flask.sessions import SessionMixin, SessionInterface, session_json_serializer
 from werkzeug.datastructures import CallbackDict
 
 SESSION_PREFIX = "session"
 
+# Only 5 minutes for non-authenticated sessions.
+# We need to keep the non-authenticated ones because the csrf token is stored in the session.
+ANONYMOUS_SESSION_TTL = 300
+
 
 class ServerSession(CallbackDict, SessionMixin):
-    def __init__(self, initial=None, session_id=None):
+    """Session whose content is only fetched from the store when it's first accessed"""
+
+    def __init__(self, initial=None, session_id=None, loader=None):
         def on_update(self):
             self.modified = True
 
         super(ServerSession, self).__init__(initial, on_update)
         self.session_id = session_id
         self.modified = False
+        # remaining time to live in the store when the session was loaded
+        self.ttl: Optional[int] = None
+        self._loader = loader
+        self._permanent = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loader is None
+
+    def _ensure_loaded(self):
+        if self._loader is None:
+            return
+        loader, self._loader = self._loader, None
+        # bypass on_update, loading doesn't modify the session
+        dict.update(self, loader(self))
+
+    @property
+    def permanent(self) -> bool:
+        return self._permanent
+
+    @permanent.setter
+    def permanent(self, value: bool):
+        # set on every request by make_session_permanent, it only drives the cookie
+        # expiration so it neither loads nor modifies the session
+        self._permanent = bool(value)
+
+
+def _load_first(name):
+    method = getattr(CallbackDict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._ensure_loaded()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in (
+    "__getitem__",
+    "__setitem__",
+    "__delitem__",
+    "__contains__",
+    "__iter__",
+    "__len__",
+    "__eq__",
+    "__repr__",
+    "get",
+    "keys",
+    "items",
+    "values",
+    "copy",
+    "setdefault",
+    "pop",
+    "popitem",
+    "update",
+    "clear",
+):
+    setattr(ServerSession, _name, _load_first(_name))
+
+
+def serialize_session(data: dict) -> bytes:
+    return session_json_serializer.dumps(data).encode()
+
+
+def deserialize_session(value: bytes) -> dict:
+    # sessions written before the switch to json are pickled, they are only read until
+    # they expire
+    if value.startswith(b"\x80"):
+        return pickle.loads(value)
+    return session_json_serializer.loads(value.decode())
 
 
 class RedisSessionStore(SessionInterface):
+    """The session content is stored in Redis as tagged JSON, the cookie only holds its
+    signed id.
+
+    The content is fetched on the first access to the session and written back only when
+    it's modified. An unmodified session has its expiration pushed back with an EXPIRE once
+    less than half of its time to live remains."""
+
     def __init__(self, redis_w, redis_r, app):
         self._redis_w = redis_w
         self._redis_r = redis_r
@@ -65,40 +149,59 @@ class RedisSessionStore(SessionInterface):
         except AttributeError:
             pass
 
+    def _load(self, session: ServerSession) -> dict:
+        pipeline = self._redis_r.pipeline()
+        pipeline.get(self._get_key(session.session_id))
+        pipeline.ttl(self._get_key(session.session_id))
+        val, ttl = pipeline.execute()
+        if val is not None:
+            try:
+                data = deserialize_session(val)
+                session.ttl = ttl
+                return data
+            except Exception:
+                pass
+        # expired or unreadable, start a new session
+        session.session_id = str(uuid.uuid4())
+        return {}
+
     def open_session(self, app: flask.Flask, request: flask.Request):
         session_id = self.extract_and_validate_session_id(app, request)
         if not session_id:
             return ServerSession(session_id=str(uuid.uuid4()))
 
-        val = self._redis_r.get(self._get_key(session_id))
-        if val is not None:
-            try:
-                data = pickle.loads(val)
-                return ServerSession(data, session_id=session_id)
-            except Exception:
-                pass
-        return ServerSession(session_id=str(uuid.uuid4()))
+        return ServerSession(session_id=session_id, loader=self._load)
+
+    def _get_ttl(self, app: flask.Flask, session: ServerSession) -> int:
+        if "_user_id" not in session:
+            return ANONYMOUS_SESSION_TTL
+        return int(app.permanent_session_lifetime.total_seconds())
 
     def save_session(
         self, app: flask.Flask, session: ServerSession, response: flask.Response
     ):
+        # never accessed during the request, nothing to write
+        if not session.loaded:
+            return
+
+        ttl = self._get_ttl(app, session)
+        key = self._get_key(session.session_id)
+        if session.modified:
+            self._redis_w.setex(
+                name=key, value=serialize_session(dict(session)), time=ttl
+            )
+        elif session.ttl is not None and session.ttl < ttl / 2:
+            self._redis_w.expire(key, ttl)
+        else:
+            # new and empty, or recently written
+            return
+
         domain = self.get_cookie_domain(app)
         path = self.get_cookie_path(app)
         httponly = self.get_cookie_httponly(app)
         secure = self.get_cookie_secure(app)
         expires = self.get_expiration_time(app, session)
         samesite = self.get_cookie_samesite(app)
-        val = pickle.dumps(dict(session))
-        ttl = int(app.permanent_session_lifetime.total_seconds())
-        # Only 5 minutes for non-authenticated sessions.
-        # We need to keep the non-authenticated ones because the csrf token is stored in the session.
-        if "_user_id" not in session:
-            ttl = 300
-        self._redis_w.setex(
-            name=self._get_key(session.session_id),
-            value=val,
-            time=ttl,
-        )
         signed_session_id = self._get_signer(app).sign(
             itsdangerous.want_bytes(session.session_id)
         )
@@ -1,5 +1,7 @@
 from enum import Enum
 
+from app.audit_log_buffer import add_audit_log
+from app.db import Session
 from app.models import User, UserAuditLog
 
 
@@ -40,10 +42,12 @@ class UserAuditLogAction(Enum):
 def emit_user_audit_log(
     user: User, action: UserAuditLogAction, message: str, commit: bool = False
 ):
-    UserAuditLog.create(
+    add_audit_log(
+        UserAuditLog,
         user_id=user.id,
         user_email=user.email,
         action=action.value,
         message=message,
-        commit=commit,
     )
+    if commit:
+        Session.commit()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the HIBP API, used to benchmark the HIBP scan without a real API key.
+
+    python commands/fake_hibp_server.py --port 8900 --rpm 600 --latency 0.2
+    HIBP_API_URL=http://localhost:8900 HIBP_API_KEYS=[key1,key2] HIBP_API_RPM=600 \
+        python cron.py -j check_hibp
+
+Each API key is limited to --rpm requests per minute, going above returns a 429 with Retry-After.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+parser = argparse.ArgumentParser(
+    prog="Fake HIBP server", description="Serve a fake HIBP API for benchmarks"
+)
+parser.add_argument("-p", "--port", default=8900, type=int, help="Port to listen on")
+parser.add_argument(
+    "-r", "--rpm", default=100, type=int, help="Allowed requests per minute per key"
+)
+parser.add_argument(
+    "-l", "--latency", default=0.2, type=float, help="Seconds spent per request"
+)
+parser.add_argument(
+    "-b", "--breached", default=10, type=int, help="Percentage of breached accounts"
+)
+args = parser.parse_args()
+
+BREACHES = [
+    {
+        "Name": f"FakeBreach{i}",
+        "BreachDate": "2020-01-01",
+        "Description": f"Fake breach {i}",
+    }
+    for i in range(20)
+]
+
+_lock = threading.Lock()
+# api key -> time before which the next request is rate limited
+_next_allowed = {}
+_stats = {"requests": 0, "rate_limited": 0, "start": time.time()}
+
+
+def _rate_limited(api_key: str) -> float:
+    """Return the seconds to wait if the key is over its rate, 0 otherwise"""
+    interval = 60.0 / args.rpm
+    now = time.monotonic()
+    with _lock:
+        _stats["requests"] += 1
+        next_allowed = _next_allowed.get(api_key, now)
+        if next_allowed - now > interval:
+            _stats["rate_limited"] += 1
+            return next_allowed - now
+        _next_allowed[api_key] = max(next_allowed, now) + interval
+        return 0
+
+
+class FakeHibpHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status: int, data, headers=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/breaches":
+            self._send_json(200, BREACHES)
+            return
+
+        if not self.path.startswith("/breachedaccount/"):
+            self._send_json(404, None)
+            return
+
+        wait = _rate_limited(self.headers.get("hibp-api-key", ""))
+        if wait:
+            self._send_json(429, None, {"Retry-After": str(int(wait) + 1)})
+            return
+
+        time.sleep(args.latency)
+        email = urllib.parse.unquote(self.path[len("/breachedaccount/") :])
+        digest = int(hashlib.sha1(email.encode()).hexdigest(), 16)
+        if digest % 100 < args.breached:
+            nb_breach = 1 + digest % 3
+            self._send_json(
+                200,
+                [{"Name": b["Name"]} for b in BREACHES[digest % 17 :][:nb_breach]],
+            )
+        else:
+            self._send_json(404, None)
+
+    def log_message(self, format, *log_args):
+        pass
+
+
+def print_stats():
+    while True:
+        time.sleep(10)
+        elapsed = time.time() - _stats["start"]
+        print(
+            f"{_stats['requests']} requests, {_stats['rate_limited']} rate limited, "
+            f"{_stats['requests'] / elapsed:.2f} req/s"
+        )
+
+
+threading.Thread(target=print_stats, daemon=True).start()
+print(f"Fake HIBP server listening on port {args.port}")
+ThreadingHTTPServer(("", args.port), FakeHibpHandler).serve_forever()
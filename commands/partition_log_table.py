@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Convert a log table into a table partitioned by day on created_at, without copying the data.
+
+    python commands/partition_log_table.py -t bounce
+
+The existing table is attached as the partition holding all rows created before the day after
+tomorrow (UTC), it is dropped as a whole by the retention job once all its rows are expired.
+The index and the CHECK constraint that let Postgres attach it without rebuilding or scanning
+are created beforehand without blocking writes, the swap itself only holds the table lock for
+a short time. The constraint is dropped again if the swap fails.
+"""
+import argparse
+
+import arrow
+
+from app.db import Session, engine
+from app.partition_utils import (
+    PARTITIONED_LOG_TABLES,
+    convert_to_partitioned,
+    is_partitioned,
+    range_constraint_name,
+)
+
+parser = argparse.ArgumentParser(
+    prog="Partition log table",
+    description="Convert a log table to daily partitions on created_at",
+)
+parser.add_argument(
+    "-t", "--table", required=True, choices=PARTITIONED_LOG_TABLES, help="Table name"
+)
+args = parser.parse_args()
+table = args.table
+legacy = f"{table}_legacy"
+
+if is_partitioned(table):
+    print(f"{table} is already partitioned")
+    exit(0)
+
+# a partitioned table can only be referenced through a key including created_at
+referencing = Session.execute(
+    "SELECT conname FROM pg_constraint WHERE contype = 'f' AND confrelid = to_regclass(:table)",
+    {"table": table},
+).fetchall()
+if referencing:
+    print(f"{table} is referenced by {', '.join(name for (name,) in referencing)}")
+    exit(1)
+
+print(f"Prepare {table}: partition key index")
+with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+    # the partitioned table primary key must include the partition key
+    conn.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {table}_id_created_at_idx "
+        f"ON {table} (id, created_at)"
+    )
+
+# rows created before this day stay in the legacy partition. The range constraint rejects the
+# later rows until the swap, which leaves more than a day to validate it and swap
+first_day = arrow.utcnow().shift(days=2).date()
+range_constraint = range_constraint_name(table)
+
+print(f"Swap {table} with a partitioned table")
+try:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # a validated constraint matching the partition range avoids a full scan on attach
+        conn.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {range_constraint} "
+            f"CHECK (created_at < '{first_day.isoformat()}') NOT VALID"
+        )
+        conn.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {range_constraint}")
+
+    Session.execute("SET LOCAL lock_timeout = '10s'")
+    convert_to_partitioned(table, first_day)
+    Session.commit()
+except Exception:
+    Session.rollback()
+    # the constraint would make the inserts fail from first_day
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(
+            f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {range_constraint}"
+        )
+    raise
+
+print(f"{table} is now partitioned, {legacy} holds the rows before {first_day}")
@@ -1,20 +1,17 @@
 import argparse
 import asyncio
-import urllib.parse
 from typing import List, Tuple, Optional
 
 import arrow
-import requests
-from sqlalchemy import func, desc, or_, and_
+from sqlalchemy import and_, func, desc, literal
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import ObjectDeletedError
-from sqlalchemy.sql import Insert, text
+from sqlalchemy.sql import Insert
 
 from app import s3, config
 from app.alias_utils import nb_email_log_for_mailbox
-from app.api.views.apple import verify_receipt
-from app.db import Session
+from app.db import Session, read_replica
 from app.email_utils import (
     send_email,
     send_trial_end_soon_email,
@@ -23,16 +20,17 @@ from app.email_utils import (
     get_email_domain_part,
 )
 from app.email_validation import is_valid_email, normalize_reply_email
-from app.errors import ProtonPartnerNotSetUp
+from app.jobs.delete_scheduled_user_job import schedule_user_deletions
+from app.instrumentation import instrument
 from app.log import LOG
 from app.mail_sender import load_unsent_mails_from_fs_and_resend
+from app.metric_utils import compute_metric2
 from app.models import (
     Subscription,
     User,
     Alias,
     EmailLog,
     CustomDomain,
-    Client,
     ManualSubscription,
     RefusedEmail,
     AppleSubscription,
@@ -46,21 +44,22 @@ from app.models import (
     SLDomain,
     DeletedAlias,
     DomainDeletedAlias,
-    Hibp,
     HibpNotifiedAlias,
-    Directory,
-    DeletedDirectory,
-    DeletedSubdomain,
-    PartnerSubscription,
-    PartnerUser,
+    HibpPendingNotification,
     ApiToCookieToken,
 )
+from app.partition_utils import (
+    delete_log_table_rows,
+    delete_orphan_message_id_matchings,
+    maintain_log_partitions,
+)
 from app.pgp_utils import load_public_key_and_check, PGPException, create_pgp_context
-from app.proton.proton_partner import get_proton_partner
+from app.retention_utils import delete_in_batches, update_in_batches
 from app.user_audit_log_utils import emit_user_audit_log, UserAuditLogAction
 from app.utils import sanitize_email
 from server import create_light_app
 from tasks.check_custom_domains import check_all_custom_domains
+from tasks.check_hibp import check_hibp
 from tasks.clean_alias_audit_log import cleanup_alias_audit_log
 from tasks.clean_user_audit_log import cleanup_user_audit_log
 from tasks.cleanup_alias import cleanup_alias
@@ -69,8 +68,6 @@ from tasks.cleanup_old_imports import cleanup_old_imports
 from tasks.cleanup_old_jobs import cleanup_old_jobs
 from tasks.cleanup_old_notifications import cleanup_old_notifications
 
-DELETE_GRACE_DAYS = 30
-
 
 def notify_trial_end():
     for user in User.filter(
@@ -94,63 +91,53 @@ def delete_logs():
     delete_refused_emails()
     delete_old_monitoring()
 
-    for t_email in TransactionalEmail.filter(
-        TransactionalEmail.created_at < arrow.now().shift(days=-7)
-    ):
-        TransactionalEmail.delete(t_email.id)
-
-    for b in Bounce.filter(Bounce.created_at < arrow.now().shift(days=-7)):
-        Bounce.delete(b.id)
-
-    Session.commit()
+    oldest_allowed = arrow.now().shift(days=-7)
+    delete_log_table_rows(TransactionalEmail, oldest_allowed)
+    delete_log_table_rows(Bounce, oldest_allowed)
 
     LOG.d("Deleting EmailLog older than 2 weeks")
-
-    total_deleted = 0
-    batch_size = 500
-    Session.execute("set session statement_timeout=30000").rowcount
-    queries_done = 0
-    cutoff_time = arrow.now().shift(days=-14)
-    rows_to_delete = EmailLog.filter(EmailLog.created_at < cutoff_time).count()
-    expected_queries = int(rows_to_delete / batch_size)
-    sql = text(
-        "DELETE FROM email_log WHERE id IN (SELECT id FROM email_log WHERE created_at < :cutoff_time order by created_at limit :batch_size)"
-    )
-    str_cutoff_time = cutoff_time.isoformat()
-    while total_deleted < rows_to_delete:
-        deleted_count = Session.execute(
-            sql, {"cutoff_time": str_cutoff_time, "batch_size": batch_size}
-        ).rowcount
-        Session.commit()
-        total_deleted += deleted_count
-        queries_done += 1
-        LOG.i(
-            f"[{queries_done}/{expected_queries}] Deleted {total_deleted} EmailLog entries"
-        )
-        if deleted_count < batch_size:
-            break
-
-    LOG.i("Deleted %s email logs", total_deleted)
+    delete_log_table_rows(EmailLog, arrow.now().shift(days=-14), batch_size=500)
+    delete_orphan_message_id_matchings()
 
 
 def delete_refused_emails():
-    for refused_email in (
-        RefusedEmail.filter_by(deleted=False).order_by(RefusedEmail.id).all()
-    ):
-        if arrow.now().shift(days=1) > refused_email.delete_at >= arrow.now():
-            LOG.d("Delete refused email %s", refused_email)
-            if refused_email.path:
-                s3.delete(refused_email.path)
-
-            s3.delete(refused_email.full_report_path)
+    """Delete the content of the refused emails that have reached their delete_at"""
+
+    def delete_files(rows):
+        paths = []
+        for _, path, full_report_path in rows:
+            if path:
+                paths.append(path)
+            paths.append(full_report_path)
+        failed = set(s3.delete_many(paths))
+        if not failed:
+            return
+        # keep them to be retried by the next run, delete_at is now
+        failed_ids = [
+            refused_email_id
+            for refused_email_id, path, full_report_path in rows
+            if path in failed or full_report_path in failed
+        ]
+        LOG.w(f"Cannot delete the files of {len(failed_ids)} refused emails")
+        RefusedEmail.filter(RefusedEmail.id.in_(failed_ids)).update(
+            {RefusedEmail.deleted: False}, synchronize_session=False
+        )
 
-            # do not set path and full_report_path to null
-            # so we can check later that the files are indeed deleted
-            refused_email.delete_at = arrow.now()
-            refused_email.deleted = True
-            Session.commit()
+    # do not set path and full_report_path to null
+    # so we can check later that the files are indeed deleted
+    now = arrow.now()
+    nb_deleted = update_in_batches(
+        RefusedEmail,
+        and_(
+            RefusedEmail.deleted.is_(False),
+            RefusedEmail.delete_at < now.shift(days=1),
+        ),
+        {RefusedEmail.deleted: True, RefusedEmail.delete_at: now},
+        returning=(RefusedEmail.path, RefusedEmail.full_report_path),
+        on_batch=delete_files,
+    )
 
-    LOG.d("Finish delete_refused_emails")
+    LOG.d(f"Finish delete_refused_emails, {nb_deleted} deleted")
 
 
 def notify_premium_end():
@@ -286,6 +273,9 @@ def notify_manual_sub_end():
 
 def poll_apple_subscription():
     """Poll Apple API to update AppleSubscription"""
+    # imported here as it loads the whole API blueprint
+    from app.api.views.apple import verify_receipt
+
     for apple_sub in (
         AppleSubscription.filter(
             AppleSubscription.expires_date < arrow.now().shift(days=15)
@@ -309,92 +299,6 @@ def poll_apple_subscription():
     LOG.d("Finish poll_apple_subscription")
 
 
-def compute_metric2() -> Metric2:
-    now = arrow.now()
-    _24h_ago = now.shift(days=-1)
-
-    nb_referred_user_paid = 0
-    for user in (
-        User.filter(User.referral_id.isnot(None))
-        .yield_per(500)
-        .enable_eagerloads(False)
-    ):
-        if user.is_paid():
-            nb_referred_user_paid += 1
-
-    # compute nb_proton_premium, nb_proton_user
-    nb_proton_premium = nb_proton_user = 0
-    try:
-        proton_partner = get_proton_partner()
-        nb_proton_premium = (
-            Session.query(PartnerSubscription, PartnerUser)
-            .filter(
-                PartnerSubscription.partner_user_id == PartnerUser.id,
-                PartnerUser.partner_id == proton_partner.id,
-                PartnerSubscription.end_at > now,
-            )
-            .count()
-        )
-        nb_proton_user = (
-            Session.query(PartnerUser)
-            .filter(
-                PartnerUser.partner_id == proton_partner.id,
-            )
-            .count()
-        )
-    except ProtonPartnerNotSetUp:
-        LOG.d("Proton partner not set up")
-
-    return Metric2.create(
-        date=now,
-        # user stats
-        nb_user=User.count(),
-        nb_activated_user=User.filter_by(activated=True).count(),
-        nb_proton_user=nb_proton_user,
-        # subscription stats
-        nb_premium=Subscription.filter(Subscription.cancelled.is_(False)).count(),
-        nb_cancelled_premium=Subscription.filter(
-            Subscription.cancelled.is_(True)
-        ).count(),
-        # todo: filter by expires_date > now
-        nb_apple_premium=AppleSubscription.count(),
-        nb_manual_premium=ManualSubscription.filter(
-            ManualSubscription.end_at > now,
-            ManualSubscription.is_giveaway.is_(False),
-        ).count(),
-        nb_coinbase_premium=CoinbaseSubscription.filter(
-            CoinbaseSubscription.end_at > now
-        ).count(),
-        nb_proton_premium=nb_proton_premium,
-        # referral stats
-        nb_referred_user=User.filter(User.referral_id.isnot(None)).count(),
-        nb_referred_user_paid=nb_referred_user_paid,
-        nb_alias=Alias.count(),
-        # email log stats
-        nb_forward_last_24h=EmailLog.filter(EmailLog.created_at > _24h_ago)
-        .filter_by(bounced=False, is_spam=False, is_reply=False, blocked=False)
-        .count(),
-        nb_bounced_last_24h=EmailLog.filter(EmailLog.created_at > _24h_ago)
-        .filter_by(bounced=True)
-        .count(),
-        nb_total_bounced_last_24h=Bounce.filter(Bounce.created_at > _24h_ago).count(),
-        nb_reply_last_24h=EmailLog.filter(EmailLog.created_at > _24h_ago)
-        .filter_by(is_reply=True)
-        .count(),
-        nb_block_last_24h=EmailLog.filter(EmailLog.created_at > _24h_ago)
-        .filter_by(blocked=True)
-        .count(),
-        # other stats
-        nb_verified_custom_domain=CustomDomain.filter_by(verified=True).count(),
-        nb_subdomain=CustomDomain.filter_by(is_sl_subdomain=True).count(),
-        nb_directory=Directory.count(),
-        nb_deleted_directory=DeletedDirectory.count(),
-        nb_deleted_subdomain=DeletedSubdomain.count(),
-        nb_app=Client.count(),
-        commit=True,
-    )
-
-
 def increase_percent(old, new) -> str:
     if old == 0:
         return "N/A"
@@ -406,6 +310,7 @@ def increase_percent(old, new) -> str:
     return f"{increase:.1f}%. Delta: {new - old}"
 
 
+@read_replica()
 def bounce_report() -> List[Tuple[str, int]]:
     """return the accounts that have most bounces, e.g.
     (email1, 30)
@@ -448,6 +353,7 @@ def bounce_report() -> List[Tuple[str, int]]:
     return res
 
 
+@read_replica()
 def all_bounce_report() -> str:
     """
     Return a report for all mailboxes that have most bounces. Using this query to get mailboxes that have bounces.
@@ -493,6 +399,7 @@ def all_bounce_report() -> str:
     return res
 
 
+@read_replica()
 def alias_creation_report() -> List[Tuple[str, int]]:
     """return the accounts that have created most aliases in the last 7 days, e.g.
     (email1, 2021-3-21, 30)
@@ -548,6 +455,12 @@ def stats():
         LOG.w("ADMIN_EMAIL not set, nothing to do")
         return
 
+    # the reports run on a replica, before this session writes the new Metric2
+    # which would make the following reads stick to the primary
+    account_bounces = bounce_report()
+    alias_creations = alias_creation_report()
+    full_bounce_report = all_bounce_report()
+
     stats_today = compute_metric2()
     stats_yesterday = (
         Metric2.filter(Metric2.date < stats_today.date)
@@ -613,20 +526,20 @@ nb_total_bounced_last_24h: {stats_today.nb_total_bounced_last_24h} - {increase_p
 # Account bounce report:
 """
 
-    for email, bounces in bounce_report():
+    for email, bounces in account_bounces:
         monitoring_report += f"{email}: {bounces}\n"
 
     monitoring_report += """\n
 # Alias creation report:
 """
 
-    for email, nb_alias, date in alias_creation_report():
+    for email, nb_alias, date in alias_creations:
         monitoring_report += f"{email}, {date}: {nb_alias}\n"
 
     monitoring_report += """\n
 # Full bounce detail report:
 """
-    monitoring_report += all_bounce_report()
+    monitoring_report += full_bounce_report
 
     LOG.d("monitoring_report email: %s", monitoring_report)
 
@@ -929,8 +842,7 @@ def delete_old_monitoring():
     Delete old monitoring records
     """
     max_time = arrow.now().shift(days=-30)
-    nb_row = Monitoring.filter(Monitoring.created_at < max_time).delete()
-    Session.commit()
+    nb_row = delete_in_batches(Monitoring, Monitoring.created_at < max_time)
     LOG.d("delete monitoring records older than %s, nb row %s", max_time, nb_row)
 
 
@@ -944,283 +856,94 @@ def delete_expired_tokens():
     LOG.d("Delete api to cookie tokens older than %s, nb row %s", max_time, nb_row)
 
 
-async def _hibp_check(api_key: str, queue: asyncio.Queue):
-    """
-    Uses a single API key to check the queue as fast as possible.
-
-    This function to be ran simultaneously (multiple _hibp_check functions with different keys on the same queue) to make maximum use of multiple API keys.
-    """
-    default_rate_sleep = (60.0 / config.HIBP_RPM) + 0.1
-    rate_sleep = default_rate_sleep
-    rate_hit_counter = 0
-    while True:
-        try:
-            alias_id = queue.get_nowait()
-        except asyncio.QueueEmpty:
-            return
-
-        alias = Alias.get(alias_id)
-        if not alias:
-            continue
-        user = alias.user
-        if user.disabled or not user.is_premium():
-            # Mark it as hibp done to skip it as if it had been checked
-            alias.hibp_last_check = arrow.utcnow()
-            Session.commit()
-            continue
-        if alias.is_created_from_partner():
-            # Mark as hibp done
-            alias.hibp_last_check = arrow.utcnow()
-            Session.commit()
-            continue
-
-        LOG.d("Checking HIBP for %s", alias)
-
-        request_headers = {
-            "user-agent": "SimpleLogin",
-            "hibp-api-key": api_key,
-        }
-        r = requests.get(
-            f"https://haveibeenpwned.com/api/v3/breachedaccount/{urllib.parse.quote(alias.email)}",
-            headers=request_headers,
-        )
-        if r.status_code == 200:
-            # Breaches found
-            alias.hibp_breaches = [
-                Hibp.get_by(name=entry["Name"]) for entry in r.json()
-            ]
-            if len(alias.hibp_breaches) > 0:
-                LOG.w("%s appears in HIBP breaches %s", alias, alias.hibp_breaches)
-            if rate_hit_counter > 0:
-                rate_hit_counter -= 1
-        elif r.status_code == 404:
-            # No breaches found
-            alias.hibp_breaches = []
-        elif r.status_code == 429:
-            # rate limited
-            LOG.w("HIBP rate limited, check alias %s in the next run", alias)
-            rate_hit_counter += 1
-            rate_sleep = default_rate_sleep + (0.2 * rate_hit_counter)
-            if rate_hit_counter > 10:
-                LOG.w(f"HIBP rate limited too many times stopping with alias {alias}")
-                return
-            # Just sleep for a while
-            asyncio.sleep(5)
-        elif r.status_code > 500:
-            LOG.w("HIBP server 5** error %s", r.status_code)
-            return
-        else:
-            LOG.error(
-                "An error occurred while checking alias %s: %s - %s",
-                alias,
-                r.status_code,
-                r.text,
-            )
-            return
-
-        alias.hibp_last_check = arrow.utcnow()
-        Session.add(alias)
-        Session.commit()
-
-        LOG.d("Updated breach info for %s", alias)
-        await asyncio.sleep(rate_sleep)
-
-
-def get_alias_to_check_hibp(
-    oldest_hibp_allowed: arrow.Arrow,
-    user_ids_to_skip: list[int],
-    min_alias_id: int,
-    max_alias_id: int,
-):
-    now = arrow.now()
-    alias_query = (
-        Session.query(Alias)
-        .join(User, User.id == Alias.user_id)
-        .join(Subscription, User.id == Subscription.user_id, isouter=True)
-        .join(ManualSubscription, User.id == ManualSubscription.user_id, isouter=True)
-        .join(AppleSubscription, User.id == AppleSubscription.user_id, isouter=True)
-        .join(
-            CoinbaseSubscription,
-            User.id == CoinbaseSubscription.user_id,
-            isouter=True,
-        )
-        .join(PartnerUser, User.id == PartnerUser.user_id, isouter=True)
-        .join(
-            PartnerSubscription,
-            PartnerSubscription.partner_user_id == PartnerUser.id,
-            isouter=True,
-        )
-        .filter(
-            or_(
-                Alias.hibp_last_check.is_(None),
-                Alias.hibp_last_check < oldest_hibp_allowed,
-            ),
-            Alias.user_id.notin_(user_ids_to_skip),
-            Alias.enabled,
-            Alias.delete_on == None,  # noqa: E711
-            Alias.id >= min_alias_id,
-            Alias.id < max_alias_id,
-            User.disabled == False,  # noqa: E712
-            User.enable_data_breach_check,
-            or_(
-                User.lifetime,
-                ManualSubscription.end_at > now,
-                Subscription.next_bill_date > now.date(),
-                AppleSubscription.expires_date > now,
-                CoinbaseSubscription.end_at > now,
-                PartnerSubscription.end_at > now,
-            ),
-        )
-    )
-    if config.HIBP_SKIP_PARTNER_ALIAS:
-        alias_query = alias_query.filter(
-            Alias.flags.op("&")(Alias.FLAG_PARTNER_CREATED) == 0
-        )
-    for alias in (
-        alias_query.order_by(Alias.id.asc()).enable_eagerloads(False).yield_per(500)
-    ):
-        yield alias
+# number of users with a pending HIBP notification loaded at once
+NOTIFY_HIBP_BATCH_SIZE = 100
 
 
-async def check_hibp():
+def notify_hibp():
     """
-    Check all aliases on the HIBP (Have I Been Pwned) API
+    Send aggregated email reports for HIBP breaches
     """
-    LOG.d("Checking HIBP API for aliases in breaches")
-
-    if len(config.HIBP_API_KEYS) == 0:
-        LOG.e("No HIBP API keys")
-        return
-
-    LOG.d("Updating list of known breaches")
-    r = requests.get("https://haveibeenpwned.com/api/v3/breaches")
-    for entry in r.json():
-        hibp_entry = Hibp.get_or_create(name=entry["Name"])
-        hibp_entry.date = arrow.get(entry["BreachDate"])
-        hibp_entry.description = entry["Description"]
-
-    Session.commit()
-    LOG.d("Updated list of known breaches")
-
-    LOG.d("Getting the list of users to skip")
-    query = "select u.id, count(a.id) from users u, alias a where a.user_id=u.id group by u.id having count(a.id) > :max_alias"
-    rows = Session.execute(query, {"max_alias": config.HIBP_MAX_ALIAS_CHECK})
-    user_ids = [row[0] for row in rows]
-    LOG.d("Got %d users to skip" % len(user_ids))
-
-    LOG.d("Checking aliases")
-    queue = asyncio.Queue()
-    min_alias_id = 0
-    max_alias_id = Session.query(func.max(Alias.id)).scalar()
-    step = 10000
-    now = arrow.now()
-    oldest_hibp_allowed = now.shift(days=-config.HIBP_SCAN_INTERVAL_DAYS)
-    alias_checked = 0
-    for alias_batch_id in range(min_alias_id, max_alias_id, step):
-        for alias in get_alias_to_check_hibp(
-            oldest_hibp_allowed, user_ids, alias_batch_id, alias_batch_id + step
-        ):
-            await queue.put(alias.id)
-
-        alias_checked += queue.qsize()
-        LOG.d(
-            f"Need to check about {queue.qsize()} aliases in this loop {alias_batch_id}/{max_alias_id}"
-        )
-
-        # Start one checking process per API key
-        # Each checking process will take one alias from the queue, get the info
-        # and then sleep for 1.5 seconds (due to HIBP API request limits)
-        checkers = []
-        for i in range(len(config.HIBP_API_KEYS)):
-            checker = asyncio.create_task(
-                _hibp_check(
-                    config.HIBP_API_KEYS[i],
-                    queue,
-                )
-            )
-            checkers.append(checker)
+    # the users that have at least a breached alias not notified yet
+    last_user_id = 0
+    while True:
+        user_ids = [
+            user_id
+            for (user_id,) in Session.query(HibpPendingNotification.user_id)
+            .filter(HibpPendingNotification.user_id > last_user_id)
+            .distinct()
+            .order_by(HibpPendingNotification.user_id)
+            .limit(NOTIFY_HIBP_BATCH_SIZE)
+        ]
+        if not user_ids:
+            break
+        last_user_id = user_ids[-1]
 
-        # Wait until all checking processes are done
-        for checker in checkers:
-            await checker
+        for user in User.filter(User.id.in_(user_ids)):
+            notify_user_of_hibp_breaches(user)
 
-    LOG.d(f"Done checking {alias_checked} HIBP API for aliases in breaches")
 
+def notify_user_of_hibp_breaches(user: User):
+    if not user.can_send_or_receive():
+        # keep the pending notifications until the user can receive emails again
+        return
 
-def notify_hibp():
-    """
-    Send aggregated email reports for HIBP breaches
-    """
-    # to get a list of users that have at least a breached alias
-    alias_query = (
+    breached_aliases = (
         Session.query(Alias)
         .options(joinedload(Alias.hibp_breaches))
-        .filter(Alias.hibp_breaches.any())
-        .filter(Alias.id.notin_(Session.query(HibpNotifiedAlias.alias_id)))
-        .distinct(Alias.user_id)
+        .filter(Alias.hibp_breaches.any(), Alias.user_id == user.id)
         .all()
     )
+    pending = HibpPendingNotification.filter_by(user_id=user.id)
+    if not breached_aliases:
+        # the pending aliases aren't breached anymore
+        LOG.d("No breached alias left to notify for %s", user)
+        pending.delete(synchronize_session=False)
+        Session.commit()
+        return
 
-    user_ids = [alias.user_id for alias in alias_query]
-
-    for user in User.filter(User.id.in_(user_ids)):
-        breached_aliases = (
-            Session.query(Alias)
-            .options(joinedload(Alias.hibp_breaches))
-            .filter(Alias.hibp_breaches.any(), Alias.user_id == user.id)
-            .all()
-        )
-        if not user.can_send_or_receive():
-            continue
+    LOG.d(
+        "Send new breaches found email to %s for %s breaches aliases",
+        user,
+        len(breached_aliases),
+    )
 
-        LOG.d(
-            "Send new breaches found email to %s for %s breaches aliases",
-            user,
-            len(breached_aliases),
-        )
+    send_email(
+        user.email,
+        "You were in a data breach",
+        render(
+            "transactional/hibp-new-breaches.txt.jinja2",
+            user=user,
+            breached_aliases=breached_aliases,
+        ),
+        render(
+            "transactional/hibp-new-breaches.html",
+            user=user,
+            breached_aliases=breached_aliases,
+        ),
+        retries=3,
+    )
 
-        send_email(
-            user.email,
-            "You were in a data breach",
-            render(
-                "transactional/hibp-new-breaches.txt.jinja2",
-                user=user,
-                breached_aliases=breached_aliases,
-            ),
-            render(
-                "transactional/hibp-new-breaches.html",
-                user=user,
-                breached_aliases=breached_aliases,
-            ),
-            retries=3,
+    # move the pending aliases to HibpNotifiedAlias to avoid sending another email
+    now = literal(arrow.utcnow().naive)
+    Session.execute(
+        HibpNotifiedAlias.__table__.insert().from_select(
+            ["created_at", "notified_at", "user_id", "alias_id"],
+            pending.with_entities(
+                now,
+                now,
+                HibpPendingNotification.user_id,
+                HibpPendingNotification.alias_id,
+            ).statement,
         )
-
-        # add the breached aliases to HibpNotifiedAlias to avoid sending another email
-        for alias in breached_aliases:
-            HibpNotifiedAlias.create(user_id=user.id, alias_id=alias.id)
-        Session.commit()
+    )
+    pending.delete(synchronize_session=False)
+    Session.commit()
 
 
 def clear_users_scheduled_to_be_deleted(dry_run=False):
-    users: List[User] = User.filter(
-        and_(
-            User.delete_on.isnot(None),
-            User.delete_on <= arrow.now().shift(days=-DELETE_GRACE_DAYS),
-        )
-    ).all()
-    for user in users:
-        LOG.i(
-            f"Scheduled deletion of user {user} with scheduled delete on {user.delete_on}"
-        )
-        if dry_run:
-            continue
-        emit_user_audit_log(
-            user=user,
-            action=UserAuditLogAction.DeleteUser,
-            message=f"Delete user {user.id} ({user.email})",
-        )
-        User.delete(user.id)
-        Session.commit()
+    nb_jobs = schedule_user_deletions(dry_run=dry_run)
+    LOG.i(f"Created {nb_jobs} scheduled user deletion jobs")
 
 
 def delete_old_data():
@@ -1262,60 +985,64 @@ if __name__ == "__main__":
     args = parser.parse_args()
     # wrap in an app context to benefit from app setup like database cleanup, sentry integration, etc
     with create_light_app().app_context():
-        if args.job == "stats":
-            LOG.d("Compute growth and daily monitoring stats")
-            stats()
-        elif args.job == "notify_trial_end":
-            LOG.d("Notify users with trial ending soon")
-            notify_trial_end()
-        elif args.job == "notify_manual_subscription_end":
-            LOG.d("Notify users with manual subscription ending soon")
-            notify_manual_sub_end()
-        elif args.job == "notify_premium_end":
-            LOG.d("Notify users with premium ending soon")
-            notify_premium_end()
-        elif args.job == "delete_logs":
-            LOG.d("Deleted Logs")
-            delete_logs()
-        elif args.job == "delete_old_data":
-            LOG.d("Delete old data")
-            delete_old_data()
-        elif args.job == "poll_apple_subscription":
-            LOG.d("Poll Apple Subscriptions")
-            poll_apple_subscription()
-        elif args.job == "sanity_check":
-            LOG.d("Check data consistency")
-            sanity_check()
-        elif args.job == "delete_old_monitoring":
-            LOG.d("Delete old monitoring records")
-            delete_old_monitoring()
-        elif args.job == "check_custom_domain":
-            LOG.d("Check custom domain")
-            check_all_custom_domains()
-        elif args.job == "check_hibp":
-            LOG.d("Check HIBP")
-            asyncio.run(check_hibp())
-        elif args.job == "notify_hibp":
-            LOG.d("Notify users about HIBP breaches")
-            notify_hibp()
-        elif args.job == "cleanup_tokens":
-            LOG.d("Cleanup expired tokens")
-            delete_expired_tokens()
-        elif args.job == "send_undelivered_mails":
-            LOG.d("Sending undelivered emails")
-            load_unsent_mails_from_fs_and_resend()
-        elif args.job == "delete_scheduled_users":
-            LOG.d("Deleting users scheduled to be deleted")
-            clear_users_scheduled_to_be_deleted()
-        elif args.job == "clear_alias_audit_log":
-            LOG.d("Clearing alias audit log")
-            clear_alias_audit_log()
-        elif args.job == "clear_user_audit_log":
-            LOG.d("Clearing user audit log")
-            clear_user_audit_log()
-        elif args.job == "clear_alias_delete_on":
-            LOG.d("Clearing aliases pending to be deleted")
-            clear_aliases_pending_to_be_deleted()
-        elif args.job == "clear_expired_oauth_token":
-            LOG.d("Clearing oauth_token entries pending to be deleted")
-            clear_oauth_token_pending_to_be_deleted()
+        with instrument(f"cron/{args.job}"):
+            if args.job == "stats":
+                LOG.d("Compute growth and daily monitoring stats")
+                stats()
+            elif args.job == "notify_trial_end":
+                LOG.d("Notify users with trial ending soon")
+                notify_trial_end()
+            elif args.job == "notify_manual_subscription_end":
+                LOG.d("Notify users with manual subscription ending soon")
+                notify_manual_sub_end()
+            elif args.job == "notify_premium_end":
+                LOG.d("Notify users with premium ending soon")
+                notify_premium_end()
+            elif args.job == "delete_logs":
+                LOG.d("Deleted Logs")
+                delete_logs()
+            elif args.job == "maintain_log_partitions":
+                LOG.d("Create upcoming log partitions")
+                maintain_log_partitions()
+            elif args.job == "delete_old_data":
+                LOG.d("Delete old data")
+                delete_old_data()
+            elif args.job == "poll_apple_subscription":
+                LOG.d("Poll Apple Subscriptions")
+                poll_apple_subscription()
+            elif args.job == "sanity_check":
+                LOG.d("Check data consistency")
+                sanity_check()
+            elif args.job == "delete_old_monitoring":
+                LOG.d("Delete old monitoring records")
+                delete_old_monitoring()
+            elif args.job == "check_custom_domain":
+                LOG.d("Check custom domain")
+                check_all_custom_domains()
+            elif args.job == "check_hibp":
+                LOG.d("Check HIBP")
+                asyncio.run(check_hibp())
+            elif args.job == "notify_hibp":
+                LOG.d("Notify users about HIBP breaches")
+                notify_hibp()
+            elif args.job == "cleanup_tokens":
+                LOG.d("Cleanup expired tokens")
+                delete_expired_tokens()
+            elif args.job == "send_undelivered_mails":
+                LOG.d("Sending undelivered emails")
+                load_unsent_mails_from_fs_and_resend()
+            elif args.job == "delete_scheduled_users":
+                LOG.d("Deleting users scheduled to be deleted")
+                clear_users_scheduled_to_be_deleted()
+            elif args.job == "clear_alias_audit_log":
+                LOG.d("Clearing alias audit log")
+                clear_alias_audit_log()
+            elif args.job == "clear_user_audit_log":
+                LOG.d("Clearing user audit log")
+                clear_user_audit_log()
+            elif args.job == "clear_alias_delete_on":
+                LOG.d("Clearing aliases pending to be deleted")
+                clear_aliases_pending_to_be_deleted()
+            elif args.job == "clear_expired_oauth_token":
+                LOG.d("Clearing oauth_token entries pending to be deleted")
+                clear_oauth_token_pending_to_be_deleted()
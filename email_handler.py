@@ -124,6 +124,7 @@ from app.handler.spamd_result import (
 )
 from app.handler.unsubscribe_generator import UnsubscribeGenerator
 from app.handler.unsubscribe_handler import UnsubscribeHandler
+from app.instrumentation import instrument
 from app.log import LOG, set_message_id
 from app.mail_sender import sl_sendmail
 from app.mailbox_utils import (
@@ -131,6 +132,13 @@ from app.mailbox_utils import (
     quarantine_disabled_mailbox_email,
 )
 from app.message_utils import message_to_bytes
+from app.metrics import (
+    REGISTRY,
+    COUNTER,
+    SIZE_BUCKETS,
+    record_custom_metric,
+    start_metrics_server,
+)
 from app.models import (
     Alias,
     Contact,
@@ -159,6 +167,12 @@ from app.utils import sanitize_email
 from init_app import load_pgp_public_keys
 from server import create_light_app
 
+_EMAIL_HANDLER_TIME = REGISTRY.histogram(
+    "sl_email_handler_seconds",
+    "Time to handle an incoming email, by SMTP status code",
+    ["status"],
+)
+
 
 @sentry_sdk.trace
 def get_or_create_contact(
@@ -1246,9 +1260,7 @@ def handle_reply(
                 contact_query.count(),
                 elapsed,
             )
-            newrelic.agent.record_custom_metric(
-                "Custom/reverse_alias_replacement_time", elapsed
-            )
+            record_custom_metric("Custom/reverse_alias_replacement_time", elapsed)
 
     # create PGP email if needed
     if contact.pgp_finger_print and user.is_premium():
@@ -2437,14 +2449,15 @@ class MailHandler:
             envelope.mail_from,
             envelope.rcpt_tos,
         )
-        newrelic.agent.record_custom_metric(
-            "Custom/nb_rcpt_tos", len(envelope.rcpt_tos)
+        record_custom_metric(
+            "Custom/nb_rcpt_tos", len(envelope.rcpt_tos), buckets=SIZE_BUCKETS
         )
 
         send_version_event("email_handler")
         with create_light_app().app_context():
             with sentry_sdk.start_transaction(op="email-handler", name="Process email"):
-                return_status = handle(envelope, msg)
+                with instrument("email_handler"):
+                    return_status = handle(envelope, msg)
                 elapsed = time.time() - start
                 # Only bounce messages if the return-path passes the spf check. Otherwise black-hole it.
                 spamd_result = SpamdResult.extract_from_headers(msg)
@@ -2467,10 +2480,9 @@ class MailHandler:
                 )
 
                 SpamdResult.send_to_new_relic(msg)
-                newrelic.agent.record_custom_metric(
-                    "Custom/email_handler_time", elapsed
-                )
-                newrelic.agent.record_custom_metric("Custom/number_incoming_email", 1)
+                _EMAIL_HANDLER_TIME.observe(elapsed, status=return_status[:3])
+                record_custom_metric("Custom/email_handler_time", elapsed)
+                record_custom_metric("Custom/number_incoming_email", 1, kind=COUNTER)
                 return return_status
 
 
@@ -2485,6 +2497,7 @@ def main(port: int):
 
     controller.start()
     LOG.d("Start mail controller %s %s", controller.hostname, controller.port)
+    start_metrics_server()
     send_version_event("email_handler")
 
     if config.LOAD_PGP_EMAIL_HANDLER:
@@ -4,6 +4,7 @@ from sys import argv, exit
 
 from app.config import EVENT_LISTENER_DB_URI
 from app.log import LOG
+from app.metrics import start_metrics_server
 from app.monitor_utils import send_version_event
 from events import event_debugger
 from events.runner import Runner
@@ -47,6 +48,7 @@ def main(mode: Mode, dry_run: bool, max_retries: int):
         sink = HttpEventSink()
 
     send_version_event(service_name)
+    start_metrics_server()
     runner = Runner(source=source, sink=sink, service_name=service_name)
     runner.run()
 
@@ -7,8 +7,13 @@ from abc import ABC, abstractmethod
 
 from app.db import Session
 from app.log import LOG
+from app.metrics import GAUGE, record_custom_metric
 from app.models import SyncEvent
-from app.events.event_dispatcher import NOTIFICATION_CHANNEL
+from app.events.event_dispatcher import (
+    NOTIFICATION_CHANNEL,
+    NOTIFICATION_IDS_CHANNEL,
+    parse_notification_payload,
+)
 from time import sleep
 from typing import Callable, NoReturn
 
@@ -45,6 +50,7 @@ class PostgresEventSource(EventSource):
 
         cursor = self.__connection.cursor()
         cursor.execute(f"LISTEN {NOTIFICATION_CHANNEL};")
+        cursor.execute(f"LISTEN {NOTIFICATION_IDS_CHANNEL};")
 
         LOG.info("Starting to listen to events")
         while True:
@@ -56,17 +62,22 @@ class PostgresEventSource(EventSource):
                         f"Got NOTIFY: pid={notify.pid} channel={notify.channel} payload={notify.payload}"
                     )
                     try:
-                        webhook_id = int(notify.payload)
-                        event = SyncEvent.get_by(id=webhook_id)
-                        if event is not None:
+                        # an event id, or several on the ids channel
+                        event_ids = parse_notification_payload(notify.payload)
+                        events = (
+                            SyncEvent.filter(SyncEvent.id.in_(event_ids))
+                            .order_by(SyncEvent.id)
+                            .all()
+                        )
+                        if not events:
+                            LOG.info(f"Could not find event with id={notify.payload}")
+                        for event in events:
                             if event.mark_as_taken():
                                 on_event(event)
                             else:
                                 LOG.info(
                                     f"Event {event.id} was handled by another runner"
                                 )
-                        else:
-                            LOG.info(f"Could not find event with id={notify.payload}")
                     except Exception as e:
                         LOG.warning(f"Error getting event: {e}")
                     Session.close()  # Ensure we get a new connection and we don't leave a dangling tx
@@ -94,8 +105,8 @@ class DeadLetterEventSource(EventSource):
         )
         if events:
             LOG.info(f"Got {len(events)} dead letter events")
-            newrelic.agent.record_custom_metric(
-                "Custom/dead_letter_events_to_process", len(events)
+            record_custom_metric(
+                "Custom/dead_letter_events_to_process", len(events), kind=GAUGE
             )
             for event in events:
                 if event.mark_as_taken(allow_taken_older_than=threshold):
@@ -3,6 +3,7 @@ import newrelic.agent
 
 from app.log import LOG
 from app.db import Session
+from app.metrics import COUNTER, record_custom_metric
 from app.models import SyncEvent
 from app.monitor_utils import send_version_event
 from events.event_sink import EventSink
@@ -34,11 +35,11 @@ class Runner:
                 end_time = arrow.now() - start_time
                 time_between_taken_and_created = start_time - event_created_at
 
-                newrelic.agent.record_custom_metric("Custom/sync_event_processed", 1)
-                newrelic.agent.record_custom_metric(
+                record_custom_metric("Custom/sync_event_processed", 1, kind=COUNTER)
+                record_custom_metric(
                     "Custom/sync_event_process_time", end_time.total_seconds()
                 )
-                newrelic.agent.record_custom_metric(
+                record_custom_metric(
                     "Custom/sync_event_elapsed_time",
                     time_between_taken_and_created.total_seconds(),
                 )
@@ -47,4 +48,4 @@ class Runner:
                 Session.commit()
         except Exception as e:
             LOG.warning(f"Exception processing event [id={event.id}]: {e}")
-            newrelic.agent.record_custom_metric("Custom/sync_event_failed", 1)
+            record_custom_metric("Custom/sync_event_failed", 1, kind=COUNTER)
@@ -22,12 +22,16 @@ from app.email_utils import (
 )
 from app.events.event_dispatcher import PostgresDispatcher
 from app.import_utils import handle_batch_import
+from app.jobs.delete_scheduled_user_job import DeleteScheduledUserJob
 from app.jobs.event_jobs import send_alias_creation_events_for_user
 from app.jobs.export_user_data_job import ExportUserDataJob
 from app.jobs.mark_abuser_job import MarkAbuserJob
 from app.jobs.send_event_job import SendEventToWebhookJob
 from app.jobs.sync_subscription_job import SyncSubscriptionJob
+from app.instrumentation import instrument
 from app.log import LOG
+from app.metrics import REGISTRY, start_metrics_server
+from app.mailbox_utils import transfer_mailbox_aliases
 from app.models import User, Job, BatchImport, Mailbox, JobState
 from app.monitor_utils import send_version_event
 from app.user_audit_log_utils import emit_user_audit_log, UserAuditLogAction
@@ -37,6 +41,10 @@ from tasks.delete_custom_domain_job import DeleteCustomDomainJob
 
 _MAX_JOBS_PER_BATCH = 50
 
+_JOB_TIME = REGISTRY.histogram(
+    "sl_job_seconds", "Time to process a job, by job type and result", ["job", "result"]
+)
+
 
 def onboarding_send_from_alias(user):
     comm_email, unsubscribe_link, via_email = user.get_communication_email()
@@ -157,23 +165,22 @@ def delete_mailbox_job(job: Job):
     if not mailbox:
         return
 
+    def report_progress(step: str, nb_alias: int = 0):
+        # payload is a plain JSON column, it needs to be reassigned to be saved
+        job.payload = {**job.payload, "progress": {"step": step, "nb_alias": nb_alias}}
+        Session.commit()
+
     transfer_mailbox_id = job.payload.get("transfer_mailbox_id")
     alias_transferred_to = None
     if transfer_mailbox_id:
         transfer_mailbox = Mailbox.get(transfer_mailbox_id)
         if transfer_mailbox:
             alias_transferred_to = transfer_mailbox.email
-
-            for alias in mailbox.aliases:
-                if alias.mailbox_id == mailbox.id:
-                    alias.mailbox_id = transfer_mailbox.id
-                    if transfer_mailbox in alias._mailboxes:
-                        alias._mailboxes.remove(transfer_mailbox)
-                else:
-                    alias._mailboxes.remove(mailbox)
-                    if transfer_mailbox not in alias._mailboxes:
-                        alias._mailboxes.append(transfer_mailbox)
-                Session.commit()
+            transfer_mailbox_aliases(
+                mailbox,
+                transfer_mailbox,
+                on_progress=lambda nb_alias: report_progress("transfer", nb_alias),
+            )
 
     mailbox_email = mailbox.email
     user = mailbox.user
@@ -183,8 +190,10 @@ def delete_mailbox_job(job: Job):
         action=UserAuditLogAction.DeleteMailbox,
         message=f"Delete mailbox {mailbox.id} ({mailbox.email})",
     )
+    report_progress("delete")
     Mailbox.delete(mailbox_id)
     Session.commit()
+    report_progress("done")
     LOG.d("Mailbox %s %s deleted", mailbox_id, mailbox_email)
 
     if not job.payload.get("send_mail", True):
@@ -282,6 +291,8 @@ def process_job(job: Job):
         export_job = ExportUserDataJob.create_from_job(job)
         if export_job:
             export_job.run()
+    elif job.name == JobType.DELETE_USER_EXPORT.value:
+        ExportUserDataJob.delete_upload(job)
     elif job.name == JobType.SEND_PROTON_WELCOME_1.value:
         user_id = job.payload.get("user_id")
         user = User.get(user_id)
@@ -308,6 +319,10 @@ def process_job(job: Job):
         mark_abuser_job = MarkAbuserJob.create_from_job(job)
         if mark_abuser_job:
             mark_abuser_job.run()
+    elif job.name == JobType.DELETE_SCHEDULED_USER.value:
+        delete_user_job = DeleteScheduledUserJob.create_from_job(job)
+        if delete_user_job:
+            delete_user_job.run()
     else:
         LOG.e("Unknown job name %s", job.name)
 
@@ -380,9 +395,11 @@ def execute():
                 continue
             LOG.d("Take job %s", job)
 
+            job_start = time.time()
             try:
                 newrelic.agent.record_custom_event("ProcessJob", {"job": job.name})
-                process_job(job)
+                with instrument(f"job/{job.name}"):
+                    process_job(job)
                 job_result = "success"
 
                 job.state = JobState.done.value
@@ -406,6 +423,7 @@ def execute():
             newrelic.agent.record_custom_event(
                 "JobProcessed", {"job": job.name, "result": job_result}
             )
+            _JOB_TIME.observe(time.time() - job_start, job=job.name, result=job_result)
             Session.commit()
 
         if jobs_done == 0:
@@ -414,6 +432,7 @@ def execute():
 
 if __name__ == "__main__":
     send_version_event("job_runner")
+    start_metrics_server()
     while True:
         try:
             execute()
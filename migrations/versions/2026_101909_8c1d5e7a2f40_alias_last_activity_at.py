@@ -0,0 +1,56 @@
+"""Add alias.last_activity_at for keyset pagination
+
+Revision ID: 8c1d5e7a2f40
+Revises: 4a9f8c2e1b3d
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+import sqlalchemy_utils
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d5e7a2f40'
+down_revision = '4a9f8c2e1b3d'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 10000
+
+
+def upgrade():
+    op.add_column('alias', sa.Column('last_activity_at', sqlalchemy_utils.types.arrow.ArrowType(), nullable=True))
+    # for the aliases created by the running code until it's updated
+    op.alter_column('alias', 'last_activity_at', server_default=sa.text("(now() at time zone 'utc')"))
+    with op.get_context().autocommit_block():
+        # the keyset pagination can't skip NULL rows: fill the existing aliases by batches of
+        # ids, each committed on its own so the rows aren't all locked at once. greatest()
+        # ignores the missing email logs
+        max_id = op.get_bind().execute("SELECT max(id) FROM alias").scalar() or 0
+        for start in range(0, max_id, BATCH_SIZE):
+            op.execute(
+                f"""
+                UPDATE alias SET last_activity_at = greatest(alias.created_at, email_log.created_at)
+                FROM alias a LEFT JOIN email_log ON email_log.id = a.last_email_log_id
+                WHERE alias.id = a.id AND alias.last_activity_at IS NULL
+                AND alias.id > {start} AND alias.id <= {start + BATCH_SIZE}
+                """
+            )
+        # SET NOT NULL alone scans the table under an ACCESS EXCLUSIVE lock, it skips the
+        # scan with a validated check constraint, which doesn't block the reads and writes
+        op.execute(
+            "ALTER TABLE alias ADD CONSTRAINT alias_last_activity_at_not_null "
+            "CHECK (last_activity_at IS NOT NULL) NOT VALID"
+        )
+        op.execute("ALTER TABLE alias VALIDATE CONSTRAINT alias_last_activity_at_not_null")
+        op.alter_column('alias', 'last_activity_at', existing_type=sqlalchemy_utils.types.arrow.ArrowType(), nullable=False)
+        op.drop_constraint('alias_last_activity_at_not_null', 'alias', type_='check')
+        op.create_index('ix_alias_user_id_pinned_last_activity_at_id', 'alias', ['user_id', 'pinned', 'last_activity_at', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_alias_user_id_pinned_last_activity_at_id', table_name='alias', postgresql_concurrently=True)
+    op.drop_column('alias', 'last_activity_at')
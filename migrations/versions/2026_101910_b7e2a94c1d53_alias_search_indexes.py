@@ -0,0 +1,61 @@
+"""Add alias search indexes
+
+Revision ID: b7e2a94c1d53
+Revises: 8c1d5e7a2f40
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e2a94c1d53"
+down_revision = "8c1d5e7a2f40"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_alias_email_trgm_idx",
+            "alias",
+            ["email"],
+            unique=False,
+            postgresql_ops={"email": "gin_trgm_ops"},
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_alias_name_trgm_idx",
+            "alias",
+            ["name"],
+            unique=False,
+            postgresql_ops={"name": "gin_trgm_ops"},
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_partner_user_partner_email_trgm_idx",
+            "partner_user",
+            ["partner_email"],
+            unique=False,
+            postgresql_ops={"partner_email": "gin_trgm_ops"},
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_partner_user_partner_email_trgm_idx",
+            table_name="partner_user",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_alias_name_trgm_idx", table_name="alias", postgresql_concurrently=True
+        )
+        op.drop_index(
+            "ix_alias_email_trgm_idx", table_name="alias", postgresql_concurrently=True
+        )
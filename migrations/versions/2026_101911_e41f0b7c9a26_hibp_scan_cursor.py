@@ -0,0 +1,32 @@
+"""Add hibp_scan_cursor
+
+Revision ID: e41f0b7c9a26
+Revises: b7e2a94c1d53
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+import sqlalchemy_utils
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41f0b7c9a26'
+down_revision = 'b7e2a94c1d53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'hibp_scan_cursor',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('created_at', sqlalchemy_utils.types.arrow.ArrowType(), nullable=False),
+        sa.Column('updated_at', sqlalchemy_utils.types.arrow.ArrowType(), nullable=True),
+        sa.Column('last_alias_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('hibp_scan_cursor')
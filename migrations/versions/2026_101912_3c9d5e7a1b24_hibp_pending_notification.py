@@ -0,0 +1,50 @@
+"""Add hibp_pending_notification
+
+Revision ID: 3c9d5e7a1b24
+Revises: e41f0b7c9a26
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+import sqlalchemy_utils
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d5e7a1b24'
+down_revision = 'e41f0b7c9a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'hibp_pending_notification',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('created_at', sqlalchemy_utils.types.arrow.ArrowType(), nullable=False),
+        sa.Column('updated_at', sqlalchemy_utils.types.arrow.ArrowType(), nullable=True),
+        sa.Column('alias_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['alias_id'], ['alias.id'], ondelete='cascade'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('alias_id')
+    )
+    op.create_index('ix_hibp_pending_notification_user_id', 'hibp_pending_notification', ['user_id'], unique=False)
+    # breached aliases found before this table existed and not notified yet
+    op.execute(
+        """
+        INSERT INTO hibp_pending_notification (created_at, alias_id, user_id)
+        SELECT DISTINCT ON (alias.id) now(), alias.id, alias.user_id
+        FROM alias_hibp
+        JOIN alias ON alias.id = alias_hibp.alias_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM hibp_notified_alias WHERE hibp_notified_alias.alias_id = alias.id
+        )
+        """
+    )
+
+
+def downgrade():
+    op.drop_index('ix_hibp_pending_notification_user_id', table_name='hibp_pending_notification')
+    op.drop_table('hibp_pending_notification')
@@ -0,0 +1,27 @@
+"""Drop the message_id_matching.email_log_id foreign key so email_log can be partitioned
+
+Revision ID: 5d2a7c9e3f18
+Revises: 3c9d5e7a1b24
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2a7c9e3f18'
+down_revision = '3c9d5e7a1b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('message_id_matching_email_log_id_fkey', 'message_id_matching', type_='foreignkey')
+
+
+def downgrade():
+    op.execute(
+        "DELETE FROM message_id_matching WHERE email_log_id IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM email_log WHERE email_log.id = email_log_id)"
+    )
+    op.create_foreign_key('message_id_matching_email_log_id_fkey', 'message_id_matching', 'email_log', ['email_log_id'], ['id'], ondelete='cascade')
@@ -0,0 +1,25 @@
+"""Index the jobs by name, state and updated_at for the user deletion monitoring
+
+Revision ID: 9b4e6f2a7c31
+Revises: 5d2a7c9e3f18
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e6f2a7c31'
+down_revision = '5d2a7c9e3f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_job_name_state_updated_at', 'job', ['name', 'state', 'updated_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_job_name_state_updated_at', table_name='job', postgresql_concurrently=True)
@@ -7,9 +7,16 @@ from typing import List, Dict
 import arrow
 import newrelic.agent
 
-from app.models import JobState
+from app.metrics import GAUGE, record_custom_metric
+from app.models import Job, JobState, User
 from app.config import JOB_MAX_ATTEMPTS, JOB_TAKEN_RETRY_WAIT_MINS
+from app.constants import JobType
 from app.db import Session
+from app.jobs.delete_scheduled_user_job import (
+    deletion_cutoff,
+    due_users_condition,
+    pending_deletion_jobs_query,
+)
 from app.log import LOG
 from job_runner import get_jobs_to_run_query
 from monitor.metric_exporter import MetricExporter
@@ -46,15 +53,15 @@ def log_postfix_metrics():
     deferred_queue = nb_files("/var/spool/postfix/deferred")
     LOG.d("postfix queue sizes %s %s %s", incoming_queue, active_queue, deferred_queue)
 
-    newrelic.agent.record_custom_metric("Custom/postfix_incoming_queue", incoming_queue)
-    newrelic.agent.record_custom_metric("Custom/postfix_active_queue", active_queue)
-    newrelic.agent.record_custom_metric("Custom/postfix_deferred_queue", deferred_queue)
+    record_custom_metric("Custom/postfix_incoming_queue", incoming_queue, kind=GAUGE)
+    record_custom_metric("Custom/postfix_active_queue", active_queue, kind=GAUGE)
+    record_custom_metric("Custom/postfix_deferred_queue", deferred_queue, kind=GAUGE)
 
     proc_counts = get_num_procs(["smtp", "smtpd", "bounce", "cleanup"])
     for proc_name in proc_counts:
         LOG.d(f"Process count {proc_counts}")
-        newrelic.agent.record_custom_metric(
-            f"Custom/process_{proc_name}_count", proc_counts[proc_name]
+        record_custom_metric(
+            f"Custom/process_{proc_name}_count", proc_counts[proc_name], kind=GAUGE
         )
 
 
@@ -94,7 +101,7 @@ def log_nb_db_connection():
     nb_connection = list(r)[0][0]
 
     LOG.d("number of db connections %s", nb_connection)
-    newrelic.agent.record_custom_metric("Custom/nb_db_connections", nb_connection)
+    record_custom_metric("Custom/nb_db_connections", nb_connection, kind=GAUGE)
 
 
 @newrelic.agent.background_task()
@@ -106,8 +113,11 @@ def log_nb_db_connection_by_app_name():
     for row in rows:
         if row[0].find("sl-") == 0:
             LOG.d("number of db connections for app %s = %s", row[0], row[1])
-            newrelic.agent.record_custom_metric(
-                f"Custom/nb_db_app_connection/{row[0]}", row[1]
+            record_custom_metric(
+                "Custom/nb_db_app_connection",
+                row[1],
+                kind=GAUGE,
+                labels={"name": row[0]},
             )
 
 
@@ -117,8 +127,8 @@ def log_pending_to_process_events():
     events_pending = list(r)[0][0]
 
     LOG.d("number of events pending to process %s", events_pending)
-    newrelic.agent.record_custom_metric(
-        "Custom/sync_events_pending_to_process", events_pending
+    record_custom_metric(
+        "Custom/sync_events_pending_to_process", events_pending, kind=GAUGE
     )
 
 
@@ -137,8 +147,8 @@ def log_events_pending_dead_letter():
     events_pending = list(r)[0][0]
 
     LOG.d("number of events pending dead letter %s", events_pending)
-    newrelic.agent.record_custom_metric(
-        "Custom/sync_events_pending_dead_letter", events_pending
+    record_custom_metric(
+        "Custom/sync_events_pending_dead_letter", events_pending, kind=GAUGE
     )
 
 
@@ -154,7 +164,7 @@ def log_failed_events():
     failed_events = list(r)[0][0]
 
     LOG.d("number of failed events %s", failed_events)
-    newrelic.agent.record_custom_metric("Custom/sync_events_failed", failed_events)
+    record_custom_metric("Custom/sync_events_failed", failed_events, kind=GAUGE)
 
 
 @newrelic.agent.background_task()
@@ -163,7 +173,7 @@ def log_jobs_to_run():
     query = get_jobs_to_run_query(taken_before_time)
     count = query.count()
     LOG.d(f"Pending jobs to run: {count}")
-    newrelic.agent.record_custom_metric("Custom/jobs_to_run", count)
+    record_custom_metric("Custom/jobs_to_run", count, kind=GAUGE)
 
 
 @newrelic.agent.background_task()
@@ -186,7 +196,28 @@ def log_failed_jobs():
     failed_jobs = list(r)[0][0]
 
     LOG.d(f"Failed jobs: {failed_jobs}")
-    newrelic.agent.record_custom_metric("Custom/failed_jobs", failed_jobs)
+    record_custom_metric("Custom/failed_jobs", failed_jobs, kind=GAUGE)
+
+
+@newrelic.agent.background_task()
+def log_scheduled_user_deletions():
+    due_users = User.filter(due_users_condition(deletion_cutoff())).count()
+    pending_jobs = pending_deletion_jobs_query().count()
+    deleted_last_hour = Job.filter(
+        Job.name == JobType.DELETE_SCHEDULED_USER.value,
+        Job.state == JobState.done.value,
+        Job.updated_at > arrow.now().shift(hours=-1),
+    ).count()
+
+    LOG.d(
+        f"Users due for deletion: {due_users}, pending deletion jobs: {pending_jobs}, "
+        f"deleted in the last hour: {deleted_last_hour}"
+    )
+    record_custom_metric("Custom/users_due_for_deletion", due_users, kind=GAUGE)
+    record_custom_metric("Custom/user_deletion_jobs_pending", pending_jobs, kind=GAUGE)
+    record_custom_metric(
+        "Custom/users_deleted_last_hour", deleted_last_hour, kind=GAUGE
+    )
 
 
 if __name__ == "__main__":
@@ -200,6 +231,7 @@ if __name__ == "__main__":
         log_nb_db_connection_by_app_name()
         log_jobs_to_run()
         log_failed_jobs()
+        log_scheduled_user_deletions()
         Session.close()
 
         exporter.run()
@@ -1,4 +1,6 @@
 import os
+from functools import lru_cache
+
 from flask import Flask
 
 from app import config
@@ -8,7 +10,10 @@ from app.db import Session
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
 
 
+@lru_cache(maxsize=None)
 def create_light_app() -> Flask:
+    """App used by the workers for the app context only, created once per process and
+    reused for every message, job or cron task"""
     app = Flask(__name__)
     app.config["SQLALCHEMY_DATABASE_URI"] = config.DB_URI
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
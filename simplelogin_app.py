@@ -36,8 +36,10 @@ from app.discover.base import discover_bp
 from app.extensions import login_manager, limiter
 from app.fake_data import fake_data
 from app.internal.base import internal_bp
-from app.jose_utils import get_jwk_key
+from app.jose_utils import get_jwks_json
+from app.instrumentation import finish_unit, server_timing, start_unit
 from app.log import LOG
+from app.login_user_cache import get_login_user
 from app.models import (
     User,
     EmailLog,
@@ -188,7 +190,7 @@ def register_custom_commands(app):
 
 @login_manager.user_loader
 def load_user(alternative_id):
-    user = User.get_by(alternative_id=alternative_id)
+    user = get_login_user(alternative_id)
     if user:
         sentry_sdk.set_user({"email": user.email, "id": user.id})
         if user.disabled:
@@ -233,6 +235,7 @@ def set_index_page(app):
         ):
             g.start_time = time.time()
             g.request_id = generate_request_id()
+            start_unit(f"web/{request.endpoint}")
 
             # to handle the referral url that has ?slref=code part
             ref_code = request.args.get("slref")
@@ -241,6 +244,11 @@ def set_index_page(app):
 
     @app.after_request
     def after_request(res):
+        stats = finish_unit()
+        if stats and app.debug:
+            res.headers["X-Query-Count"] = str(stats.query_count)
+            res.headers["Server-Timing"] = server_timing(stats)
+
         # not logging /static call
         if (
             not request.path.startswith("/static")
@@ -266,6 +274,11 @@ def set_index_page(app):
             send_version_event("app")
         return res
 
+    @app.teardown_request
+    def teardown_request(exc):
+        # after_request isn't called when the request raised
+        finish_unit()
+
 
 def setup_openid_metadata(app):
     @app.route("/.well-known/openid-configuration")
@@ -296,8 +309,7 @@ def setup_openid_metadata(app):
     @app.route("/jwks")
     @cross_origin()
     def jwks():
-        res = {"keys": [get_jwk_key()]}
-        return jsonify(res)
+        return app.response_class(get_jwks_json(), mimetype="application/json")
 
 
 def get_current_user():
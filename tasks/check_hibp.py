@@ -0,0 +1,504 @@
+import asyncio
+import time
+import urllib.parse
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+import arrow
+import requests
+from sqlalchemy import and_, exists, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import config
+from app.db import Session
+from app.log import LOG
+from app.models import (
+    Alias,
+    AliasHibp,
+    AppleSubscription,
+    CoinbaseSubscription,
+    Hibp,
+    HibpNotifiedAlias,
+    HibpPendingNotification,
+    HibpScanCursor,
+    ManualSubscription,
+    PartnerSubscription,
+    PartnerUser,
+    Subscription,
+    User,
+)
+
+# number of alias ids covered by one candidate query
+SCAN_WINDOW = 10_000
+# number of checked aliases written per transaction
+WRITE_BATCH_SIZE = 100
+# stop a worker after being rate limited this many times in a row
+MAX_RATE_LIMIT_HITS = 10
+# used when HIBP doesn't send a Retry-After header
+DEFAULT_RETRY_AFTER = 5
+
+
+class TokenBucket:
+    """Space the requests made with an API key to respect its rate limit.
+
+    Shared by all the workers using the same key. As everything runs on the same event loop,
+    reserving a slot doesn't need any lock.
+    """
+
+    def __init__(self, rate_per_minute: int):
+        self._interval = 60.0 / rate_per_minute
+        self._next_slot = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        """Called when HIBP asks to wait with Retry-After"""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+@dataclass
+class HibpResponse:
+    status_code: int
+    breach_names: List[str]
+    retry_after: float = DEFAULT_RETRY_AFTER
+
+
+class HibpClient:
+    """Call the HIBP API without blocking the event loop.
+
+    The HTTP call runs in a thread so several requests can be in flight. Each worker has its own
+    client, hence its own HTTP connection, and the bucket of its API key.
+    """
+
+    def __init__(self, api_key: str, bucket: TokenBucket):
+        self._bucket = bucket
+        self._http = requests.Session()
+        self._http.headers.update(
+            {
+                "user-agent": "SimpleLogin",
+                "hibp-api-key": api_key,
+            }
+        )
+
+    def pause(self, seconds: float):
+        self._bucket.pause(seconds)
+
+    async def breached_account(self, email: str) -> HibpResponse:
+        await self._bucket.acquire()
+        r = await asyncio.to_thread(
+            self._http.get,
+            f"{config.HIBP_API_URL}/breachedaccount/{urllib.parse.quote(email)}",
+            timeout=30,
+        )
+        response = HibpResponse(status_code=r.status_code, breach_names=[])
+        if r.status_code == 200:
+            response.breach_names = [entry["Name"] for entry in r.json()]
+        elif r.status_code == 429:
+            try:
+                response.retry_after = float(r.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                pass
+        return response
+
+
+@dataclass
+class _Candidate:
+    alias_id: int
+    email: str
+    # end of the scan window this alias belongs to
+    window_end: int
+    # mark as checked without calling HIBP
+    skip: bool = False
+
+
+@dataclass
+class _CheckResult:
+    alias_id: int
+    window_end: int
+    # None if HIBP hasn't been called for this alias
+    breach_names: Optional[List[str]]
+
+
+class _ScanProgress:
+    """Track which scan windows have all their aliases written to the database"""
+
+    def __init__(self, start_alias_id: int):
+        self.completed_up_to = start_alias_id
+        self._windows: List[int] = []
+        self._remaining: Dict[int, int] = {}
+
+    def add_window(self, window_end: int, nb_alias: int):
+        self._windows.append(window_end)
+        self._remaining[window_end] = nb_alias
+        self._advance()
+
+    def done(self, window_end: int):
+        self._remaining[window_end] -= 1
+        self._advance()
+
+    def _advance(self):
+        while self._windows and self._remaining[self._windows[0]] == 0:
+            self.completed_up_to = self._windows.pop(0)
+            del self._remaining[self.completed_up_to]
+
+
+class _HibpResultWriter:
+    """Buffer the check results and write them in batches, along with the scan cursor"""
+
+    def __init__(
+        self, hibp_ids: Dict[str, int], progress: _ScanProgress, cursor: HibpScanCursor
+    ):
+        self._hibp_ids = hibp_ids
+        self._progress = progress
+        self._cursor = cursor
+        self._pending: List[_CheckResult] = []
+        self.nb_written = 0
+
+    def add(self, result: _CheckResult):
+        self._pending.append(result)
+        if len(self._pending) >= WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        results, self._pending = self._pending, []
+        if not results:
+            self._save_cursor()
+            return
+
+        now = arrow.utcnow()
+        checked = [r for r in results if r.breach_names is not None]
+        if checked:
+            AliasHibp.filter(
+                AliasHibp.alias_id.in_([r.alias_id for r in checked])
+            ).delete(synchronize_session=False)
+            rows = []
+            breached_alias_ids = set()
+            for result in checked:
+                for name in set(result.breach_names):
+                    hibp_id = self._hibp_ids.get(name)
+                    if hibp_id is None:
+                        LOG.w("Unknown HIBP breach %s, ignore", name)
+                        continue
+                    rows.append(
+                        {
+                            "alias_id": result.alias_id,
+                            "hibp_id": hibp_id,
+                            "created_at": now,
+                        }
+                    )
+                    breached_alias_ids.add(result.alias_id)
+                if result.breach_names:
+                    LOG.w(
+                        "Alias %s appears in HIBP breaches %s",
+                        result.alias_id,
+                        result.breach_names,
+                    )
+            if rows:
+                Session.execute(AliasHibp.__table__.insert(), rows)
+                _add_pending_notifications(breached_alias_ids, now)
+            # the aliases not breached anymore have nothing left to notify
+            not_breached_alias_ids = [
+                r.alias_id for r in checked if r.alias_id not in breached_alias_ids
+            ]
+            if not_breached_alias_ids:
+                HibpPendingNotification.filter(
+                    HibpPendingNotification.alias_id.in_(not_breached_alias_ids)
+                ).delete(synchronize_session=False)
+
+        Alias.filter(Alias.id.in_([r.alias_id for r in results])).update(
+            {Alias.hibp_last_check: now}, synchronize_session=False
+        )
+        for result in results:
+            self._progress.done(result.window_end)
+        self.nb_written += len(results)
+        self._save_cursor()
+
+    def _save_cursor(self):
+        self._cursor.last_alias_id = self._progress.completed_up_to
+        Session.commit()
+
+
+def _add_pending_notifications(alias_ids: Set[int], now: arrow.Arrow):
+    """Queue the breached aliases whose owner hasn't been notified yet for notify_hibp"""
+    Session.execute(
+        insert(HibpPendingNotification.__table__)
+        .from_select(
+            ["created_at", "alias_id", "user_id"],
+            select([literal(now.naive), Alias.id, Alias.user_id]).where(
+                and_(
+                    Alias.id.in_(list(alias_ids)),
+                    ~exists().where(HibpNotifiedAlias.alias_id == Alias.id),
+                )
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["alias_id"])
+    )
+
+
+def get_alias_to_check_hibp(
+    oldest_hibp_allowed: arrow.Arrow,
+    user_ids_to_skip: list[int],
+    min_alias_id: int,
+    max_alias_id: int,
+):
+    now = arrow.now()
+    alias_query = (
+        Session.query(Alias)
+        .join(User, User.id == Alias.user_id)
+        .join(Subscription, User.id == Subscription.user_id, isouter=True)
+        .join(ManualSubscription, User.id == ManualSubscription.user_id, isouter=True)
+        .join(AppleSubscription, User.id == AppleSubscription.user_id, isouter=True)
+        .join(
+            CoinbaseSubscription,
+            User.id == CoinbaseSubscription.user_id,
+            isouter=True,
+        )
+        .join(PartnerUser, User.id == PartnerUser.user_id, isouter=True)
+        .join(
+            PartnerSubscription,
+            PartnerSubscription.partner_user_id == PartnerUser.id,
+            isouter=True,
+        )
+        .filter(
+            or_(
+                Alias.hibp_last_check.is_(None),
+                Alias.hibp_last_check < oldest_hibp_allowed,
+            ),
+            Alias.user_id.notin_(user_ids_to_skip),
+            Alias.enabled,
+            Alias.delete_on == None,  # noqa: E711
+            Alias.id >= min_alias_id,
+            Alias.id < max_alias_id,
+            User.disabled == False,  # noqa: E712
+            User.enable_data_breach_check,
+            or_(
+                User.lifetime,
+                ManualSubscription.end_at > now,
+                Subscription.next_bill_date > now.date(),
+                AppleSubscription.expires_date > now,
+                CoinbaseSubscription.end_at > now,
+                PartnerSubscription.end_at > now,
+            ),
+        )
+    )
+    if config.HIBP_SKIP_PARTNER_ALIAS:
+        alias_query = alias_query.filter(
+            Alias.flags.op("&")(Alias.FLAG_PARTNER_CREATED) == 0
+        )
+    for alias in (
+        alias_query.order_by(Alias.id.asc()).enable_eagerloads(False).yield_per(500)
+    ):
+        yield alias
+
+
+def _get_users_with_too_many_aliases(user_ids: Set[int]) -> Set[int]:
+    rows = (
+        Session.query(Alias.user_id)
+        .filter(Alias.user_id.in_(user_ids))
+        .group_by(Alias.user_id)
+        .having(func.count(Alias.id) > config.HIBP_MAX_ALIAS_CHECK)
+    )
+    return {user_id for (user_id,) in rows}
+
+
+async def _produce_candidates(
+    queue: asyncio.Queue,
+    progress: _ScanProgress,
+    start_alias_id: int,
+    max_alias_id: int,
+    nb_workers: int,
+):
+    oldest_hibp_allowed = arrow.now().shift(days=-config.HIBP_SCAN_INTERVAL_DAYS)
+    # users with too many aliases aren't checked, computed only for the users met during the scan
+    user_ids_to_skip: Set[int] = set()
+    user_ids_seen: Set[int] = set()
+
+    for window_start in range(start_alias_id, max_alias_id + 1, SCAN_WINDOW):
+        window_end = window_start + SCAN_WINDOW
+        candidates = []
+        candidate_user_ids = {}
+        for alias in get_alias_to_check_hibp(
+            oldest_hibp_allowed, [], window_start, window_end
+        ):
+            # an alias can be returned once per subscription of its user
+            if alias.id in candidate_user_ids:
+                continue
+            candidates.append(
+                _Candidate(
+                    alias_id=alias.id,
+                    email=alias.email,
+                    window_end=window_end,
+                    skip=alias.is_created_from_partner(),
+                )
+            )
+            candidate_user_ids[alias.id] = alias.user_id
+
+        new_user_ids = set(candidate_user_ids.values()) - user_ids_seen
+        if new_user_ids:
+            user_ids_to_skip |= _get_users_with_too_many_aliases(new_user_ids)
+            user_ids_seen |= new_user_ids
+        candidates = [
+            c
+            for c in candidates
+            if candidate_user_ids[c.alias_id] not in user_ids_to_skip
+        ]
+        LOG.d(
+            f"Need to check {len(candidates)} aliases in window {window_start}/{max_alias_id}"
+        )
+        progress.add_window(window_end, len(candidates))
+        for candidate in candidates:
+            await queue.put(candidate)
+
+    # tell the workers there's nothing left
+    for _ in range(nb_workers):
+        await queue.put(None)
+
+
+async def _hibp_check(
+    client: HibpClient, queue: asyncio.Queue, writer: _HibpResultWriter
+):
+    """
+    Take aliases from the queue until it's exhausted and check them on HIBP.
+
+    Several of these run simultaneously. Return early on an unexpected HIBP error,
+    the remaining aliases are checked in the next run.
+    """
+    rate_hit_counter = 0
+    while True:
+        candidate: Optional[_Candidate] = await queue.get()
+        if candidate is None:
+            return
+
+        if candidate.skip:
+            writer.add(
+                _CheckResult(
+                    alias_id=candidate.alias_id,
+                    window_end=candidate.window_end,
+                    breach_names=None,
+                )
+            )
+            continue
+
+        while True:
+            try:
+                response = await client.breached_account(candidate.email)
+            except requests.RequestException as e:
+                LOG.w("Cannot reach HIBP: %s", e)
+                return
+
+            if response.status_code != 429:
+                break
+
+            rate_hit_counter += 1
+            if rate_hit_counter > MAX_RATE_LIMIT_HITS:
+                LOG.w(
+                    f"HIBP rate limited too many times stopping with alias {candidate.alias_id}"
+                )
+                return
+            LOG.w(
+                "HIBP rate limited, retry alias %s in %s seconds",
+                candidate.alias_id,
+                response.retry_after,
+            )
+            client.pause(response.retry_after)
+
+        if response.status_code in (200, 404):
+            rate_hit_counter = max(rate_hit_counter - 1, 0)
+            writer.add(
+                _CheckResult(
+                    alias_id=candidate.alias_id,
+                    window_end=candidate.window_end,
+                    breach_names=response.breach_names,
+                )
+            )
+        elif response.status_code >= 500:
+            LOG.w("HIBP server 5** error %s", response.status_code)
+            return
+        else:
+            LOG.error(
+                "An error occurred while checking alias %s: %s",
+                candidate.alias_id,
+                response.status_code,
+            )
+            return
+
+
+def _update_breach_list() -> Dict[str, int]:
+    """Refresh the known breaches and return their ids by name"""
+    r = requests.get(f"{config.HIBP_API_URL}/breaches", timeout=30)
+    for entry in r.json():
+        hibp_entry = Hibp.get_or_create(name=entry["Name"])
+        hibp_entry.date = arrow.get(entry["BreachDate"])
+        hibp_entry.description = entry["Description"]
+
+    Session.commit()
+    return {name: hibp_id for name, hibp_id in Session.query(Hibp.name, Hibp.id)}
+
+
+async def check_hibp():
+    """
+    Check all aliases on the HIBP (Have I Been Pwned) API
+
+    A producer streams the candidate aliases by alias id windows into a bounded queue,
+    HIBP_WORKERS_PER_KEY workers per API key check them and the results are written in batches.
+    The last fully written window is kept in HibpScanCursor so a restarted scan continues from there.
+    """
+    LOG.d("Checking HIBP API for aliases in breaches")
+
+    if len(config.HIBP_API_KEYS) == 0:
+        LOG.e("No HIBP API keys")
+        return
+
+    LOG.d("Updating list of known breaches")
+    hibp_ids = _update_breach_list()
+    LOG.d("Updated list of known breaches")
+
+    max_alias_id = Session.query(func.max(Alias.id)).scalar() or 0
+    cursor = HibpScanCursor.first()
+    if not cursor:
+        cursor = HibpScanCursor.create(last_alias_id=0, commit=True)
+    start_alias_id = cursor.last_alias_id
+    if start_alias_id > max_alias_id:
+        start_alias_id = 0
+    LOG.d(f"Checking aliases from {start_alias_id} to {max_alias_id}")
+
+    progress = _ScanProgress(start_alias_id)
+    writer = _HibpResultWriter(hibp_ids, progress, cursor)
+    queue = asyncio.Queue(maxsize=WRITE_BATCH_SIZE * 10)
+
+    workers = []
+    for api_key in config.HIBP_API_KEYS:
+        bucket = TokenBucket(config.HIBP_RPM)
+        for _ in range(config.HIBP_WORKERS_PER_KEY):
+            workers.append(
+                asyncio.create_task(
+                    _hibp_check(HibpClient(api_key, bucket), queue, writer)
+                )
+            )
+    producer = asyncio.create_task(
+        _produce_candidates(queue, progress, start_alias_id, max_alias_id, len(workers))
+    )
+
+    workers_done = asyncio.gather(*workers)
+    await asyncio.wait([producer, workers_done], return_when=asyncio.FIRST_COMPLETED)
+    if producer.done() and producer.exception():
+        workers_done.cancel()
+        writer.flush()
+        raise producer.exception()
+    await workers_done
+    # all workers can stop early because of HIBP errors
+    if not producer.done():
+        producer.cancel()
+    writer.flush()
+
+    if progress.completed_up_to > max_alias_id:
+        # full scan done, next run starts from the beginning
+        cursor.last_alias_id = 0
+        Session.commit()
+
+    LOG.d(f"Done checking {writer.nb_written} HIBP API for aliases in breaches")
@@ -1,12 +1,11 @@
 import arrow
 
-from app.db import Session
 from app.log import LOG
 from app.models import Notification
+from app.retention_utils import delete_in_batches
 
 
 def cleanup_old_notifications(oldest_allowed: arrow.Arrow):
     LOG.i(f"Deleting notifications older than {oldest_allowed}")
-    count = Notification.filter(Notification.created_at < oldest_allowed).delete()
-    Session.commit()
+    count = delete_in_batches(Notification, Notification.created_at < oldest_allowed)
     LOG.i(f"Deleted {count} notifications")
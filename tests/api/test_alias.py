@@ -160,6 +160,29 @@ def test_get_aliases_v2(flask_client):
     assert "pinned" in r0
 
 
+def test_get_aliases_v2_with_cursor(flask_client):
+    user = login(flask_client)
+
+    for _ in range(config.PAGE_LIMIT):
+        Alias.create_new_random(user)
+    Session.commit()
+
+    r = flask_client.get("/api/v2/aliases?cursor=")
+    assert r.status_code == 200
+    assert len(r.json["aliases"]) == config.PAGE_LIMIT
+    next_cursor = r.json["next_cursor"]
+    assert next_cursor
+
+    r = flask_client.get(f"/api/v2/aliases?cursor={next_cursor}")
+    assert r.status_code == 200
+    # the alias automatically created for a new account
+    assert len(r.json["aliases"]) == 1
+    assert r.json["next_cursor"] is None
+
+    r = flask_client.get("/api/v2/aliases?cursor=invalid")
+    assert r.status_code == 400
+
+
 def test_get_pinned_aliases_v2(flask_client):
     user = login(flask_client)
 
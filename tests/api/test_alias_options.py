@@ -1,9 +1,9 @@
 from flask import url_for
 
 from app.db import Session
-from app.models import AliasUsedOn, Alias
+from app.models import AliasUsedOn, Alias, CustomDomain
 from tests.api.utils import get_new_user_and_api_key
-from tests.utils import login
+from tests.utils import enable_cache_versions, login, random_domain
 
 
 def test_different_scenarios_v4(flask_client):
@@ -125,3 +125,29 @@ def test_different_scenarios_v5(flask_client):
     r = flask_client.get(url_for("api.options_v4", hostname="www.test.com"))
     assert r.json["recommendation"]["alias"] == alias.email
     assert r.json["recommendation"]["hostname"] == "www.test.com"
+
+
+def test_v5_suffixes_cache_invalidated_on_change(flask_client, monkeypatch):
+    enable_cache_versions(monkeypatch)
+    user = login(flask_client)
+
+    r = flask_client.get("/api/v5/alias/options")
+    assert r.status_code == 200
+    suffixes = r.json["suffixes"]
+
+    # only the domains are cached, the suffixes are signed on each call
+    r = flask_client.get("/api/v5/alias/options")
+    assert [s["suffix"].split("@")[1] for s in r.json["suffixes"]] == [
+        s["suffix"].split("@")[1] for s in suffixes
+    ]
+    for suffix_payload in r.json["suffixes"]:
+        assert suffix_payload["signed_suffix"].startswith(suffix_payload["suffix"])
+
+    domain = random_domain()
+    CustomDomain.create(
+        user_id=user.id, domain=domain, ownership_verified=True, commit=True
+    )
+
+    r = flask_client.get("/api/v5/alias/options")
+    assert r.json["suffixes"][0]["suffix"] == f"@{domain}"
+    assert r.json["suffixes"][0]["is_custom"]
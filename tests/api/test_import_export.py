@@ -1,12 +1,19 @@
+from flask import url_for
+from werkzeug.exceptions import TooManyRequests
+
+from app import import_utils
+from app.alias_utils import alias_export_csv
 from app.db import Session
 from app.import_utils import import_from_csv
 from app.models import (
+    AliasMailbox,
     CustomDomain,
     Mailbox,
     Alias,
     BatchImport,
     File,
 )
+from tests.api.utils import get_new_user_and_api_key
 from tests.utils import login, random_domain, random_token
 from tests.utils_test_alias import alias_export
 
@@ -15,6 +22,66 @@ def test_export(flask_client):
     alias_export(flask_client, "api.export_aliases")
 
 
+def test_export_csv_in_batches(flask_client):
+    user = login(flask_client)
+    for _ in range(4):
+        Alias.create_new_random(user)
+    Session.commit()
+
+    data = alias_export_csv(user, csv_direct_export=True, batch_size=2)
+
+    lines = data.splitlines()
+    assert lines[0] == "alias,note,enabled,mailboxes"
+    emails = [line.split(",")[0] for line in lines[1:]]
+    assert emails == [
+        alias.email
+        for alias in Alias.filter_by(user_id=user.id).order_by(Alias.id).all()
+    ]
+
+
+def test_export_csv_mailboxes(flask_client):
+    user = login(flask_client)
+    alias = Alias.create_new_random(user)
+    mailboxes = [
+        Mailbox.create(
+            user_id=user.id, email=f"{prefix}{random_token()}@sl.lan", verified=verified
+        )
+        for prefix, verified in [("b", True), ("a", True), ("c", False)]
+    ]
+    for mailbox in mailboxes:
+        AliasMailbox.create(alias_id=alias.id, mailbox_id=mailbox.id)
+    Session.commit()
+
+    data = alias_export_csv(user, csv_direct_export=True)
+
+    row = next(line for line in data.splitlines() if line.startswith(alias.email))
+    # the main mailbox first, then the other verified ones sorted by email
+    assert row.split(",")[-1] == " ".join(
+        [user.default_mailbox.email, mailboxes[1].email, mailboxes[0].email]
+    )
+
+
+def test_export_data(flask_client):
+    user, api_key = get_new_user_and_api_key()
+    domain = CustomDomain.create(user_id=user.id, domain=random_domain(), commit=True)
+
+    r = flask_client.get(
+        url_for("api.export_data"), headers={"Authentication": api_key.code}
+    )
+
+    assert r.status_code == 200
+    assert r.json == {
+        "email": user.email,
+        "name": user.name,
+        "aliases": [
+            {"email": alias.email, "enabled": alias.enabled}
+            for alias in Alias.filter_by(user_id=user.id).order_by(Alias.id).all()
+        ],
+        "apps": [],
+        "custom_domains": [domain.domain],
+    }
+
+
 def test_import_no_mailboxes_no_domains(flask_client):
     # Create user
     user = login(flask_client)
@@ -197,3 +264,69 @@ def test_import_invalid_mailbox_column(flask_client):
     import_from_csv(batch_import, user, alias_data)
 
     assert len(Alias.filter_by(user_id=user.id).all()) == 3  # +2
+
+
+def test_import_in_batches_reports_errors(flask_client, monkeypatch):
+    monkeypatch.setattr(import_utils, "IMPORT_BATCH_SIZE", 2)
+    user = login(flask_client)
+
+    domain = random_domain()
+    CustomDomain.create(user_id=user.id, domain=domain, ownership_verified=True)
+    Session.commit()
+
+    alias_data = [
+        "alias,note",
+        f"a1@{domain},note 1",
+        f"a2@{domain},note 2",
+        f"a1@{domain},duplicate",
+        "a3@unknown-domain.com,unknown domain",
+        f"a4@{domain},note 4",
+    ]
+
+    file = File.create(path=f"/{random_token()}", commit=True)
+    batch_import = BatchImport.create(user_id=user.id, file_id=file.id)
+
+    result = import_from_csv(batch_import, user, alias_data)
+
+    assert result.nb_rows == 5
+    assert result.nb_imported == 3
+    assert [(error.line, error.reason) for error in result.errors] == [
+        (5, "domain unknown-domain.com can't be used"),
+        (4, "alias already used"),
+    ]
+    assert batch_import.summary.startswith("3/5 aliases imported")
+    assert batch_import.nb_alias() == 3
+    alias = Alias.get_by(email=f"a4@{domain}")
+    assert alias.note == "note 4"
+    assert alias.mailbox_id == user.default_mailbox_id
+
+
+def test_import_stops_at_rate_limit(flask_client, monkeypatch):
+    monkeypatch.setattr(import_utils, "IMPORT_BATCH_SIZE", 2)
+    checked = []
+
+    def check_create_rate_limit(user, nb_aliases=1):
+        checked.append(nb_aliases)
+        if len(checked) > 1:
+            raise TooManyRequests()
+
+    monkeypatch.setattr(Alias, "check_create_rate_limit", check_create_rate_limit)
+    user = login(flask_client)
+
+    domain = random_domain()
+    CustomDomain.create(user_id=user.id, domain=domain, ownership_verified=True)
+    Session.commit()
+
+    alias_data = ["alias,note"] + [f"a{i}@{domain},note {i}" for i in range(5)]
+
+    file = File.create(path=f"/{random_token()}", commit=True)
+    batch_import = BatchImport.create(user_id=user.id, file_id=file.id)
+
+    result = import_from_csv(batch_import, user, alias_data)
+
+    # checked once per batch, the batches after the limit aren't checked anymore
+    assert checked == [2, 2]
+    assert result.nb_imported == 2
+    assert [error.reason for error in result.errors] == [
+        "alias creation rate limit reached"
+    ] * 3
@@ -1,4 +1,10 @@
-from app.api.serializer import get_alias_infos_with_pagination_v3, AliasInfo
+from app.api.serializer import (
+    get_alias_infos_with_pagination_v3,
+    AliasInfo,
+    get_alias_infos_with_cursor,
+    encode_alias_cursor,
+    decode_alias_cursor,
+)
 from app.alias_delete import move_alias_to_trash
 from app.config import PAGE_LIMIT
 from app.db import Session
@@ -210,3 +216,82 @@ def test_get_alias_infos_with_pagination_v3_does_not_include_trashed():
     alias_infos: List[AliasInfo] = get_alias_infos_with_pagination_v3(user)
     assert len(alias_infos) == 1
     assert alias_infos[0].alias.id != trashed_alias.id
+
+
+def test_get_alias_infos_with_cursor():
+    user = create_new_user()
+
+    # to have 3 pages: 2*PAGE_LIMIT + the alias automatically created for a new account
+    for _ in range(2 * PAGE_LIMIT):
+        Alias.create_new_random(user)
+    Session.commit()
+
+    pinned_alias = Alias.filter_by(user_id=user.id).order_by(Alias.id).first()
+    pinned_alias.pinned = True
+    Session.commit()
+
+    seen_ids = []
+    cursor = None
+    for _ in range(3):
+        alias_infos, next_cursor = get_alias_infos_with_cursor(user, cursor=cursor)
+        seen_ids += [ai.alias.id for ai in alias_infos]
+        if next_cursor is None:
+            break
+        cursor = decode_alias_cursor(next_cursor)
+
+    assert next_cursor is None
+    # every alias is returned exactly once, the pinned one first
+    assert len(seen_ids) == 2 * PAGE_LIMIT + 1
+    assert len(set(seen_ids)) == len(seen_ids)
+    assert seen_ids[0] == pinned_alias.id
+
+
+def test_get_alias_infos_with_cursor_backward():
+    user = create_new_user()
+    for _ in range(2 * PAGE_LIMIT):
+        Alias.create_new_random(user)
+    Session.commit()
+
+    first_page, next_cursor = get_alias_infos_with_cursor(user)
+    second_page, _ = get_alias_infos_with_cursor(
+        user, cursor=decode_alias_cursor(next_cursor)
+    )
+
+    # going back from the second page returns the first one, in the same order
+    alias_infos, prev_cursor = get_alias_infos_with_cursor(
+        user,
+        cursor=decode_alias_cursor(encode_alias_cursor(second_page[0].alias)),
+        backward=True,
+    )
+    assert prev_cursor is None
+    assert [ai.alias.id for ai in alias_infos] == [ai.alias.id for ai in first_page]
+
+
+def test_get_alias_infos_with_cursor_recent_activity_first():
+    user = create_new_user()
+    alias = Alias.create_new_random(user)
+    Alias.create_new_random(user)
+    contact = Contact.create(
+        user_id=user.id,
+        alias_id=alias.id,
+        website_email=random_email(),
+        reply_email=random_email(),
+        flush=True,
+    )
+    EmailLog.create(
+        user_id=user.id,
+        alias_id=alias.id,
+        contact_id=contact.id,
+        commit=True,
+    )
+
+    alias_infos, next_cursor = get_alias_infos_with_cursor(user)
+    assert next_cursor is None
+    assert alias_infos[0].alias.id == alias.id
+    assert alias_infos[0].nb_forward == 1
+    assert alias_infos[0].latest_contact.id == contact.id
+
+
+def test_decode_alias_cursor_invalid():
+    assert decode_alias_cursor("not a cursor") is None
+    assert decode_alias_cursor("") is None
@@ -10,7 +10,12 @@ os.environ["CONFIG"] = os.path.abspath(
 )
 import sqlalchemy
 
-from app.db import Session, engine, connection
+from app.db import Session, engine
+
+# all the tests share one connection so each test can be rolled back as a whole
+connection = engine.connect()
+Session.configure(bind=connection)
+
 from app.rate_limiter import set_rate_limit_enabled
 
 from psycopg2 import errors
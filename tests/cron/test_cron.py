@@ -1,9 +1,30 @@
+import os
+from io import BytesIO
+
 import arrow
 
 import cron
+from app import config, s3
+from app.constants import JobType
 from app.db import Session
-from app.models import CoinbaseSubscription, ApiToCookieToken, ApiKey, User
-from tests.utils import create_new_user
+from app.jobs.delete_scheduled_user_job import (
+    DELETE_GRACE_DAYS,
+    DeleteScheduledUserJob,
+)
+from app.models import (
+    Alias,
+    AliasHibp,
+    ApiKey,
+    ApiToCookieToken,
+    CoinbaseSubscription,
+    Hibp,
+    HibpNotifiedAlias,
+    HibpPendingNotification,
+    Job,
+    RefusedEmail,
+    User,
+)
+from tests.utils import create_new_user, random_token
 
 
 def test_notify_manual_sub_end(flask_client):
@@ -44,12 +65,112 @@ def test_cleanup_users():
     u_delete_grace_has_not_expired = create_new_user()
     u_delete_grace_has_not_expired_id = u_delete_grace_has_not_expired.id
     now = arrow.now()
-    u_delete_grace_has_expired.delete_on = now.shift(days=-(cron.DELETE_GRACE_DAYS + 1))
-    u_delete_grace_has_not_expired.delete_on = now.shift(
-        days=-(cron.DELETE_GRACE_DAYS - 1)
-    )
+    u_delete_grace_has_expired.delete_on = now.shift(days=-(DELETE_GRACE_DAYS + 1))
+    u_delete_grace_has_not_expired.delete_on = now.shift(days=-(DELETE_GRACE_DAYS - 1))
     Session.flush()
     cron.clear_users_scheduled_to_be_deleted()
+    # running it again doesn't schedule the same user twice
+    cron.clear_users_scheduled_to_be_deleted()
+
+    user_ids = {
+        u_delete_none_id,
+        u_delete_grace_has_expired_id,
+        u_delete_grace_has_not_expired_id,
+    }
+    jobs = [
+        job
+        for job in Job.filter_by(name=JobType.DELETE_SCHEDULED_USER.value)
+        if job.payload["user_id"] in user_ids
+    ]
+    assert [job.payload["user_id"] for job in jobs] == [u_delete_grace_has_expired_id]
+    DeleteScheduledUserJob.create_from_job(jobs[0]).run()
+
     assert User.get(u_delete_none_id) is not None
     assert User.get(u_delete_grace_has_not_expired_id) is not None
     assert User.get(u_delete_grace_has_expired_id) is None
+
+
+def test_delete_scheduled_user_job_skips_cancelled_deletion():
+    user = create_new_user()
+    user.delete_on = arrow.now().shift(days=-(DELETE_GRACE_DAYS + 1))
+    Session.flush()
+    job = DeleteScheduledUserJob(user).store_job_in_db()
+
+    user.delete_on = None
+    Session.commit()
+    DeleteScheduledUserJob.create_from_job(job).run()
+    assert User.get(user.id) is not None
+
+
+def test_notify_hibp():
+    user = create_new_user()
+    alias = Alias.create_new_random(user)
+    hibp = Hibp.create(name=random_token(), flush=True)
+    AliasHibp.create(alias_id=alias.id, hibp_id=hibp.id)
+    HibpPendingNotification.create(alias_id=alias.id, user_id=user.id, commit=True)
+
+    cron.notify_hibp()
+
+    assert HibpPendingNotification.filter_by(user_id=user.id).count() == 0
+    notified = HibpNotifiedAlias.filter_by(user_id=user.id).all()
+    assert [n.alias_id for n in notified] == [alias.id]
+
+
+def test_notify_hibp_without_breach_left():
+    user = create_new_user()
+    alias = Alias.create_new_random(user)
+    HibpPendingNotification.create(alias_id=alias.id, user_id=user.id, commit=True)
+
+    cron.notify_user_of_hibp_breaches(user)
+
+    # no email, the pending notification is cleared without marking the alias notified
+    assert HibpPendingNotification.filter_by(user_id=user.id).count() == 0
+    assert HibpNotifiedAlias.filter_by(user_id=user.id).count() == 0
+
+
+def test_delete_refused_emails():
+    user = create_new_user()
+    full_report_path = f"refused-emails/{random_token()}.eml"
+    s3.upload_email_from_bytesio(full_report_path, BytesIO(b"report"), "report")
+    expired = RefusedEmail.create(
+        user_id=user.id,
+        full_report_path=full_report_path,
+        delete_at=arrow.now().shift(hours=-1),
+    )
+    not_expired = RefusedEmail.create(
+        user_id=user.id,
+        full_report_path=random_token(),
+        delete_at=arrow.now().shift(days=2),
+        commit=True,
+    )
+
+    cron.delete_refused_emails()
+
+    Session.expire_all()
+    assert RefusedEmail.get(expired.id).deleted
+    assert not RefusedEmail.get(not_expired.id).deleted
+    assert not os.path.exists(os.path.join(config.UPLOAD_DIR, full_report_path))
+
+
+def test_delete_refused_emails_keeps_failed_deletions(monkeypatch):
+    user = create_new_user()
+    failed = RefusedEmail.create(
+        user_id=user.id,
+        full_report_path=random_token(),
+        delete_at=arrow.now().shift(hours=-1),
+    )
+    deleted = RefusedEmail.create(
+        user_id=user.id,
+        full_report_path=random_token(),
+        delete_at=arrow.now().shift(hours=-1),
+        commit=True,
+    )
+    failed_path = failed.full_report_path
+    monkeypatch.setattr(s3, "delete_many", lambda paths: [failed_path])
+
+    cron.delete_refused_emails()
+
+    Session.expire_all()
+    # retried by the next run
+    assert not RefusedEmail.get(failed.id).deleted
+    assert RefusedEmail.get(deleted.id).deleted
@@ -1,7 +1,7 @@
 import arrow
 import pytest
 
-import cron
+from tasks.check_hibp import get_alias_to_check_hibp
 from app.db import Session
 from app.models import (
     Alias,
@@ -22,9 +22,7 @@ def test_get_alias_for_free_user_has_no_alias():
     user = create_new_user()
     alias_id = Alias.create_new_random(user).id
     Session.commit()
-    aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1)
-    )
+    aliases = list(get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1))
     assert len(aliases) == 0
 
 
@@ -34,9 +32,7 @@ def test_get_alias_for_lifetime_with_null_hibp_date():
     user.enable_data_breach_check = True
     alias_id = Alias.create_new_random(user).id
     Session.commit()
-    aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1)
-    )
+    aliases = list(get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1))
     assert alias_id == aliases[0].id
 
 
@@ -48,9 +44,7 @@ def test_get_alias_for_lifetime_with_old_hibp_date():
     alias.hibp_last_check = arrow.now().shift(days=-1)
     alias_id = alias.id
     Session.commit()
-    aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1)
-    )
+    aliases = list(get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1))
     assert alias_id == aliases[0].id
 
 
@@ -103,9 +97,7 @@ def test_get_alias_for_sub(sub_generator):
     sub_generator(user)
     alias_id = Alias.create_new_random(user).id
     Session.commit()
-    aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1)
-    )
+    aliases = list(get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1))
     assert alias_id == aliases[0].id
 
 
@@ -115,9 +107,7 @@ def test_disabled_user_is_not_checked():
     user.disabled = True
     alias_id = Alias.create_new_random(user).id
     Session.commit()
-    aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1)
-    )
+    aliases = list(get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1))
     assert len(aliases) == 0
 
 
@@ -127,7 +117,7 @@ def test_skipped_user_is_not_checked():
     alias_id = Alias.create_new_random(user).id
     Session.commit()
     aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [user.id], alias_id, alias_id + 1)
+        get_alias_to_check_hibp(arrow.now(), [user.id], alias_id, alias_id + 1)
     )
     assert len(aliases) == 0
 
@@ -140,7 +130,7 @@ def test_already_checked_is_not_checked():
     alias_id = alias.id
     Session.commit()
     aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [user.id], alias_id, alias_id + 1)
+        get_alias_to_check_hibp(arrow.now(), [user.id], alias_id, alias_id + 1)
     )
     assert len(aliases) == 0
 
@@ -151,9 +141,7 @@ def test_outed_in_user_is_checked():
     user.enable_data_breach_check = True
     alias_id = Alias.create_new_random(user).id
     Session.commit()
-    aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1)
-    )
+    aliases = list(get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1))
     assert len(aliases) == 1
 
 
@@ -162,7 +150,5 @@ def test_outed_out_user_is_not_checked():
     user.lifetime = True
     alias_id = Alias.create_new_random(user).id
     Session.commit()
-    aliases = list(
-        cron.get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1)
-    )
+    aliases = list(get_alias_to_check_hibp(arrow.now(), [], alias_id, alias_id + 1))
     assert len(aliases) == 0
@@ -1,9 +1,21 @@
-from app.events.event_dispatcher import EventDispatcher
+from app.db import Session
+from app.events.event_dispatcher import (
+    EventDispatcher,
+    NOTIFICATION_CHANNEL,
+    NOTIFICATION_IDS_CHANNEL,
+    PostgresDispatcher,
+    notifications_for,
+    parse_notification_payload,
+)
 from app.events.generated.event_pb2 import EventContent, UserDeleted
+from app.models import PartnerUser, SyncEvent
+from app.proton.proton_partner import get_proton_partner
+from tests.utils import random_token
 from .event_test_utils import (
     _create_unlinked_user,
     OnMemoryDispatcher,
     _create_linked_user,
+    _get_event_from_string,
 )
 
 
@@ -31,3 +43,67 @@ def test_event_dispatcher_does_not_send_event_if_user_not_linked():
     content = EventContent(user_deleted=UserDeleted())
     EventDispatcher.send_event(user, content, dispatcher, skip_if_webhook_missing=False)
     assert len(dispatcher.memory) == 0
+
+
+def test_postgres_dispatcher_stores_events_on_commit():
+    (user, partner_user) = _create_linked_user()
+    Session.commit()
+    nb_events = SyncEvent.count()
+
+    dispatcher = PostgresDispatcher()
+    contents = [EventContent(user_deleted=UserDeleted()) for _ in range(3)]
+    EventDispatcher.send_events(
+        user, contents, dispatcher, skip_if_webhook_missing=False
+    )
+    EventDispatcher.send_event(
+        user,
+        EventContent(user_deleted=UserDeleted()),
+        dispatcher,
+        skip_if_webhook_missing=False,
+    )
+    assert Session.execute("SELECT count(*) FROM sync_event").scalar() == nb_events
+
+    Session.commit()
+    events = SyncEvent.order_by(SyncEvent.id.desc()).limit(4).all()
+    assert SyncEvent.count() == nb_events + 4
+    for sync_event in events:
+        _get_event_from_string(sync_event.content, user, partner_user)
+
+
+def test_event_dispatcher_sees_new_partner_user():
+    dispatcher = OnMemoryDispatcher()
+    user = _create_unlinked_user()
+    content = EventContent(user_deleted=UserDeleted())
+    EventDispatcher.send_event(user, content, dispatcher, skip_if_webhook_missing=False)
+    assert len(dispatcher.memory) == 0
+
+    partner_user = PartnerUser.create(
+        partner_id=get_proton_partner().id,
+        user_id=user.id,
+        external_user_id=random_token(10),
+    )
+    EventDispatcher.send_event(user, content, dispatcher, skip_if_webhook_missing=False)
+    assert len(dispatcher.memory) == 1
+    _get_event_from_string(dispatcher.memory[0], user, partner_user)
+
+
+def test_parse_notification_payload():
+    assert parse_notification_payload("12") == [12]
+    assert parse_notification_payload("12,13,15") == [12, 13, 15]
+
+
+def test_notifications_for():
+    # a single id keeps the channel and payload of the listeners before the ids channel
+    assert notifications_for([12]) == [(NOTIFICATION_CHANNEL, "12")]
+    # only the ids of the transaction, not the ones in between
+    assert notifications_for([13, 12, 15]) == [(NOTIFICATION_IDS_CHANNEL, "12,13,15")]
+
+    ids = list(range(100000, 102000))
+    notifications = notifications_for(ids)
+    assert len(notifications) > 1
+    assert all(len(payload) < 8000 for _, payload in notifications)
+    assert [
+        event_id
+        for _, payload in notifications
+        for event_id in parse_notification_payload(payload)
+    ] == ids
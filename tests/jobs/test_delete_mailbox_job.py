@@ -1,9 +1,11 @@
 from sqlalchemy_utils.types.arrow import arrow
 
+from app.alias_audit_log_utils import AliasAuditLogAction
 from app.constants import JobType
 from app.db import Session
 from app.mail_sender import mail_sender
-from app.models import Alias, Mailbox, Job, AliasMailbox
+from app.mailbox_utils import transfer_mailbox_aliases
+from app.models import Alias, AliasAuditLog, Mailbox, Job, AliasMailbox
 from job_runner import delete_mailbox_job
 from tests.utils import create_new_user, random_email
 
@@ -106,3 +108,58 @@ def test_delete_mailbox_no_transfer(flask_client):
     mails_sent = mail_sender.get_stored_emails()
     assert len(mails_sent) == 1
     assert str(mails_sent[0].msg).find("along with its aliases have been deleted") > -1
+
+
+def test_transfer_mailbox_aliases_in_batches(flask_client):
+    user = create_new_user()
+    m1 = Mailbox.create(
+        user_id=user.id, email=random_email(), verified=True, flush=True
+    )
+    m2 = Mailbox.create(
+        user_id=user.id, email=random_email(), verified=True, flush=True
+    )
+    primary_ids = [
+        Alias.create_new(user, "prefix", mailbox_id=m1.id).id for _ in range(3)
+    ]
+    # m1 is a secondary mailbox, m2 the main one
+    secondary_id = Alias.create_new(user, "prefix", mailbox_id=m2.id).id
+    AliasMailbox.create(alias_id=secondary_id, mailbox_id=m1.id)
+    Session.commit()
+
+    progress = []
+    count = transfer_mailbox_aliases(m1, m2, batch_size=2, on_progress=progress.append)
+
+    assert count == 4
+    assert progress == [2, 4]
+    for alias_id in primary_ids + [secondary_id]:
+        alias = Alias.get(alias_id)
+        assert alias.mailbox_id == m2.id
+        assert alias._mailboxes == []
+        assert (
+            AliasAuditLog.filter_by(
+                alias_id=alias_id, action=AliasAuditLogAction.ChangedMailboxes.value
+            ).count()
+            == 1
+        )
+
+
+@mail_sender.store_emails_test_decorator
+def test_delete_mailbox_job_progress(flask_client):
+    user = create_new_user()
+    m1 = Mailbox.create(
+        user_id=user.id, email=random_email(), verified=True, flush=True
+    )
+    m2 = Mailbox.create(
+        user_id=user.id, email=random_email(), verified=True, flush=True
+    )
+    Alias.create_new(user, "prefix", mailbox_id=m1.id)
+    job = Job.create(
+        name=JobType.DELETE_MAILBOX.value,
+        payload={"mailbox_id": m1.id, "transfer_mailbox_id": m2.id},
+        run_at=arrow.now(),
+        commit=True,
+    )
+    delete_mailbox_job(job)
+
+    assert Job.get(job.id).payload["progress"] == {"step": "done", "nb_alias": 0}
+    assert Mailbox.get(m1.id) is None
@@ -1,6 +1,12 @@
+import json
+import os
 import zipfile
 from random import random
 
+import arrow
+
+from app import config
+from app.constants import JobType
 from app.db import Session
 from app.jobs.export_user_data_job import ExportUserDataJob
 from app.models import (
@@ -11,6 +17,7 @@ from app.models import (
     CustomDomain,
     EmailLog,
     Alias,
+    Job,
 )
 from tests.utils import create_new_user, random_token
 
@@ -122,11 +129,59 @@ def test_model_retrieval_pagination():
         assert len(found_aliases) == len(aliases)
 
 
+def test_build_zip_content():
+    user = create_new_user()
+    for _i in range(3):
+        Alias.create_new_random(user)
+    Session.commit()
+
+    with ExportUserDataJob(user)._build_zip() as zip_file:
+        with zipfile.ZipFile(zip_file, "r") as zf:
+            aliases = json.loads(zf.read("aliases.json"))
+            assert json.loads(zf.read("contacts.json")) == []
+
+    assert len(aliases) == 4
+    assert {alias["user_id"] for alias in aliases} == {user.id}
+    assert "ts_vector" not in aliases[0]
+
+
 def test_send_report():
     user = create_new_user()
     ExportUserDataJob(user).run()
 
 
+def test_send_report_as_link(monkeypatch):
+    monkeypatch.setattr(config, "EXPORT_USER_DATA_ATTACHMENT_MAX_SIZE", 0)
+    user = create_new_user()
+    job = ExportUserDataJob(user)
+    with job._build_zip() as zip_file:
+        url = job._upload_zip(zip_file)
+
+    key = url.split("/static/upload/")[1]
+    assert key.startswith(f"export/{user.id}/")
+    assert os.path.exists(os.path.join(config.UPLOAD_DIR, key))
+
+    # the archive is deleted once the link has expired
+    delete_job = Job.filter(
+        Job.name == JobType.DELETE_USER_EXPORT.value,
+        Job.payload.op("->>")("key") == key,
+    ).first()
+    assert delete_job.run_at > arrow.now().shift(
+        days=config.EXPORT_USER_DATA_LINK_EXPIRATION_DAYS, minutes=-1
+    )
+    ExportUserDataJob.delete_upload(delete_job)
+    assert not os.path.exists(os.path.join(config.UPLOAD_DIR, key))
+
+
+def test_send_report_not_uploaded_locally(monkeypatch):
+    monkeypatch.setattr(config, "EXPORT_USER_DATA_ATTACHMENT_MAX_SIZE", 0)
+    user = create_new_user()
+    ExportUserDataJob(user).run()
+
+    # local uploads would be public forever, the archive is attached instead
+    assert not os.path.exists(os.path.join(config.UPLOAD_DIR, "export", str(user.id)))
+
+
 def test_store_and_retrieve():
     user = create_new_user()
     export_job = ExportUserDataJob(user)
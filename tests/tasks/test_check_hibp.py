@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import arrow
+
+from app.db import Session
+from app.models import (
+    Alias,
+    AliasHibp,
+    Hibp,
+    HibpNotifiedAlias,
+    HibpPendingNotification,
+    HibpScanCursor,
+)
+from tasks.check_hibp import (
+    TokenBucket,
+    _CheckResult,
+    _HibpResultWriter,
+    _ScanProgress,
+)
+from tests.utils import create_new_user, random_token
+
+
+def test_scan_progress_advances_on_completed_windows():
+    progress = _ScanProgress(0)
+    progress.add_window(10, 2)
+    progress.add_window(20, 1)
+    assert progress.completed_up_to == 0
+
+    # second window is done but the first one isn't
+    progress.done(20)
+    assert progress.completed_up_to == 0
+
+    progress.done(10)
+    progress.done(10)
+    assert progress.completed_up_to == 20
+
+    # empty window
+    progress.add_window(30, 0)
+    assert progress.completed_up_to == 30
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(60_000)
+    bucket.pause(0.2)
+    start = time.monotonic()
+    asyncio.run(bucket.acquire())
+    assert time.monotonic() - start >= 0.15
+
+
+def test_result_writer_flush():
+    user = create_new_user()
+    breached = Alias.create_new_random(user)
+    clean = Alias.create_new_random(user)
+    skipped = Alias.create_new_random(user)
+    already_notified = Alias.create_new_random(user)
+    HibpNotifiedAlias.create(user_id=user.id, alias_id=already_notified.id)
+    hibp = Hibp.create(name=random_token(), flush=True)
+    old_hibp = Hibp.create(name=random_token(), flush=True)
+    AliasHibp.create(alias_id=clean.id, hibp_id=old_hibp.id)
+    HibpPendingNotification.create(alias_id=clean.id, user_id=user.id)
+    cursor = HibpScanCursor.create(last_alias_id=0, commit=True)
+
+    progress = _ScanProgress(0)
+    progress.add_window(100, 4)
+    writer = _HibpResultWriter({hibp.name: hibp.id}, progress, cursor)
+    writer.add(_CheckResult(breached.id, 100, [hibp.name, "unknown", hibp.name]))
+    writer.add(_CheckResult(clean.id, 100, []))
+    writer.add(_CheckResult(skipped.id, 100, None))
+    writer.add(_CheckResult(already_notified.id, 100, [hibp.name]))
+    writer.flush()
+
+    assert writer.nb_written == 4
+    assert cursor.last_alias_id == 100
+    Session.expire_all()
+    assert [h.id for h in Alias.get(breached.id).hibp_breaches] == [hibp.id]
+    assert Alias.get(clean.id).hibp_breaches == []
+    for alias_id in (breached.id, clean.id, skipped.id):
+        assert Alias.get(alias_id).hibp_last_check > arrow.utcnow().shift(minutes=-1)
+    # only the newly breached alias waits for a notification, clean isn't breached anymore
+    assert [p.alias_id for p in HibpPendingNotification.filter_by(user_id=user.id)] == [
+        breached.id
+    ]
@@ -7,6 +7,7 @@ from app import config
 from app.alias_audit_log_utils import AliasAuditLogAction
 from app.alias_delete import delete_alias, restore_all_alias, clear_trash
 from app.alias_delete import perform_alias_deletion, move_alias_to_trash, restore_alias
+from app.alias_delete import bulk_perform_alias_deletion, bulk_move_aliases_to_trash
 from app.db import Session
 from app.errors import CannotCreateAliasQuotaExceeded
 from app.events.event_dispatcher import GlobalDispatcher
@@ -26,7 +27,7 @@ from tests.events.event_test_utils import (
     _get_event_from_string,
     _create_linked_user,
 )
-from tests.utils import create_new_user, random_domain
+from tests.utils import create_new_user, random_domain, random_email
 
 on_memory_dispatcher = OnMemoryDispatcher()
 
@@ -193,6 +194,78 @@ def test_move_alias_custom_domain_to_trash_to_domain_deleted_alias():
     assert deleted_custom_alias is not None
 
 
+# bulk deletion
+def test_bulk_perform_alias_deletion():
+    (user, user_pu) = _create_linked_user()
+    custom_domain = CustomDomain.create(
+        user_id=user.id, domain=random_domain(), verified=True
+    )
+    alias = Alias.create_new_random(user)
+    trashed_alias = Alias.create_new_random(user)
+    trashed_alias.delete_on = arrow.now().shift(days=1)
+    trashed_alias.delete_reason = AliasDeleteReason.MailboxDeleted
+    domain_alias = Alias.create_new_random(user)
+    domain_alias.custom_domain_id = custom_domain.id
+    other_alias = Alias.create_new_random(create_new_user())
+    Session.commit()
+    aliases = [(a.id, a.email) for a in (alias, trashed_alias, domain_alias)]
+    on_memory_dispatcher.clear()
+
+    count = bulk_perform_alias_deletion(
+        Alias.user_id == user.id, AliasDeleteReason.ManualAction, batch_size=2
+    )
+
+    assert count == 3
+    ensure_alias_is_deleted(*aliases[0], 2, AliasDeleteReason.ManualAction)
+    ensure_alias_is_deleted(*aliases[1], 2, AliasDeleteReason.MailboxDeleted)
+    assert Alias.get_by(id=aliases[2][0]) is None
+    domain_deleted_alias = DomainDeletedAlias.get_by(email=aliases[2][1])
+    assert domain_deleted_alias.alias_id == aliases[2][0]
+    assert Alias.get(other_alias.id) is not None
+
+    deleted_ids = set()
+    for event_data in on_memory_dispatcher.memory:
+        event_content = _get_event_from_string(event_data, user, user_pu)
+        deleted_ids.add(event_content.alias_deleted.id)
+    assert deleted_ids == {alias_id for alias_id, _ in aliases}
+
+
+def test_bulk_perform_alias_deletion_without_commit():
+    user = create_new_user()
+    alias = Alias.create_new_random(user)
+    Session.commit()
+    alias_id = alias.id
+
+    count = bulk_perform_alias_deletion(
+        Alias.user_id == user.id,
+        AliasDeleteReason.ManualAction,
+        batch_size=1,
+        commit=False,
+    )
+    assert count == 2
+    assert Alias.get_by(id=alias_id) is None
+
+    # every batch is rolled back with the caller's transaction
+    Session.rollback()
+    assert Alias.get_by(id=alias_id) is not None
+
+
+def test_bulk_move_aliases_to_trash():
+    user = create_new_user()
+    mb = Mailbox.create(user_id=user.id, email=random_email(), verified=True)
+    alias = Alias.create_new_random(user)
+    alias.mailbox_id = mb.id
+    Session.commit()
+
+    count = bulk_move_aliases_to_trash(
+        Alias.id == alias.id, AliasDeleteReason.ManualAction, mailbox_id=mb.id
+    )
+
+    assert count == 1
+    db_alias = ensure_alias_is_trashed(alias, 2, AliasDeleteReason.ManualAction)
+    assert db_alias.mailbox_id == mb.id
+
+
 # delete mailbox
 def generate_user_setting() -> List[UserAliasDeleteAction]:
     return [UserAliasDeleteAction.DeleteImmediately, UserAliasDeleteAction.MoveToTrash]
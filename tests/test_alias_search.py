@@ -0,0 +1,76 @@
+from app.alias_search import (
+    AliasSearchStrategy,
+    get_search_strategy,
+    escape_like,
+)
+from app.api.serializer import get_alias_infos_with_pagination_v3
+from app.db import Session
+from app.models import Alias
+from tests.utils import create_new_user, random_token
+
+
+def test_get_search_strategy():
+    assert get_search_strategy("a") == AliasSearchStrategy.Short
+    assert get_search_strategy(" ab ") == AliasSearchStrategy.Short
+    assert get_search_strategy("abc") == AliasSearchStrategy.Trigram
+    assert get_search_strategy("john@example") == AliasSearchStrategy.Trigram
+    assert get_search_strategy("my note") == AliasSearchStrategy.Trigram
+
+
+def test_escape_like():
+    assert escape_like("a_b%c\\d") == "a\\_b\\%c\\\\d"
+
+
+def test_search_short_query_matches_substrings():
+    user = create_new_user()
+    by_email = Alias.create(
+        user_id=user.id,
+        email=f"john.zq{random_token()}@sl.lan",
+        mailbox_id=user.default_mailbox_id,
+    )
+    by_note = Alias.create(
+        user_id=user.id,
+        email=f"{random_token()}@sl.lan",
+        note="the ZQ newsletter",
+        mailbox_id=user.default_mailbox_id,
+    )
+    Alias.create(
+        user_id=user.id,
+        email=f"other.{user.id}@sl.lan",
+        mailbox_id=user.default_mailbox_id,
+    )
+    Session.commit()
+
+    alias_infos = get_alias_infos_with_pagination_v3(user, query="zq")
+    assert {ai.alias.id for ai in alias_infos} == {by_email.id, by_note.id}
+
+
+def test_search_several_words_matches_email():
+    user = create_new_user()
+    alias = Alias.create(
+        user_id=user.id,
+        email=f"{random_token()}@sl.lan",
+        name="my shop",
+        mailbox_id=user.default_mailbox_id,
+    )
+    Session.commit()
+
+    alias_infos = get_alias_infos_with_pagination_v3(user, query="my shop")
+    assert [ai.alias.id for ai in alias_infos] == [alias.id]
+
+
+def test_search_wildcards_are_literal():
+    user = create_new_user()
+    Alias.create(
+        user_id=user.id,
+        email=f"wild{random_token()}@sl.lan",
+        mailbox_id=user.default_mailbox_id,
+    )
+    Session.commit()
+
+    alias_infos = get_alias_infos_with_pagination_v3(user, query="w_ld")
+    assert len(alias_infos) == 0
+    alias_infos = get_alias_infos_with_pagination_v3(user, query="wi%d")
+    assert len(alias_infos) == 0
+    alias_infos = get_alias_infos_with_pagination_v3(user, query="wild")
+    assert len(alias_infos) == 1
@@ -0,0 +1,49 @@
+import time
+
+from flask import url_for
+
+from app import api_key_usage
+from app.api_key_usage import flush_api_key_usage
+from app.db import Session
+from app.models import ApiKey
+from tests.api.utils import get_new_user_and_api_key
+
+
+def test_api_key_usage_is_aggregated(flask_client, monkeypatch):
+    # no periodic flush during the test, whenever it runs in the suite
+    monkeypatch.setattr(api_key_usage, "_last_flush", time.time())
+    user, api_key = get_new_user_and_api_key()
+    api_key_id = api_key.id
+
+    for _ in range(3):
+        r = flask_client.get(
+            url_for("api.user_info"), headers={"Authentication": api_key.code}
+        )
+        assert r.status_code == 200
+
+    # the first use is written right away, the following ones are pending
+    Session.expire_all()
+    api_key = ApiKey.get(api_key_id)
+    assert api_key.last_used is not None
+    assert api_key.times == 1
+
+    flush_api_key_usage()
+    Session.expire_all()
+    assert ApiKey.get(api_key_id).times == 3
+
+
+def test_flush_without_usage(flask_client):
+    user, api_key = get_new_user_and_api_key()
+    api_key.times = 5
+    Session.commit()
+    # the usage left by other tests
+    flush_api_key_usage()
+    Session.expire_all()
+    last_used = ApiKey.get(api_key.id).last_used
+
+    flush_api_key_usage()
+
+    Session.expire_all()
+    api_key = ApiKey.get(api_key.id)
+    assert api_key.times == 5
+    assert api_key.last_used == last_used
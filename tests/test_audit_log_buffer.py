@@ -0,0 +1,68 @@
+from app.alias_audit_log_utils import AliasAuditLogAction, emit_alias_audit_log
+from app.audit_log_buffer import flush_audit_logs
+from app.db import Session
+from app.models import Alias, AliasAuditLog, UserAuditLog
+from app.user_audit_log_utils import UserAuditLogAction, emit_user_audit_log
+from tests.utils import create_new_user
+
+
+def _count_rows(table: str, column: str, value: int) -> int:
+    return Session.execute(
+        f"SELECT count(*) FROM {table} WHERE {column} = :value", {"value": value}
+    ).scalar()
+
+
+def test_audit_logs_are_written_on_commit():
+    user = create_new_user()
+    alias = Alias.create_new_random(user)
+    Session.commit()
+
+    emit_alias_audit_log(alias, AliasAuditLogAction.UpdateAlias, "first")
+    emit_alias_audit_log(alias, AliasAuditLogAction.UpdateAlias, "second")
+    emit_user_audit_log(user, UserAuditLogAction.UpdateAlias, "user")
+    assert _count_rows("alias_audit_log", "alias_id", alias.id) == 1
+
+    Session.commit()
+    assert _count_rows("alias_audit_log", "alias_id", alias.id) == 3
+    logs = AliasAuditLog.filter_by(alias_id=alias.id).order_by(AliasAuditLog.id).all()
+    assert [log.message for log in logs[1:]] == ["first", "second"]
+    assert logs[1].user_id == user.id
+    assert logs[1].alias_email == alias.email
+    assert (
+        UserAuditLog.filter_by(
+            user_id=user.id, action=UserAuditLogAction.UpdateAlias.value
+        ).count()
+        == 1
+    )
+
+
+def test_audit_log_query_sees_buffered_logs():
+    user = create_new_user()
+    alias = Alias.create_new_random(user)
+    Session.commit()
+
+    emit_alias_audit_log(alias, AliasAuditLogAction.UpdateAlias, "buffered")
+    logs = AliasAuditLog.filter_by(alias_id=alias.id, message="buffered").all()
+    assert len(logs) == 1
+
+    # already written, not inserted twice
+    Session.commit()
+    assert _count_rows("alias_audit_log", "alias_id", alias.id) == 2
+
+
+def test_audit_logs_discarded_on_rollback():
+    user = create_new_user()
+    Session.commit()
+    user_id = user.id
+
+    emit_user_audit_log(user, UserAuditLogAction.UpdateAlias, "rolled back")
+    Session.rollback()
+    flush_audit_logs()
+    Session.commit()
+
+    assert (
+        UserAuditLog.filter_by(
+            user_id=user_id, action=UserAuditLogAction.UpdateAlias.value
+        ).count()
+        == 0
+    )
@@ -0,0 +1,52 @@
+from app import db
+from app.db import Session, read_replica
+from app.models import Notification
+from tests.utils import create_new_user
+
+
+def test_read_replica_routing(monkeypatch):
+    replica = object()
+    monkeypatch.setattr(db._replicas, "pick", lambda: replica)
+    session = Session()
+    session.info.pop(db._HAS_WRITTEN, None)
+    try:
+        primary = session.get_bind()
+        with read_replica():
+            assert session.get_bind() is replica
+            # a write always goes to the primary
+            assert session.get_bind(clause=Notification.__table__.delete()) is primary
+            # and the following reads stick to the primary
+            assert session.get_bind() is primary
+        assert session.get_bind() is primary
+
+        session.info.pop(db._HAS_WRITTEN)
+        Notification.create(user_id=create_new_user().id, message="", flush=True)
+        with read_replica():
+            assert session.get_bind() is primary
+    finally:
+        session.info.pop(db._HAS_WRITTEN, None)
+
+
+def test_read_replica_falls_back_to_primary(monkeypatch):
+    monkeypatch.setattr(db._replicas, "pick", lambda: None)
+    session = Session()
+    primary = session.get_bind()
+    with read_replica():
+        assert session.get_bind() is primary
+
+
+def test_read_replica_after_commit(monkeypatch):
+    replica = object()
+    monkeypatch.setattr(db._replicas, "pick", lambda: replica)
+    session = Session()
+    try:
+        Notification.create(user_id=create_new_user().id, message="", flush=True)
+        with read_replica():
+            assert session.get_bind() is not replica
+
+        # the write is committed, the next transaction can use the replica
+        Session.commit()
+        with read_replica():
+            assert session.get_bind() is replica
+    finally:
+        session.info.pop(db._HAS_WRITTEN, None)
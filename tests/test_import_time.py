@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# only imported when used, see the lazy imports in pgp_utils, s3 and cron
+LAZY_MODULES = [
+    "boto3",
+    "pgpy",
+    "gnupg",
+    "memory_profiler",
+    "app.api.views.apple",
+    "app.paddle_utils",
+    "simplelogin_app",
+]
+
+
+def import_time_profile(module: str) -> dict:
+    """Import module in a new interpreter and return the cumulative import time in
+    microseconds of every imported module, as reported by -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+    profile = {}
+    for line in result.stderr.splitlines():
+        # import time:   self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        profile[name.strip()] = int(cumulative)
+    return profile
+
+
+@pytest.mark.parametrize("module", ["email_handler", "job_runner", "cron"])
+def test_workers_import_heavy_subsystems_lazily(module):
+    profile = import_time_profile(module)
+
+    assert module in profile
+    assert [m for m in LAZY_MODULES if m in profile] == []
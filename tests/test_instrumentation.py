@@ -0,0 +1,39 @@
+from app import config, instrumentation
+from app.db import Session
+from app.instrumentation import Exporter, instrument
+
+
+class _Exporter(Exporter):
+    def __init__(self):
+        self.exported = []
+
+    def export(self, stats):
+        self.exported.append(stats)
+
+
+def test_instrument_counts_queries(monkeypatch):
+    exporter = _Exporter()
+    monkeypatch.setattr(instrumentation, "_exporter", exporter)
+    monkeypatch.setattr(config, "N_PLUS_ONE_THRESHOLD", 2)
+
+    with instrument("outer") as outer:
+        Session.execute("SELECT 1")
+        with instrument("inner") as inner:
+            for i in range(3):
+                Session.execute("SELECT :i", {"i": i})
+        Session.execute("SELECT 2")
+
+    assert inner.query_count == 3
+    assert inner.statements.most_common(1)[0][1] == 3
+    # the queries of the inner unit are counted in the outer one too
+    assert outer.query_count == 5
+    assert outer.db_time >= inner.db_time
+    assert [stats.name for stats in exporter.exported] == ["inner", "outer"]
+    assert instrumentation.current_stats() is None
+
+
+def test_server_timing():
+    with instrument("web/test") as stats:
+        Session.execute("SELECT 1")
+    assert instrumentation.server_timing(stats).startswith("db;dur=")
+    assert 'desc="1 queries"' in instrumentation.server_timing(stats)
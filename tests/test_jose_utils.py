@@ -1,5 +1,9 @@
+import json
+
+from flask import url_for
+
 from app.db import Session
-from app.jose_utils import make_id_token, verify_id_token
+from app.jose_utils import decode_id_token, make_id_token, verify_id_token
 from app.models import ClientUser, Client
 from tests.utils import create_new_user
 
@@ -21,6 +25,25 @@ def test_encode_decode(flask_client):
     assert verify_id_token(jwt_token)
 
 
+def test_id_token_claims_and_jwks(flask_client):
+    user = create_new_user()
+    client1 = Client.create_new(name="Demo", user_id=user.id)
+    Session.commit()
+    client_user = ClientUser.create(client_id=client1.id, user_id=user.id)
+    Session.commit()
+
+    jwt_token = decode_id_token(make_id_token(client_user, nonce="nonce"))
+    claims = json.loads(jwt_token.claims)
+    assert claims["sub"] == str(client_user.id)
+    assert claims["nonce"] == "nonce"
+    assert claims["iat"] == claims["auth_time"]
+    assert claims["exp"] == claims["iat"] + 3600
+
+    r = flask_client.get(url_for("jwks"))
+    assert r.status_code == 200
+    assert r.json["keys"][0]["kid"] == jwt_token.token.jose_header["kid"]
+
+
 def test_db_tear_down(flask_client):
     """make sure the db is reset after each test"""
     assert len(ClientUser.filter_by().all()) == 0
@@ -0,0 +1,54 @@
+from app.db import Session
+from app.login_user_cache import get_login_user
+from app.models import User
+from tests.utils import create_new_user, enable_cache_versions
+
+
+def _fail(**kwargs):
+    raise AssertionError("the user should come from the cache")
+
+
+def test_login_user_cached_until_changed(flask_client, monkeypatch):
+    enable_cache_versions(monkeypatch)
+    user = create_new_user()
+    Session.commit()
+    user_id, alternative_id, email = user.id, user.alternative_id, user.email
+
+    assert get_login_user(alternative_id).id == user_id
+
+    Session.expunge_all()
+    with monkeypatch.context() as m:
+        m.setattr(User, "get_by", _fail)
+        cached = get_login_user(alternative_id)
+        assert cached.id == user_id
+        assert cached.email == email
+        assert cached in Session
+
+    # a committed change drops the cached user
+    cached.disabled = True
+    Session.commit()
+    Session.expunge_all()
+    assert get_login_user(alternative_id).disabled
+
+    user = User.get(user_id)
+    user.alternative_id = "regenerated"
+    Session.commit()
+    assert get_login_user(alternative_id) is None
+
+
+def test_login_user_unknown():
+    assert get_login_user("unknown-alternative-id") is None
+
+
+def test_login_user_not_cached_without_redis(flask_client, monkeypatch):
+    user = create_new_user()
+    Session.commit()
+    user_id, alternative_id = user.id, user.alternative_id
+    assert get_login_user(alternative_id).id == user_id
+
+    # as if disabled by another process, the stamps of this one aren't bumped
+    Session.execute(
+        User.__table__.update().where(User.id == user_id).values(disabled=True)
+    )
+    Session.expunge_all()
+    assert get_login_user(alternative_id).disabled
@@ -0,0 +1,89 @@
+import arrow
+
+from app.db import Session
+from app.metric_utils import compute_metric2
+from app.models import (
+    CoinbaseSubscription,
+    ManualSubscription,
+    Subscription,
+    PlanEnum,
+    User,
+)
+from tests.utils import create_new_user, random_token
+
+
+def _is_paid_in_sql(user: User) -> bool:
+    return (
+        Session.query(User.id)
+        .filter(User.id == user.id, User.paid_condition(arrow.now()))
+        .first()
+        is not None
+    )
+
+
+def test_paid_condition_matches_is_paid():
+    free_user = create_new_user()
+
+    paddle_user = create_new_user()
+    Subscription.create(
+        user_id=paddle_user.id,
+        cancel_url="",
+        update_url="",
+        subscription_id=random_token(10),
+        event_time=arrow.now(),
+        next_bill_date=arrow.now().shift(days=15).date(),
+        plan=PlanEnum.monthly,
+    )
+
+    expired_paddle_user = create_new_user()
+    Subscription.create(
+        user_id=expired_paddle_user.id,
+        cancel_url="",
+        update_url="",
+        subscription_id=random_token(10),
+        event_time=arrow.now(),
+        next_bill_date=arrow.now().shift(days=-30).date(),
+        plan=PlanEnum.monthly,
+    )
+
+    giveaway_user = create_new_user()
+    ManualSubscription.create(
+        user_id=giveaway_user.id, end_at=arrow.now().shift(days=15), is_giveaway=True
+    )
+
+    # the giveaway hides the coinbase subscription
+    giveaway_and_coinbase_user = create_new_user()
+    ManualSubscription.create(
+        user_id=giveaway_and_coinbase_user.id,
+        end_at=arrow.now().shift(days=15),
+        is_giveaway=True,
+    )
+    CoinbaseSubscription.create(
+        user_id=giveaway_and_coinbase_user.id, end_at=arrow.now().shift(days=15)
+    )
+
+    coinbase_user = create_new_user()
+    CoinbaseSubscription.create(
+        user_id=coinbase_user.id, end_at=arrow.now().shift(days=15)
+    )
+    Session.commit()
+
+    for user in (
+        free_user,
+        paddle_user,
+        expired_paddle_user,
+        giveaway_user,
+        giveaway_and_coinbase_user,
+        coinbase_user,
+    ):
+        assert _is_paid_in_sql(user) == user.is_paid()
+
+
+def test_compute_metric2():
+    create_new_user()
+    Session.commit()
+
+    metric = compute_metric2()
+    assert metric.nb_user == User.count()
+    assert metric.nb_user >= metric.nb_activated_user
+    assert metric.nb_alias > 0
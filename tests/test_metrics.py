@@ -0,0 +1,80 @@
+import socket
+import urllib.request
+
+from app.metrics import (
+    COUNTER,
+    GAUGE,
+    Registry,
+    record_custom_metric,
+    REGISTRY,
+    SIZE_BUCKETS,
+    start_metrics_server,
+)
+
+
+def test_registry_render():
+    registry = Registry()
+    registry.counter("sl_test_emails", "Emails", ["status"]).inc(status="250")
+    registry.gauge("sl_test_queue", "Queue depth").set(3)
+    histogram = registry.histogram(
+        "sl_test_seconds", "Latency", ["job"], buckets=(0.1, 1)
+    )
+    histogram.observe(0.05, job="export")
+    histogram.observe(0.5, job="export")
+    histogram.observe(5, job="export")
+
+    lines = registry.render().splitlines()
+    assert 'sl_test_emails_total{status="250"} 1' in lines
+    assert "sl_test_queue 3" in lines
+    assert 'sl_test_seconds_bucket{job="export",le="0.1"} 1' in lines
+    assert 'sl_test_seconds_bucket{job="export",le="1"} 2' in lines
+    assert 'sl_test_seconds_bucket{job="export",le="+Inf"} 3' in lines
+    assert 'sl_test_seconds_count{job="export"} 3' in lines
+    assert 'sl_test_seconds_sum{job="export"} 5.55' in lines
+    assert lines[-1] == "# EOF"
+
+
+def test_record_custom_metric_goes_to_registry():
+    record_custom_metric("Custom/test_metric", 0.2)
+    assert "sl_test_metric_count 1" in REGISTRY.render().splitlines()
+
+
+def test_record_custom_metric_kinds():
+    record_custom_metric("Custom/test_hits", 1, kind=COUNTER)
+    record_custom_metric("Custom/test_hits", 2, kind=COUNTER)
+    record_custom_metric("Custom/test_queue", 5, kind=GAUGE)
+    record_custom_metric("Custom/test_queue", 3, kind=GAUGE)
+    record_custom_metric("Custom/test_recipients", 3, buckets=SIZE_BUCKETS)
+
+    lines = REGISTRY.render().splitlines()
+    assert "sl_test_hits_total 3" in lines
+    assert "sl_test_queue 3" in lines
+    assert 'sl_test_recipients_bucket{le="5"} 1' in lines
+
+
+def test_metrics_endpoint():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = start_metrics_server(port)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.status == 200
+            assert response.read().decode().endswith("# EOF\n")
+    finally:
+        server.shutdown()
+
+
+def test_record_custom_metric_labels(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(
+        "newrelic.agent.record_custom_metric",
+        lambda name, value: recorded.append((name, value)),
+    )
+    record_custom_metric("Custom/test_lag", 1, kind=GAUGE, labels={"replica": 0})
+    record_custom_metric("Custom/test_lag", 2, kind=GAUGE, labels={"replica": 1})
+
+    assert recorded == [("Custom/test_lag/0", 1), ("Custom/test_lag/1", 2)]
+    lines = REGISTRY.render().splitlines()
+    assert 'sl_test_lag{replica="0"} 1' in lines
+    assert 'sl_test_lag{replica="1"} 2' in lines
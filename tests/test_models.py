@@ -426,3 +426,4 @@ def test_email_log_create_updates_alias_last_email_log_id(flask_client):
 
     Session.expire(alias)
     assert alias.last_email_log_id == el2.id
+    assert alias.last_activity_at == el2.created_at
@@ -0,0 +1,154 @@
+from datetime import date
+
+import arrow
+
+from app.db import Session
+from app.models import Alias, Bounce, Contact, EmailLog, MessageIDMatching
+from app.partition_utils import (
+    convert_to_partitioned,
+    delete_log_table_rows,
+    delete_orphan_message_id_matchings,
+    drop_partitions_before,
+    ensure_daily_partitions,
+    is_partitioned,
+    list_partitions,
+)
+from tests.utils import create_new_user, random_email, random_token
+
+
+def test_delete_log_table_rows_not_partitioned():
+    assert not is_partitioned("bounce")
+    old = Bounce.create(
+        email=random_token(), created_at=arrow.now().shift(days=-10), flush=True
+    )
+    recent = Bounce.create(email=random_token(), flush=True)
+    old_id, recent_id = old.id, recent.id
+    Session.commit()
+
+    delete_log_table_rows(Bounce, arrow.now().shift(days=-7))
+
+    assert Bounce.get(old_id) is None
+    assert Bounce.get(recent_id) is not None
+
+
+def test_daily_partitions():
+    table = f"test_log_{random_token(8).lower()}"
+    Session.execute(
+        f"CREATE TABLE {table} (id serial, created_at timestamp NOT NULL) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    try:
+        assert is_partitioned(table)
+        assert ensure_daily_partitions(table, days_ahead=2, today=date(2024, 1, 1)) == 3
+        # already created
+        assert ensure_daily_partitions(table, days_ahead=2, today=date(2024, 1, 1)) == 0
+
+        partitions = list_partitions(table)
+        assert [p.name for p in partitions] == [
+            f"{table}_p20240101",
+            f"{table}_p20240102",
+            f"{table}_p20240103",
+        ]
+
+        # the 2024-01-02 partition still contains rows after the cutoff
+        assert drop_partitions_before(table, arrow.get("2024-01-02T12:00:00")) == 1
+        assert [p.name for p in list_partitions(table)] == [
+            f"{table}_p20240102",
+            f"{table}_p20240103",
+        ]
+    finally:
+        Session.rollback()
+        Session.execute(f"DROP TABLE IF EXISTS {table}")
+        Session.commit()
+
+
+def test_create_daily_partition_moves_default_rows():
+    table = f"test_log_{random_token(8).lower()}"
+    Session.execute(
+        f"CREATE TABLE {table} (id serial, created_at timestamp NOT NULL) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    Session.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    try:
+        Session.execute(f"INSERT INTO {table} (created_at) VALUES ('2024-01-01 10:00')")
+        assert ensure_daily_partitions(table, days_ahead=1, today=date(2024, 1, 1)) == 2
+
+        assert Session.execute(f"SELECT count(*) FROM {table}_p20240101").scalar() == 1
+        assert Session.execute(f"SELECT count(*) FROM {table}_default").scalar() == 0
+    finally:
+        Session.rollback()
+        Session.execute(f"DROP TABLE IF EXISTS {table}")
+        Session.commit()
+
+
+def test_delete_orphan_message_id_matchings():
+    user = create_new_user()
+    alias = Alias.create_new_random(user)
+    contact = Contact.create(
+        user_id=user.id,
+        alias_id=alias.id,
+        website_email=random_email(),
+        reply_email=random_email(),
+        flush=True,
+    )
+    email_log = EmailLog.create(
+        user_id=user.id, alias_id=alias.id, contact_id=contact.id, flush=True
+    )
+    orphan = MessageIDMatching.create(
+        sl_message_id=random_token(),
+        original_message_id=random_token(),
+        email_log_id=0,
+        flush=True,
+    )
+    matching = MessageIDMatching.create(
+        sl_message_id=random_token(),
+        original_message_id=random_token(),
+        email_log_id=email_log.id,
+        flush=True,
+    )
+    orphan_id, matching_id = orphan.id, matching.id
+    Session.commit()
+
+    assert delete_orphan_message_id_matchings() == 1
+    assert MessageIDMatching.get(orphan_id) is None
+    assert MessageIDMatching.get(matching_id) is not None
+
+
+def test_convert_to_partitioned_keeps_foreign_keys():
+    table = f"test_log_{random_token(8).lower()}"
+    Session.execute(
+        f"""
+        CREATE TABLE {table} (
+            id serial PRIMARY KEY,
+            created_at timestamp NOT NULL,
+            user_id integer NOT NULL REFERENCES users (id) ON DELETE CASCADE
+        )
+        """
+    )
+    try:
+        user = create_new_user()
+        Session.execute(
+            f"INSERT INTO {table} (created_at, user_id) VALUES ('2024-01-01', :user_id)",
+            {"user_id": user.id},
+        )
+
+        convert_to_partitioned(table, date(2024, 1, 2))
+
+        assert is_partitioned(table)
+        for relation in [table, f"{table}_legacy", f"{table}_p20240102"]:
+            foreign_keys = Session.execute(
+                """
+                SELECT pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE contype = 'f' AND conrelid = to_regclass(:relation)
+                """,
+                {"relation": relation},
+            ).fetchall()
+            assert [definition for (definition,) in foreign_keys] == [
+                "FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE"
+            ]
+        assert Session.execute(f"SELECT count(*) FROM {table}").scalar() == 1
+    finally:
+        Session.rollback()
+        Session.execute(f"DROP TABLE IF EXISTS {table}")
+        Session.execute(f"DROP TABLE IF EXISTS {table}_legacy")
+        Session.commit()
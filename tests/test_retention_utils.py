@@ -0,0 +1,51 @@
+import arrow
+
+from app.models import Notification, RefusedEmail
+from app.retention_utils import delete_in_batches, update_in_batches
+from tests.utils import create_new_user, random_token
+
+
+def test_delete_in_batches():
+    user = create_new_user()
+    ids = [
+        Notification.create(user_id=user.id, message="", flush=True).id
+        for _ in range(5)
+    ]
+    keep_id = Notification.create(user_id=user.id, message="keep", flush=True).id
+
+    deleted = delete_in_batches(
+        Notification,
+        (Notification.user_id == user.id) & (Notification.message == ""),
+        batch_size=2,
+    )
+
+    assert deleted == 5
+    assert Notification.filter(Notification.id.in_(ids)).count() == 0
+    assert Notification.get(keep_id) is not None
+
+
+def test_update_in_batches():
+    user = create_new_user()
+    ids = [
+        RefusedEmail.create(
+            user_id=user.id, full_report_path=random_token(), flush=True
+        ).id
+        for _ in range(3)
+    ]
+    batches = []
+
+    updated = update_in_batches(
+        RefusedEmail,
+        RefusedEmail.id.in_(ids) & RefusedEmail.deleted.is_(False),
+        {RefusedEmail.deleted: True, RefusedEmail.delete_at: arrow.now()},
+        batch_size=2,
+        returning=(RefusedEmail.full_report_path,),
+        on_batch=batches.append,
+    )
+
+    assert updated == 3
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert sorted(row[0] for batch in batches for row in batch) == sorted(ids)
+    assert (
+        RefusedEmail.filter(RefusedEmail.id.in_(ids), RefusedEmail.deleted).count() == 3
+    )
@@ -0,0 +1,126 @@
+import pickle
+
+import flask
+
+from app.session import (
+    ANONYMOUS_SESSION_TTL,
+    RedisSessionStore,
+    deserialize_session,
+    serialize_session,
+)
+
+
+class _Redis:
+    """In memory stand-in for the few redis commands used by the session store"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append("get")
+        return self.values.get(key)
+
+    def ttl(self, key):
+        return self.ttls.get(key, -2)
+
+    def setex(self, name, value, time):
+        self.commands.append("setex")
+        self.values[name] = value
+        self.ttls[name] = time
+
+    def expire(self, key, ttl):
+        self.commands.append("expire")
+        self.ttls[key] = ttl
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def pipeline(self):
+        redis = self
+
+        class _Pipeline:
+            def __init__(self):
+                self._calls = []
+
+            def get(self, key):
+                self._calls.append(lambda: redis.get(key))
+
+            def ttl(self, key):
+                self._calls.append(lambda: redis.ttl(key))
+
+            def execute(self):
+                return [call() for call in self._calls]
+
+        return _Pipeline()
+
+
+def _open(store, app, cookie=None):
+    headers = {"Cookie": f"{app.session_cookie_name}={cookie}"} if cookie else {}
+    with app.test_request_context(headers=headers):
+        return store.open_session(app, flask.request)
+
+
+def _cookie(response, app):
+    for header in response.headers.getlist("Set-Cookie"):
+        if header.startswith(f"{app.session_cookie_name}="):
+            return header.split(";")[0].split("=", 1)[1]
+    return None
+
+
+def test_session_written_only_when_modified(flask_app):
+    redis = _Redis()
+    store = RedisSessionStore(redis, redis, flask_app)
+
+    # untouched new session: nothing stored, no cookie
+    session = _open(store, flask_app)
+    session.permanent = True
+    response = flask.Response()
+    store.save_session(flask_app, session, response)
+    assert redis.commands == []
+    assert _cookie(response, flask_app) is None
+
+    session["csrf_token"] = "token"
+    response = flask.Response()
+    store.save_session(flask_app, session, response)
+    assert redis.commands == ["setex"]
+    cookie = _cookie(response, flask_app)
+
+    # the session isn't loaded until it's accessed
+    session = _open(store, flask_app, cookie)
+    session.permanent = True
+    store.save_session(flask_app, session, flask.Response())
+    assert redis.commands == ["setex"]
+
+    # read only access: loaded but not written back
+    session = _open(store, flask_app, cookie)
+    assert session["csrf_token"] == "token"
+    store.save_session(flask_app, session, flask.Response())
+    assert redis.commands == ["setex", "get"]
+
+
+def test_session_ttl_refreshed_near_expiry(flask_app):
+    redis = _Redis()
+    store = RedisSessionStore(redis, redis, flask_app)
+
+    session = _open(store, flask_app)
+    session["csrf_token"] = "token"
+    response = flask.Response()
+    store.save_session(flask_app, session, response)
+    cookie = _cookie(response, flask_app)
+    key = store._get_key(session.session_id)
+
+    redis.ttls[key] = ANONYMOUS_SESSION_TTL // 3
+    session = _open(store, flask_app, cookie)
+    assert "csrf_token" in session
+    store.save_session(flask_app, session, flask.Response())
+    assert redis.commands[-1] == "expire"
+    assert redis.ttls[key] == ANONYMOUS_SESSION_TTL
+
+
+def test_session_serialization():
+    data = {"_user_id": "1", "_fresh": True, "next": ("a", "b")}
+    assert deserialize_session(serialize_session(data)) == data
+    # sessions stored before the switch to json
+    assert deserialize_session(pickle.dumps({"_user_id": "1"})) == {"_user_id": "1"}
@@ -104,3 +104,39 @@ def fix_rate_limit_after_request():
 
     g._rate_limiting_complete = False
     setattr(g, "%s_rate_limiting_complete" % limiter._key_prefix, False)
+
+
+class FakeVersionStorage:
+    """In memory stand-in for the redis storage of the cache_versions stamps"""
+
+    def __init__(self):
+        self.storage = self
+        self.values = {}
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def pipeline(self):
+        storage = self
+
+        class _Pipeline:
+            def __init__(self):
+                self._keys = []
+
+            def incr(self, key):
+                self._keys.append(key)
+
+            def expire(self, key, ttl):
+                pass
+
+            def execute(self):
+                for key in self._keys:
+                    storage.values[key] = storage.values.get(key, 0) + 1
+
+        return _Pipeline()
+
+
+def enable_cache_versions(monkeypatch):
+    from app import cache_versions
+
+    monkeypatch.setattr(cache_versions, "_redis", FakeVersionStorage())